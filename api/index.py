@@ -7,6 +7,7 @@ if ROOT_DIR not in sys.path:
 
 os.environ.setdefault("ENABLE_SCHEDULER", "false")
 os.environ.setdefault("ENABLE_FILE_LOGS", "false")
+os.environ.setdefault("IMPORT_BACKGROUND", "false")
 os.environ.setdefault("DATABASE_URL", "sqlite:////tmp/ghoststock.db")
 os.environ.setdefault("UPLOAD_FOLDER", "/tmp/uploads")
 os.environ.setdefault("QR_FOLDER", "/tmp/qrcodes")
@@ -42,6 +42,15 @@ def create_app() -> Flask:
     limiter.init_app(app)
     migrate.init_app(app, db)
 
+    from .counters import register_counter_listeners
+    from .search import register_search_listeners
+    from .autocomplete import register_autocomplete_listeners
+    from .codes import register_code_listeners
+    register_counter_listeners()
+    register_search_listeners()
+    register_autocomplete_listeners()
+    register_code_listeners()
+
                                                                    
     if app.config.get("ENABLE_TALISMAN", True):
                                                                                    
@@ -79,6 +88,9 @@ def create_app() -> Flask:
         return base
     app.jinja_env.filters["combine"] = _jinja_filter_combine
 
+    from .photos import photo_sources
+    app.jinja_env.globals["photo_sources"] = lambda photo_path, size=480: photo_sources(app, photo_path, size)
+
                                                                        
     @app.before_request
     def _exempt_ai_csrf():                          
@@ -113,6 +125,10 @@ def create_app() -> Flask:
             pass
         return resp
 
+    if app.config.get("SQL_INSTRUMENTATION"):
+        from .instrumentation import init_sql_instrumentation
+        init_sql_instrumentation(app)
+
                 
     from .routes.auth import auth_bp
     from .routes.items import items_bp
@@ -149,14 +165,22 @@ def create_app() -> Flask:
         try:
             from sqlalchemy import inspect
             inspector = inspect(db.engine)
-            has_user = inspector.has_table("user")
-            if os.getenv("ENABLE_DB_CREATE_ALL", "true").lower() == "true" and not has_user:
+            missing = [t for t in db.metadata.tables if not inspector.has_table(t)]
+            if os.getenv("ENABLE_DB_CREATE_ALL", "true").lower() == "true" and missing:
                 db.create_all()
         except Exception:
                                                       
             if os.getenv("ENABLE_DB_CREATE_ALL", "true").lower() == "true":
                 db.create_all()
 
+        if os.getenv("ENABLE_DB_UPGRADE", "true").lower() == "true":
+            try:
+                from .schema import upgrade_schema
+                upgrade_schema(app)
+            except Exception as _e:
+                db.session.rollback()
+                app.logger.warning(f"Atualização do esquema falhou: {_e}")
+
         try:
             if os.getenv("AUTO_CREATE_ADMIN", "false").lower() == "true":
                 admin_email = os.getenv("DEFAULT_ADMIN_EMAIL", "admin@ghoststock.local")
@@ -331,6 +355,78 @@ def create_app() -> Flask:
             return
         ok = user.check_password(password)
         click.echo(f"OK - confere: {ok}")
+    @app.cli.command("rebuild_counters")
+    def rebuild_counters_cmd():
+        """Recalcula a tabela de contadores do inventário a partir de `item`."""
+        from .counters import rebuild_counters
+        rows = rebuild_counters()
+        click.echo(f"OK - {rows} contadores gravados")
+
+    @app.cli.command("check_counters")
+    def check_counters_cmd():
+        """Compara os contadores com uma recontagem completa de `item`."""
+        from .counters import check_counters
+        diffs = check_counters()
+        for d in diffs:
+            click.echo(
+                f"{d['origin_stock'] or '-'}/{d['item_type'] or '-'}/{d['status'] or '-'}/{d['maintenance'] or '-'}: "
+                f"esperado {d['expected']}, contador {d['actual']}"
+            )
+        if diffs:
+            click.echo(f"{len(diffs)} divergência(s). Rode 'flask rebuild_counters' para corrigir.")
+            raise SystemExit(1)
+        click.echo("OK - contadores consistentes")
+
+    @app.cli.command("rebuild_item_history")
+    def rebuild_item_history_cmd():
+        """Recria pacientes e períodos de manutenção a partir dos movimentos."""
+        from .history import rebuild_history
+        periods, patients = rebuild_history()
+        click.echo(f"OK - {periods} períodos de manutenção e {patients} pacientes gravados")
+
+    @app.cli.command("archive_movements")
+    @click.option("--keep-months", type=int, default=None, help="Meses mantidos na tabela quente (padrão: MOVEMENT_HOT_MONTHS)")
+    def archive_movements_cmd(keep_months: int | None):
+        """Move os meses fechados de item_movement para arquivos NDJSON comprimidos."""
+        from .archive import archive_movements
+        moved = archive_movements(app, keep_months)
+        for month, rows in moved.items():
+            click.echo(f"{month}: {rows} movimentos arquivados")
+        click.echo(f"OK - {sum(moved.values())} movimentos em {len(moved)} mês(es)")
+
+    @app.cli.command("checkpoint_items")
+    def checkpoint_items_cmd():
+        """Grava um checkpoint do status/local de todos os itens (consultas as-of)."""
+        from .snapshots import take_checkpoint
+        checkpoint = take_checkpoint()
+        click.echo(f"OK - checkpoint de {checkpoint.items} itens em {checkpoint.taken_at:%Y-%m-%d %H:%M} ({len(checkpoint.payload)} bytes)")
+
+    @app.cli.command("build_thumbnails")
+    def build_thumbnails_cmd():
+        """Gera as miniaturas que faltam para as fotos já cadastradas."""
+        from .models import Item
+        from .photos import make_thumbnails, photo_sizes
+        upload_dir = app.config["UPLOAD_FOLDER"]
+        done = 0
+        for (photo_path,) in db.session.query(Item.photo_path).filter(Item.photo_path.isnot(None)).distinct():
+            source = os.path.join(upload_dir, os.path.basename(photo_path))
+            if not os.path.exists(source):
+                continue
+            try:
+                done += len(make_thumbnails(source, upload_dir, photo_sizes(app)))
+            except Exception as exc:
+                click.echo(f"{photo_path}: {exc}")
+        click.echo(f"OK - {done} miniaturas geradas")
+
+    @app.cli.command("rebuild_search_index")
+    def rebuild_search_index_cmd():
+        """Cria/reconstrói o índice de busca textual de itens."""
+        from .search import ensure_search_index, rebuild_search_index
+        if not ensure_search_index() or not rebuild_search_index():
+            click.echo("Banco sem suporte a índice de texto; a busca usa ILIKE.")
+            return
+        click.echo("OK - índice de busca reconstruído")
+
     @app.cli.command("seed_hospital")
     def seed_hospital():
         from .models import User, Item
@@ -342,6 +438,8 @@ def create_app() -> Flask:
                                                                    
         db.drop_all()
         db.create_all()
+        from .schema import upgrade_schema
+        upgrade_schema(app)
                          
         admin = User.query.filter_by(email="admin@ghoststock.local").first()
         if not admin:
@@ -481,6 +579,8 @@ def create_app() -> Flask:
         Default: 35.943 itens nas proporções solicitadas.
         """
         from .models import User, Item
+        from .counters import record_new_items
+        from .codes import code_prefix, format_code, reserve_codes
         from datetime import datetime, timedelta
         import random
         from . import db
@@ -488,6 +588,8 @@ def create_app() -> Flask:
             click.echo("Recriando banco (apenas DEV)...")
             db.drop_all()
             db.create_all()
+            from .schema import upgrade_schema
+            upgrade_schema(app)
         click.echo(f"Gerando {total} itens...")
         admin = User.query.filter_by(email="admin@ghoststock.local").first()
         if not admin:
@@ -542,21 +644,13 @@ def create_app() -> Flask:
         now = datetime.utcnow()
         created = 0
         batch: list[Item] = []
-        code_counters = { 'cama': 0, 'cadeira_higienica': 0, 'cadeira_rodas': 0, 'andador': 0, 'muletas': 0, 'colchao_pneumatico': 0 }
-        prefix_map = {
-            'cama': 'CAM',
-            'cadeira_higienica': 'CHG',
-            'cadeira_rodas': 'CRD',
-            'andador': 'AND',
-            'muletas': 'MUL',
-            'colchao_pneumatico': 'CPNEU',
-        }
+        first_code = {}
+        for item_type, qty in target.items():
+            first_code[item_type] = reserve_codes(db.session.connection(), code_prefix(item_type), qty)
+        db.session.commit()
         for item_type, qty in target.items():
-            for _ in range(qty):
-                code_counters[item_type] += 1
-                idx = code_counters[item_type]
-                prefix = prefix_map[item_type]
-                code = f"{prefix}{idx:05d}"
+            for offset in range(qty):
+                code = format_code(code_prefix(item_type), first_code[item_type] + offset)
                 stock = random.choice(STOCKS)
                 z = CITY_ZONES[stock]
                 zone = 'central' if random.random() < z['central']['weight'] else 'resid'
@@ -593,11 +687,13 @@ def create_app() -> Flask:
                 created += 1
                 if len(batch) >= 2000:
                     db.session.bulk_save_objects(batch)
+                    record_new_items(batch)
                     db.session.commit()
                     batch.clear()
                     click.echo(f"Criados {created}/{total}...")
         if batch:
             db.session.bulk_save_objects(batch)
+            record_new_items(batch)
             db.session.commit()
         click.echo(f"OK - {created} itens criados")
 
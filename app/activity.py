@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta
+from typing import Mapping
+
+from sqlalchemy import select
+
+from .models import ActivityLog, User
+from .pagination import decode_cursor, encode_cursor, keyset_after
+
+
+ACTIVITY_ACTIONS = ("login_success", "login_failed", "login_blocked", "logout")
+ACTIVITY_FILTER_ARGS = ("user", "action", "ip", "from", "to")
+ACTIVITY_PAGE_SIZE = 50
+ACTIVITY_PAGE_MAX = 500
+
+
+def tail_lines(path: str, n: int = 500, block_size: int = 64 * 1024) -> list[str]:
+    """Últimas `n` linhas de `path`, lendo blocos de trás para frente a partir
+    do fim do arquivo; o custo depende de `n`, não do tamanho do log."""
+    if n <= 0 or not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b"\n") <= n:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    return [line.decode("utf-8", errors="replace") for line in data.splitlines()[-n:]]
+
+
+def _parse_day(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def activity_filters(args: Mapping) -> list:
+    """Filtros da tela de auditoria: `user` (id ou início do e-mail), `action`,
+    `ip` (endereço completo ou prefixo, ex. "10.0.") e o intervalo de dias
+    `from`/`to` (inclusivo). Cada um casa com um índice de activity_log."""
+    filters = [ActivityLog.created_at.isnot(None)]
+    user = (args.get("user") or "").strip()
+    if user.isdigit():
+        filters.append(ActivityLog.user_id == int(user))
+    elif user:
+        filters.append(ActivityLog.user_id.in_(
+            select(User.id).where(User.email.ilike(f"{user.replace('%', '').replace('_', '')}%"))
+        ))
+    action = (args.get("action") or "").strip()
+    if action:
+        filters.append(ActivityLog.action == action)
+    ip = (args.get("ip") or "").strip()
+    if ip.endswith((".", ":")):
+        filters += [ActivityLog.ip >= ip, ActivityLog.ip < ip[:-1] + chr(ord(ip[-1]) + 1)]
+    elif ip:
+        filters.append(ActivityLog.ip == ip)
+    start = _parse_day(args.get("from"))
+    if start:
+        filters.append(ActivityLog.created_at >= start)
+    end = _parse_day(args.get("to"))
+    if end:
+        filters.append(ActivityLog.created_at < end + timedelta(days=1))
+    return filters
+
+
+def activity_page(filters, cursor: str | None = None, limit: int = ACTIVITY_PAGE_SIZE):
+    """Uma página de eventos, do mais recente para o mais antigo, por keyset em
+    (created_at, id). Retorna (linhas, próximo cursor); cada linha traz o
+    ActivityLog e o usuário (ou None)."""
+    limit = max(1, min(limit, ACTIVITY_PAGE_MAX))
+    query = ActivityLog.query.filter(*filters)
+    values = decode_cursor(cursor, 2)
+    if values:
+        query = query.filter(keyset_after((ActivityLog.created_at, ActivityLog.id), values, descending=True))
+    logs = query.order_by(ActivityLog.created_at.desc(), ActivityLog.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(logs[limit - 1].created_at, logs[limit - 1].id) if len(logs) > limit else None
+    logs = logs[:limit]
+    user_ids = {log.user_id for log in logs if log.user_id is not None}
+    users = {u.id: u for u in User.query.filter(User.id.in_(user_ids))} if user_ids else {}
+    return [(log, users.get(log.user_id)) for log in logs], next_cursor
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import tempfile
+import threading
+from bisect import bisect_right
+from datetime import datetime
+from typing import Iterator
+
+from sqlalchemy import delete, func, select
+
+from . import db
+from .models import ItemMovement, MovementArchive
+
+
+BLOCK_ROWS = 1000
+ARCHIVE_COLUMNS = ("id", "item_id", "user_id", "action", "from_value", "to_value", "timestamp")
+
+
+def month_key(value: datetime) -> str:
+    return value.strftime("%Y-%m")
+
+
+def month_bounds(month: str) -> tuple[datetime, datetime]:
+    start = datetime.strptime(month, "%Y-%m")
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, end
+
+
+def _shift_month(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + value.month - 1 - months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def archive_folder(app) -> str:
+    folder = app.config["MOVEMENT_ARCHIVE_FOLDER"]
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def closed_months(keep_months: int, now: datetime | None = None) -> list[str]:
+    """Meses com movimentos na tabela quente anteriores aos `keep_months`
+    mais recentes (o mês corrente conta como um)."""
+    cutoff = _shift_month(now or datetime.utcnow(), max(keep_months - 1, 0))
+    oldest = db.session.query(func.min(ItemMovement.timestamp)).filter(ItemMovement.timestamp < cutoff).scalar()
+    if oldest is None:
+        return []
+    months, cursor = [], datetime(oldest.year, oldest.month, 1)
+    while cursor < cutoff:
+        months.append(month_key(cursor))
+        cursor = month_bounds(month_key(cursor))[1]
+    return months
+
+
+def _encode(row) -> bytes:
+    values = dict(zip(ARCHIVE_COLUMNS, row))
+    values["timestamp"] = values["timestamp"].isoformat()
+    return (json.dumps(values, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def archive_month(app, month: str) -> int:
+    """Move os movimentos de `month` para `<mês>.ndjson.gz` na pasta de arquivo.
+
+    As linhas vão ordenadas por (item, data) em blocos gzip independentes de
+    BLOCK_ROWS linhas; o `<mês>.index.json` guarda o deslocamento e a faixa de
+    itens de cada bloco, então ler o histórico de um item descomprime só os
+    blocos dele. O registro em movement_archive e o DELETE da tabela quente
+    são gravados na mesma transação; se ela falhar, o arquivo é refeito na
+    próxima execução."""
+    if db.session.get(MovementArchive, month) is not None:
+        return 0
+    start, end = month_bounds(month)
+    folder = archive_folder(app)
+    filename = f"{month}.ndjson.gz"
+    query = (
+        select(*[getattr(ItemMovement, c) for c in ARCHIVE_COLUMNS])
+        .where(ItemMovement.timestamp >= start, ItemMovement.timestamp < end)
+        .order_by(ItemMovement.item_id, ItemMovement.timestamp, ItemMovement.id)
+        .execution_options(yield_per=BLOCK_ROWS)
+    )
+    blocks: list[list[int]] = []
+    total = 0
+    fd, tmp = tempfile.mkstemp(prefix=f".{month}.", suffix=".tmp", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            pending: list[bytes] = []
+            first = last = None
+
+            def _write_block():
+                data = gzip.compress(b"".join(pending), compresslevel=6)
+                blocks.append([out.tell(), len(data), first, last, len(pending)])
+                out.write(data)
+
+            for row in db.session.execute(query):
+                if not pending:
+                    first = row.item_id
+                pending.append(_encode(row))
+                last = row.item_id
+                total += 1
+                if len(pending) >= BLOCK_ROWS:
+                    _write_block()
+                    pending = []
+            if pending:
+                _write_block()
+            out.flush()
+            os.fsync(out.fileno())
+        if not total:
+            os.remove(tmp)
+            return 0
+        index = {"month": month, "rows": total, "blocks": blocks}
+        with open(os.path.join(folder, f"{month}.index.json"), "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(folder, filename))
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    db.session.add(MovementArchive(month=month, filename=filename, rows=total))
+    db.session.execute(
+        delete(ItemMovement.__table__).where(ItemMovement.timestamp >= start, ItemMovement.timestamp < end)
+    )
+    db.session.commit()
+    return total
+
+
+def archive_movements(app, keep_months: int | None = None, now: datetime | None = None) -> dict[str, int]:
+    """Arquiva todos os meses fechados; retorna {mês: linhas movidas}."""
+    keep = app.config.get("MOVEMENT_HOT_MONTHS", 3) if keep_months is None else keep_months
+    moved = {}
+    for month in closed_months(keep, now):
+        rows = archive_month(app, month)
+        if rows:
+            moved[month] = rows
+    return moved
+
+
+def archived_months() -> list[str]:
+    """Meses já arquivados, do mais recente ao mais antigo."""
+    return [m for (m,) in db.session.query(MovementArchive.month).order_by(MovementArchive.month.desc())]
+
+
+_index_cache: dict[str, tuple[float, dict]] = {}
+_index_lock = threading.Lock()
+
+
+def _load_index(folder: str, month: str) -> dict | None:
+    path = os.path.join(folder, f"{month}.index.json")
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _index_lock:
+        hit = _index_cache.get(path)
+        if hit and hit[0] == mtime:
+            return hit[1]
+    with open(path, encoding="utf-8") as f:
+        index = json.load(f)
+    index["_last_items"] = [b[3] for b in index["blocks"]]
+    with _index_lock:
+        _index_cache[path] = (mtime, index)
+    return index
+
+
+def _decode_block(f, offset: int, length: int) -> Iterator[dict]:
+    f.seek(offset)
+    for line in gzip.decompress(f.read(length)).splitlines():
+        row = json.loads(line)
+        row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+        yield row
+
+
+def iter_month(app, month: str, item_id: int | None = None) -> Iterator[dict]:
+    """Movimentos arquivados de `month` em ordem (item, data, id), opcionalmente
+    só os de `item_id`."""
+    folder = app.config["MOVEMENT_ARCHIVE_FOLDER"]
+    index = _load_index(folder, month)
+    if index is None:
+        app.logger.warning(f"Arquivo de movimentos de {month} não encontrado em {folder}")
+        return
+    blocks = index["blocks"]
+    start = 0 if item_id is None else bisect_right(index["_last_items"], item_id - 1)
+    with open(os.path.join(folder, f"{month}.ndjson.gz"), "rb") as f:
+        for offset, length, first, last, _rows in blocks[start:]:
+            if item_id is not None and first > item_id:
+                break
+            for row in _decode_block(f, offset, length):
+                if item_id is None or row["item_id"] == item_id:
+                    yield row
+
+
+def iter_archived(app, months: list[str] | None = None, item_id: int | None = None) -> Iterator[dict]:
+    """Movimentos arquivados em ordem cronológica de mês (dentro do mês, por item)."""
+    for month in sorted(archived_months() if months is None else months):
+        yield from iter_month(app, month, item_id)
+
+
+def archived_movement(row: dict) -> ItemMovement:
+    """ItemMovement transitório (fora da sessão) para uma linha do arquivo."""
+    return ItemMovement(**row)
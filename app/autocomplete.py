@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from sqlalchemy import event
+from sqlalchemy.orm import attributes
+
+from . import db
+from .models import Item
+
+
+KEY_CHARS = 32
+# Alterações acumuladas fora do texto concatenado antes de forçar uma recarga.
+MAX_EXTRA = 5000
+_BOUNDARY = re.compile(r"(?<=[\s\-_/.])\w|(?<=[^\W\d])\d|(?<=\d)[^\W\d_]")
+
+
+def _boundaries(text: str) -> list[int]:
+    """Posições de início de palavra e de troca letra/dígito ("CAM01467" -> 3)."""
+    return [m.start() for m in _BOUNDARY.finditer(text)]
+
+
+class NameIndex:
+    """Índice ordenado de nomes e códigos de itens para o autocomplete.
+
+    Guarda duas listas ordenadas de chaves (minúsculas, até KEY_CHARS
+    caracteres): o início do nome/código e os inícios de palavra internos.
+    Prefixos são resolvidos com bisect; trechos no meio de palavras caem numa
+    busca em um texto concatenado de todos os nomes, montado na carga. Nomes
+    alterados depois dela vão para uma lista ordenada à parte (`_extra`) e a
+    versão antiga no texto é ignorada (`_stale`) até a próxima carga."""
+
+    def __init__(self, max_items: int = 250_000):
+        self.max_items = max_items
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.too_big = False
+        self.max_id = 0
+        self.loaded_at = 0.0
+        self.refreshed_at = 0.0
+        self._names: dict[int, tuple[str, str | None]] = {}
+        self._heads: list[tuple[str, int]] = []
+        self._inner: list[tuple[str, int]] = []
+        self._blob = ""
+        self._blob_ids: list[int] = []
+        self._blob_offsets: list[int] = []
+        self._extra: list[tuple[str, int]] = []
+        self._stale: set[int] = set()
+
+    @property
+    def needs_reload(self) -> bool:
+        """Muitas alterações fora do texto concatenado: vale recarregar."""
+        return len(self._extra) > MAX_EXTRA
+
+    def _entries(self, item_id: int, name: str, code: str | None):
+        heads = [(name.lower()[:KEY_CHARS], item_id)]
+        if code:
+            heads.append((code.lower()[:KEY_CHARS], item_id))
+        lowered = name.lower()
+        inner = [(lowered[pos:pos + KEY_CHARS], item_id) for pos in _boundaries(name)]
+        return heads, inner
+
+    def load(self, rows) -> None:
+        names: dict[int, tuple[str, str | None]] = {}
+        heads: list[tuple[str, int]] = []
+        inner: list[tuple[str, int]] = []
+        max_id = 0
+        for item_id, name, code in rows:
+            if len(names) >= self.max_items:
+                with self._lock:
+                    self.too_big = True
+                    self.loaded = True
+                    self._names, self._heads, self._inner = {}, [], []
+                    self.loaded_at = self.refreshed_at = time.monotonic()
+                return
+            name = name or ""
+            names[item_id] = (name, code)
+            h, i = self._entries(item_id, name, code)
+            heads += h
+            inner += i
+            max_id = max(max_id, item_id)
+        heads.sort()
+        inner.sort()
+        ordered = sorted((name.lower(), item_id) for item_id, (name, _code) in names.items())
+        offsets, pos = [], 0
+        for lowered, _item_id in ordered:
+            offsets.append(pos)
+            pos += len(lowered) + 1
+        blob = "\n".join(lowered for lowered, _item_id in ordered)
+        with self._lock:
+            self._names, self._heads, self._inner = names, heads, inner
+            self._blob, self._blob_ids, self._blob_offsets = blob, [i for _k, i in ordered], offsets
+            self._extra, self._stale = [], set()
+            self.max_id = max_id
+            self.too_big = False
+            self.loaded = True
+            self.loaded_at = self.refreshed_at = time.monotonic()
+
+    def _remove(self, item_id: int) -> None:
+        old = self._names.pop(item_id, None)
+        if old is None:
+            return
+        heads, inner = self._entries(item_id, *old)
+        extra = [(old[0].lower(), item_id)]
+        for entries, target in ((heads, self._heads), (inner, self._inner), (extra, self._extra)):
+            for entry in entries:
+                i = bisect_left(target, entry)
+                if i < len(target) and target[i] == entry:
+                    del target[i]
+        self._stale.add(item_id)
+
+    def upsert(self, item_id: int, name: str | None, code: str | None) -> None:
+        with self._lock:
+            if not self.loaded or self.too_big:
+                return
+            name = name or ""
+            if self._names.get(item_id) == (name, code):
+                return
+            self._remove(item_id)
+            if len(self._names) >= self.max_items:
+                self.too_big = True
+                return
+            self._names[item_id] = (name, code)
+            heads, inner = self._entries(item_id, name, code)
+            for entry in heads:
+                insort(self._heads, entry)
+            for entry in inner:
+                insort(self._inner, entry)
+            insort(self._extra, (name.lower(), item_id))
+            self.max_id = max(self.max_id, item_id)
+
+    def remove(self, item_id: int) -> None:
+        with self._lock:
+            if self.loaded and not self.too_big:
+                self._remove(item_id)
+
+    def _scan(self, entries: list[tuple[str, int]], q: str, limit: int, found: dict[int, None]) -> None:
+        probe = q[:KEY_CHARS]
+        i = bisect_left(entries, (probe, -1))
+        while i < len(entries) and len(found) < limit:
+            key, item_id = entries[i]
+            if not key.startswith(probe):
+                break
+            if item_id not in found and (len(q) <= KEY_CHARS or q in self._names[item_id][0].lower()
+                                         or q in (self._names[item_id][1] or "").lower()):
+                found[item_id] = None
+            i += 1
+
+    def _infix(self, q: str, limit: int, found: dict[int, None]) -> None:
+        wanted = limit - len(found)
+        matches: list[tuple[str, int]] = []
+        start = 0
+        while len(matches) < wanted:
+            pos = self._blob.find(q, start)
+            if pos < 0:
+                break
+            idx = bisect_left(self._blob_offsets, pos + 1) - 1
+            item_id = self._blob_ids[idx]
+            if item_id not in found and item_id not in self._stale:
+                matches.append((self._names[item_id][0].lower(), item_id))
+            start = self._blob_offsets[idx + 1] if idx + 1 < len(self._blob_offsets) else len(self._blob)
+        extra = [entry for entry in self._extra if q in entry[0] and entry[1] not in found][:wanted]
+        for _key, item_id in sorted(matches + extra)[:wanted]:
+            found[item_id] = None
+
+    def lookup(self, q: str, limit: int = 10) -> list[dict]:
+        """Até `limit` itens: primeiro os que começam com `q` (nome ou código,
+        em ordem alfabética), depois início de palavra e por fim trecho no meio."""
+        q = q.strip().lower()
+        if not q or "\n" in q:
+            return []
+        found: dict[int, None] = {}
+        with self._lock:
+            self._scan(self._heads, q, limit, found)
+            if len(found) < limit:
+                self._scan(self._inner, q, limit, found)
+            if len(found) < limit:
+                self._infix(q, limit, found)
+            return [{"id": item_id, "name": self._names[item_id][0]} for item_id in found]
+
+
+_index: NameIndex | None = None
+_index_lock = threading.Lock()
+# Carga em andamento e as alterações confirmadas durante ela, reaplicadas no
+# índice novo antes da troca.
+_loading: threading.Event | None = None
+_pending: dict[int, tuple[str, str | None] | None] = {}
+
+
+def _apply(index: NameIndex, changes: dict[int, tuple[str, str | None] | None]) -> None:
+    for item_id, value in changes.items():
+        if value is None:
+            index.remove(item_id)
+        else:
+            index.upsert(item_id, *value)
+
+
+def _reload(app, loading: threading.Event) -> NameIndex | None:
+    """Monta um índice novo fora de `_index_lock` e troca a referência; quem
+    consulta nesse meio tempo continua usando o anterior."""
+    global _index, _loading
+    from .exports import iter_item_rows
+
+    fresh = None
+    try:
+        fresh = NameIndex(max_items=app.config.get("AUTOCOMPLETE_MAX_ITEMS", 250_000))
+        fresh.load((r.id, r.name, r.code) for r in iter_item_rows((Item.id, Item.name, Item.code)))
+    finally:
+        with _index_lock:
+            if fresh is not None and fresh.loaded:
+                _apply(fresh, _pending)
+                _index = fresh
+            _pending.clear()
+            _loading = None
+        loading.set()
+    return fresh
+
+
+def get_name_index(app) -> NameIndex:
+    """Índice do processo, carregado sob demanda e atualizado a cada
+    AUTOCOMPLETE_REFRESH_SECONDS com os itens novos (id > max_id). A cada
+    AUTOCOMPLETE_RELOAD_SECONDS é recarregado por inteiro, o que pega
+    renomeações feitas por outros processos. Só uma requisição faz a carga;
+    as outras esperam apenas se ainda não há índice nenhum."""
+    global _loading
+    now = time.monotonic()
+    with _index_lock:
+        index, loading = _index, _loading
+        reload = loading is None and (
+            index is None or index.needs_reload
+            or now - index.loaded_at >= app.config.get("AUTOCOMPLETE_RELOAD_SECONDS", 600)
+        )
+        if reload:
+            loading = _loading = threading.Event()
+        refresh = (
+            not reload and index is not None and not index.too_big
+            and now - index.refreshed_at >= app.config.get("AUTOCOMPLETE_REFRESH_SECONDS", 5)
+        )
+        if refresh:
+            index.refreshed_at = now
+    if reload:
+        return _reload(app, loading) or index
+    if index is None:
+        loading.wait()
+        return get_name_index(app)
+    if refresh:
+        rows = (
+            db.session.query(Item.id, Item.name, Item.code)
+            .filter(Item.id > index.max_id)
+            .order_by(Item.id.asc())
+            .all()
+        )
+        for r in rows:
+            index.upsert(r.id, r.name, r.code)
+    return index
+
+
+def _after_flush(session, flush_context) -> None:
+    changes = session.info.setdefault("autocomplete_changes", {})
+    for obj in session.new:
+        if isinstance(obj, Item):
+            changes[obj.id] = (obj.name, obj.code)
+    for obj in session.dirty:
+        if not isinstance(obj, Item) or obj in session.deleted:
+            continue
+        if any(attributes.get_history(obj, field).has_changes() for field in ("name", "code")):
+            changes[obj.id] = (obj.name, obj.code)
+    for obj in session.deleted:
+        if isinstance(obj, Item):
+            changes[obj.id] = None
+
+
+def record_name_changes(changes: dict[int, tuple[str, str | None] | None]) -> None:
+    """Registra renomeações feitas fora do unit of work (ex.: UPDATE em lote);
+    são aplicadas ao índice no próximo commit da sessão."""
+    db.session.info.setdefault("autocomplete_changes", {}).update(changes)
+
+
+def _after_commit(session) -> None:
+    changes = session.info.pop("autocomplete_changes", None)
+    if not changes:
+        return
+    with _index_lock:
+        index = _index
+        if _loading is not None:
+            _pending.update(changes)
+    if index is not None:
+        _apply(index, changes)
+
+
+def _after_rollback(session, previous_transaction) -> None:
+    session.info.pop("autocomplete_changes", None)
+
+
+def register_autocomplete_listeners() -> None:
+    if not event.contains(db.session, "after_flush", _after_flush):
+        event.listen(db.session, "after_flush", _after_flush)
+        event.listen(db.session, "after_commit", _after_commit)
+        event.listen(db.session, "after_soft_rollback", _after_rollback)
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import re
+import threading
+
+from sqlalchemy import event, insert as sa_insert, select, update
+
+from . import db
+from .models import CodeSequence, Item
+
+
+ITEM_CODE_PREFIXES = {
+    "cama": "CAM",
+    "cadeira_higienica": "CHG",
+    "cadeira_rodas": "CRD",
+    "andador": "AND",
+    "muletas": "MUL",
+    "colchao_pneumatico": "CPNEU",
+}
+
+
+def code_prefix(item_type: str | None) -> str:
+    return ITEM_CODE_PREFIXES.get(item_type or "", "")
+
+
+def format_code(prefix: str, n: int) -> str:
+    """CAM00001 para tipos conhecidos; 000001 para itens sem prefixo."""
+    return f"{prefix}{n:05d}" if prefix else f"{n:06d}"
+
+
+def parse_code(code: str | None) -> tuple[str, int] | None:
+    """Inverso de format_code: ("CAM", 12) para "CAM00012"; None se fora do padrão."""
+    if not code:
+        return None
+    m = re.fullmatch(r"([A-Z]*)(\d+)", code)
+    if not m or (m.group(1) and m.group(1) not in ITEM_CODE_PREFIXES.values()):
+        return None
+    return m.group(1), int(m.group(2))
+
+
+def _existing_max(conn, prefix: str) -> int:
+    pattern = re.compile(rf"^{re.escape(prefix)}(\d+)$")
+    query = select(Item.code).where(Item.code.isnot(None))
+    if prefix:
+        query = query.where(Item.code.like(f"{prefix}%"))
+    best = 0
+    for (code,) in conn.execute(query):
+        m = pattern.match(code)
+        if m:
+            best = max(best, int(m.group(1)))
+    return best
+
+
+def _ensure_row(conn, prefix: str) -> None:
+    table = CodeSequence.__table__
+    if conn.execute(select(table.c.prefix).where(table.c.prefix == prefix)).first() is not None:
+        return
+    row = {"prefix": prefix, "next_value": _existing_max(conn, prefix) + 1}
+    dialect = conn.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        conn.execute(insert(table).on_conflict_do_nothing(index_elements=["prefix"]), [row])
+    else:
+        conn.execute(sa_insert(table), [row])
+
+
+def reserve_codes(conn, prefix: str, n: int) -> int:
+    """Reserva `n` números consecutivos para `prefix` e devolve o primeiro.
+
+    O UPDATE trava a linha da sequência até o fim da transação de `conn`, então
+    processos diferentes nunca recebem o mesmo intervalo. Números reservados e
+    não usados viram lacunas, nunca repetições."""
+    _ensure_row(conn, prefix)
+    table = CodeSequence.__table__
+    conn.execute(
+        update(table).where(table.c.prefix == prefix).values(next_value=table.c.next_value + n)
+    )
+    end = conn.execute(select(table.c.next_value).where(table.c.prefix == prefix)).scalar_one()
+    return end - n
+
+
+def advance_past(conn, prefix: str, number: int) -> None:
+    """Garante que a sequência de `prefix` não entregue mais `number` (códigos
+    gravados explicitamente, ex.: importação)."""
+    _ensure_row(conn, prefix)
+    table = CodeSequence.__table__
+    conn.execute(
+        update(table)
+        .where(table.c.prefix == prefix, table.c.next_value <= number)
+        .values(next_value=number + 1)
+    )
+
+
+class CodeAllocator:
+    """Entrega códigos de item a partir de blocos reservados por processo.
+
+    Cada bloco custa uma transação curta na tabela de sequências; os códigos
+    seguintes saem da memória, sem consultar a tabela de itens."""
+
+    def __init__(self, block_size: int = 50):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._blocks: dict[str, tuple[int, int]] = {}
+
+    def next_code(self, item_type: str | None) -> str:
+        prefix = code_prefix(item_type)
+        with self._lock:
+            start, end = self._blocks.get(prefix, (0, 0))
+            if start >= end:
+                with db.engine.begin() as conn:
+                    start = reserve_codes(conn, prefix, self.block_size)
+                end = start + self.block_size
+            self._blocks[prefix] = (start + 1, end)
+        return format_code(prefix, start)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._blocks.clear()
+
+
+_allocator: CodeAllocator | None = None
+_allocator_lock = threading.Lock()
+
+
+def get_code_allocator(app) -> CodeAllocator:
+    global _allocator
+    with _allocator_lock:
+        if _allocator is None:
+            _allocator = CodeAllocator(block_size=app.config.get("CODE_BLOCK_SIZE", 50))
+        return _allocator
+
+
+def _after_sequence_drop(target, connection, **kw) -> None:
+    if _allocator is not None:
+        _allocator.reset()
+
+
+def register_code_listeners() -> None:
+    """Descarta os blocos em memória quando a tabela de sequências é recriada
+    (ex.: seed_mass --reset)."""
+    table = CodeSequence.__table__
+    if not event.contains(table, "after_drop", _after_sequence_drop):
+        event.listen(table, "after_drop", _after_sequence_drop)
@@ -31,6 +31,12 @@ class Config:
     QR_FOLDER = os.getenv("QR_FOLDER", os.path.join(os.getcwd(), "app", "static", "qrcodes"))
     MAX_CONTENT_LENGTH = 10 * 1024 * 1024        
     ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
+    PHOTO_SIZES = os.getenv("PHOTO_SIZES", "160,480,1024")
+    PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", "2"))
+    OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+    OCR_TIMEOUT_SECONDS = int(os.getenv("OCR_TIMEOUT_SECONDS", "15"))
+    OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "1600"))
+    OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "512"))
 
                    
     MAX_LOGIN_ATTEMPTS = 5
@@ -44,6 +50,35 @@ class Config:
                
     SCHEDULER_INTERVAL_MINUTES = int(os.getenv("SCHEDULER_INTERVAL_MINUTES", "60"))
 
+    INVENTORY_COUNTERS = os.getenv("INVENTORY_COUNTERS", "true").lower() == "true"
+
+    ITEMS_COUNT_CACHE_SECONDS = int(os.getenv("ITEMS_COUNT_CACHE_SECONDS", "60"))
+
+    CODE_BLOCK_SIZE = int(os.getenv("CODE_BLOCK_SIZE", "50"))
+
+    MOVEMENT_ARCHIVE_FOLDER = os.getenv("MOVEMENT_ARCHIVE_FOLDER", os.path.join(os.getcwd(), "archive", "movements"))
+    MOVEMENT_HOT_MONTHS = int(os.getenv("MOVEMENT_HOT_MONTHS", "3"))
+
+    CHECKPOINT_INTERVAL_HOURS = int(os.getenv("CHECKPOINT_INTERVAL_HOURS", "24"))
+
+    EVENT_SINK_ENABLED = os.getenv("EVENT_SINK_ENABLED", "true").lower() == "true"
+    EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "10000"))
+    EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "500"))
+    EVENT_FLUSH_SECONDS = float(os.getenv("EVENT_FLUSH_SECONDS", "1"))
+
+    IMPORT_FOLDER = os.getenv("IMPORT_FOLDER")
+    IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+    # Sem processo que sobreviva à resposta (ex.: serverless), importa no próprio request.
+    IMPORT_BACKGROUND = os.getenv("IMPORT_BACKGROUND", "true").lower() == "true"
+
+    AUTOCOMPLETE_MAX_ITEMS = int(os.getenv("AUTOCOMPLETE_MAX_ITEMS", "250000"))
+    AUTOCOMPLETE_REFRESH_SECONDS = int(os.getenv("AUTOCOMPLETE_REFRESH_SECONDS", "5"))
+    AUTOCOMPLETE_RELOAD_SECONDS = int(os.getenv("AUTOCOMPLETE_RELOAD_SECONDS", "600"))
+
+    SSE_INTERVAL_SECONDS = int(os.getenv("SSE_INTERVAL_SECONDS", "10"))
+    SSE_HEARTBEAT_SECONDS = int(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+    SSE_MAX_SUBSCRIBERS = int(os.getenv("SSE_MAX_SUBSCRIBERS", "100"))
+
                    
     RATELIMIT_STORAGE_URI = os.getenv("RATELIMIT_STORAGE_URI", "memory://")
     LOGIN_RATE_LIMIT = os.getenv("LOGIN_RATE_LIMIT", "10 per minute")
@@ -51,6 +86,10 @@ class Config:
                        
     SENTRY_DSN = os.getenv("SENTRY_DSN")
 
+    SQL_INSTRUMENTATION = os.getenv("SQL_INSTRUMENTATION", "false").lower() == "true"
+    SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", "500"))
+    SLOW_REQUEST_STATEMENTS = int(os.getenv("SLOW_REQUEST_STATEMENTS", "20"))
+
                        
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Iterable, NamedTuple
+from sqlalchemy import case, delete, event, func, insert as sa_insert, or_, update
+from sqlalchemy.orm import attributes
+
+from . import db
+from .models import Item, InventoryCounter
+from .schema import claim_marker, read_marker
+from .stats import EXPIRY_ALERT_DAYS, MAINTENANCE_DUE_DAYS, MAINTENANCE_SOON_DAYS, PREV_MONTH_DAYS
+
+
+COUNTERS_MARKER = "inventory_counters"
+
+# Chave "crua" de um item: estoque, tipo, status e os dias da última
+# manutenção, da validade e da entrada.
+CounterKey = tuple[str, str, str, str, str, str]
+# Chave gravada: os dias viram faixas em relação ao dia de corte guardado no
+# marcador COUNTERS_MARKER: manutenção ("", "ok", "soon", "due"), validade
+# vencendo em até EXPIRY_ALERT_DAYS e entrada depois do dia PREV_MONTH_DAYS atrás.
+BucketKey = tuple[str, str, str, str, bool, bool]
+KEY_FIELDS = ("origin_stock", "item_type", "status", "last_maintenance_date", "expiry_date", "entry_date")
+
+
+class CounterRow(NamedTuple):
+    origin_stock: str | None
+    item_type: str | None
+    status: str | None
+    maintenance: str
+    expiring: bool
+    recent: bool
+    total: int
+
+
+def _day(value) -> str:
+    if not value:
+        return ""
+    if isinstance(value, str):
+        return value[:10]
+    return value.strftime("%Y-%m-%d")
+
+
+def counter_key(origin_stock, item_type, status, last_maintenance_date, expiry_date, entry_date) -> CounterKey:
+    return (
+        origin_stock or "", item_type or "", status or "",
+        _day(last_maintenance_date), _day(expiry_date), _day(entry_date),
+    )
+
+
+def item_key(item: Item) -> CounterKey:
+    status = item.status
+    if status is None and attributes.instance_state(item).key is None:
+        status = "disponivel"
+    return counter_key(
+        item.origin_stock, item.item_type, status, item.last_maintenance_date, item.expiry_date, item.entry_date,
+    )
+
+
+def _previous_key(item: Item) -> CounterKey:
+    values = []
+    for field in KEY_FIELDS:
+        added, unchanged, deleted = attributes.get_history(item, field)
+        if deleted:
+            values.append(deleted[0])
+        elif unchanged:
+            values.append(unchanged[0])
+        else:
+            values.append(getattr(item, field))
+    return counter_key(*values)
+
+
+def add_delta(deltas: dict, key: tuple, n: int) -> None:
+    deltas[key] = deltas.get(key, 0) + n
+    if deltas[key] == 0:
+        del deltas[key]
+
+
+class Cutoffs:
+    """Limites das faixas para um dia de corte: manutenção "due" até
+    MAINTENANCE_DUE_DAYS dias antes e "soon" até MAINTENANCE_SOON_DAYS;
+    validade até EXPIRY_ALERT_DAYS depois; entrada recente depois de
+    PREV_MONTH_DAYS antes. Datas só com dia (meia-noite) caem na mesma
+    faixa que em compute_dashboard_stats."""
+
+    def __init__(self, day: str):
+        self.day = day
+        base = datetime.strptime(day, "%Y-%m-%d")
+        self.due_day = _day(base - timedelta(days=MAINTENANCE_DUE_DAYS))
+        self.soon_day = _day(base - timedelta(days=MAINTENANCE_SOON_DAYS))
+        self.expiry_day = _day(base + timedelta(days=EXPIRY_ALERT_DAYS))
+        self.recent_day = _day(base - timedelta(days=PREV_MONTH_DAYS))
+        # os mesmos limites como instantes, para o SQL
+        self.due_before = base - timedelta(days=MAINTENANCE_DUE_DAYS - 1)
+        self.soon_before = base - timedelta(days=MAINTENANCE_SOON_DAYS - 1)
+        self.expiry_before = base + timedelta(days=EXPIRY_ALERT_DAYS + 1)
+        self.recent_from = base - timedelta(days=PREV_MONTH_DAYS - 1)
+
+    def maintenance(self, day: str) -> str:
+        if not day:
+            return ""
+        if day <= self.due_day:
+            return "due"
+        if day <= self.soon_day:
+            return "soon"
+        return "ok"
+
+    def bucket(self, key: CounterKey) -> BucketKey:
+        stock, item_type, status, maintenance_day, expiry_day, entry_day = key
+        return (
+            stock, item_type, status, self.maintenance(maintenance_day),
+            bool(expiry_day) and expiry_day <= self.expiry_day,
+            not entry_day or entry_day > self.recent_day,
+        )
+
+
+def _upsert(conn, rows: dict[BucketKey, int]) -> None:
+    if not rows:
+        return
+    table = InventoryCounter.__table__
+    params = [
+        {
+            "origin_stock": k[0], "item_type": k[1], "status": k[2], "maintenance": k[3],
+            "expiring": k[4], "recent": k[5], "total": n,
+        }
+        for k, n in rows.items()
+    ]
+    dialect = conn.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[c.name for c in table.primary_key.columns],
+            set_={"total": table.c.total + stmt.excluded.total},
+        )
+        conn.execute(stmt, params)
+        return
+    for p in params:
+        res = conn.execute(
+            update(table)
+            .where(
+                table.c.origin_stock == p["origin_stock"],
+                table.c.item_type == p["item_type"],
+                table.c.status == p["status"],
+                table.c.maintenance == p["maintenance"],
+                table.c.expiring == p["expiring"],
+                table.c.recent == p["recent"],
+            )
+            .values(total=table.c.total + p["total"])
+        )
+        if not res.rowcount:
+            conn.execute(sa_insert(table), [p])
+
+
+def apply_deltas(conn, deltas: dict[CounterKey, int]) -> None:
+    """Aplica incrementos nos contadores (upsert), dentro da transação de `conn`.
+
+    Lê o dia de corte com trava compartilhada, então a virada diária
+    (rebuild_counters) espera esta transação. Enquanto os contadores não
+    foram inicializados não há o que ajustar: o rebuild vai contar estes
+    itens do zero."""
+    if not deltas:
+        return
+    day = read_marker(conn, COUNTERS_MARKER, lock=True)
+    if not day:
+        return
+    cutoffs = Cutoffs(day)
+    rows: dict[BucketKey, int] = {}
+    for key, n in deltas.items():
+        add_delta(rows, cutoffs.bucket(key), n)
+    _upsert(conn, rows)
+
+
+def record_new_items(items: Iterable[Item]) -> None:
+    """Contabiliza itens gravados fora do unit of work (ex.: bulk_save_objects)."""
+    deltas: dict[CounterKey, int] = {}
+    for it in items:
+        add_delta(deltas, item_key(it), 1)
+    apply_deltas(db.session.connection(), deltas)
+
+
+def _after_flush(session, flush_context) -> None:
+    deltas: dict[CounterKey, int] = {}
+    for obj in session.new:
+        if isinstance(obj, Item):
+            add_delta(deltas, item_key(obj), 1)
+    for obj in session.deleted:
+        if isinstance(obj, Item):
+            add_delta(deltas, _previous_key(obj), -1)
+    for obj in session.dirty:
+        if not isinstance(obj, Item) or obj in session.deleted:
+            continue
+        old, new = _previous_key(obj), item_key(obj)
+        if old != new:
+            add_delta(deltas, old, -1)
+            add_delta(deltas, new, 1)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def register_counter_listeners() -> None:
+    if not event.contains(db.session, "after_flush", _after_flush):
+        event.listen(db.session, "after_flush", _after_flush)
+
+
+def recount(cutoffs: Cutoffs) -> dict[BucketKey, int]:
+    """Contagem completa de `item` já agrupada nas faixas de `cutoffs`."""
+    lmd = Item.last_maintenance_date
+    maintenance = case(
+        (lmd.is_(None), ""),
+        (lmd < cutoffs.due_before, "due"),
+        (lmd < cutoffs.soon_before, "soon"),
+        else_="ok",
+    )
+    expiring = case((Item.expiry_date < cutoffs.expiry_before, 1), else_=0)
+    recent = case((or_(Item.entry_date.is_(None), Item.entry_date >= cutoffs.recent_from), 1), else_=0)
+    cols = (
+        func.coalesce(Item.origin_stock, ""),
+        func.coalesce(Item.item_type, ""),
+        func.coalesce(Item.status, ""),
+        maintenance, expiring, recent,
+    )
+    counts: dict[BucketKey, int] = {}
+    for s, t, st, m, exp, rec, n in db.session.query(*cols, func.count(Item.id)).group_by(*cols).all():
+        add_delta(counts, (s, t, st, m, bool(exp), bool(rec)), n)
+    return counts
+
+
+def rebuild_counters(now: datetime | None = None, force: bool = True) -> int | None:
+    """Recria a tabela de contadores a partir de uma contagem completa de
+    `item`, com o dia de `now` como corte das faixas de manutenção.
+
+    O marcador COUNTERS_MARKER é gravado na mesma transação e só depois dele
+    os deltas passam a ser aplicados. Sem `force`, não faz nada (retorna
+    None) se outro processo já recalculou para este dia."""
+    cutoffs = Cutoffs(_day(now or datetime.utcnow()))
+    conn = db.session.connection()
+    if not claim_marker(conn, COUNTERS_MARKER, cutoffs.day, force=force):
+        db.session.rollback()
+        return None
+    conn.execute(delete(InventoryCounter.__table__))
+    rows = recount(cutoffs)
+    _upsert(conn, rows)
+    db.session.commit()
+    return len(rows)
+
+
+def ensure_counters(now: datetime | None = None) -> None:
+    """Recalcula os contadores quando ainda não existem ou quando o dia de
+    corte ficou para trás (as faixas de manutenção andam com o calendário)."""
+    if read_marker(db.session.connection(), COUNTERS_MARKER) != _day(now or datetime.utcnow()):
+        rebuild_counters(now, force=False)
+
+
+def check_counters() -> list[dict]:
+    """Compara os contadores com uma recontagem completa e retorna as divergências."""
+    ensure_counters()
+    expected = recount(Cutoffs(read_marker(db.session.connection(), COUNTERS_MARKER)))
+    actual = {
+        (c.origin_stock, c.item_type, c.status, c.maintenance, c.expiring, c.recent): c.total
+        for c in InventoryCounter.query.all()
+        if c.total
+    }
+    diffs = []
+    for key in sorted(set(expected) | set(actual)):
+        if expected.get(key, 0) != actual.get(key, 0):
+            diffs.append({
+                "origin_stock": key[0], "item_type": key[1], "status": key[2], "maintenance": key[3],
+                "expiring": key[4], "recent": key[5], "expected": expected.get(key, 0), "actual": actual.get(key, 0),
+            })
+    return diffs
+
+
+def counter_rows() -> list[CounterRow]:
+    """Linhas não zeradas dos contadores, com as faixas do corte de hoje."""
+    ensure_counters()
+    rows = db.session.query(
+        InventoryCounter.origin_stock, InventoryCounter.item_type, InventoryCounter.status,
+        InventoryCounter.maintenance, InventoryCounter.expiring, InventoryCounter.recent, InventoryCounter.total,
+    ).filter(InventoryCounter.total != 0).all()
+    return [CounterRow(s or None, t or None, st or None, m, bool(exp), bool(rec), n) for s, t, st, m, exp, rec, n in rows]
+
+
+def totals_by_status(rows=None) -> dict[str, int]:
+    totals: dict[str, int] = {}
+    for r in (counter_rows() if rows is None else rows):
+        totals[r.status] = totals.get(r.status, 0) + r.total
+    return totals
+
+
+def maintenance_total(bucket: str, rows=None) -> int:
+    """Itens na faixa de manutenção `bucket` ("due" ou "soon")."""
+    return sum(r.total for r in (counter_rows() if rows is None else rows) if r.maintenance == bucket)
+
+
+def expiring_total(rows=None) -> int:
+    """Itens com validade vencendo em até EXPIRY_ALERT_DAYS (o `vencendo` do painel)."""
+    return sum(r.total for r in (counter_rows() if rows is None else rows) if r.expiring)
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+
+class DashboardBroadcaster:
+    """Calcula os totais do painel uma vez por ciclo e distribui para todas as
+    conexões SSE do processo, enviando apenas os campos que mudaram."""
+
+    def __init__(self, app, interval: float = 10, max_subscribers: int = 100, history: int = 64,
+                 queue_size: int = 32):
+        self.app = app
+        self.interval = interval
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.epoch = f"{os.getpid():x}{int(time.time()):x}"
+        self._lock = threading.Lock()
+        self._subscribers: set[queue.Queue] = set()
+        self._history: deque[tuple[int, dict]] = deque(maxlen=history)
+        self._state: dict = {}
+        self._seq = 0
+        self._thread: threading.Thread | None = None
+
+    def _compute(self) -> dict:
+        from .counters import totals_by_status
+        from .stats import EM_USO_STATUSES
+        with self.app.app_context():
+            by_status = totals_by_status()
+        return {
+            "total": sum(by_status.values()),
+            "disponiveis": by_status.get("disponivel", 0),
+            "em_uso": sum(by_status.get(s, 0) for s in EM_USO_STATUSES),
+        }
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    def publish_once(self) -> None:
+        try:
+            payload = self._compute()
+        except Exception as exc:
+            self.app.logger.warning(f"SSE: falha ao calcular payload: {exc}")
+            return
+        with self._lock:
+            changed = {k: v for k, v in payload.items() if self._state.get(k) != v}
+            if not changed:
+                return
+            self._state.update(changed)
+            self._seq += 1
+            event = (self._seq, changed)
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            self._offer(q, event)
+
+    def _offer(self, q: queue.Queue, event: tuple[int, dict]) -> None:
+        try:
+            q.put_nowait(event)
+        except queue.Full:
+            while True:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    break
+            with self._lock:
+                snapshot = (self._seq, dict(self._state))
+            q.put_nowait(snapshot)
+
+    def _replay(self, last_event_id: str | None) -> list[tuple[int, dict]]:
+        """Eventos perdidos desde `last_event_id`, ou um snapshot completo quando
+        o id é desconhecido (outro processo, reinício ou fora do histórico)."""
+        snapshot = [(self._seq, dict(self._state))]
+        if not last_event_id:
+            return snapshot
+        epoch, _, seq = last_event_id.rpartition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return snapshot
+        seq_n = int(seq)
+        if seq_n == self._seq:
+            return []
+        if seq_n > self._seq or not self._history or seq_n < self._history[0][0] - 1:
+            return snapshot
+        return [e for e in self._history if e[0] > seq_n]
+
+    def has_room(self) -> bool:
+        with self._lock:
+            return len(self._subscribers) < self.max_subscribers
+
+    def subscribe(self, last_event_id: str | None = None) -> tuple[queue.Queue, list[tuple[int, dict]]] | None:
+        """Registra uma fila para a conexão (None se já está no limite). Deve ser
+        chamado de dentro do gerador da resposta, com o unsubscribe no finally:
+        assim um cliente que desconecta antes do primeiro byte não deixa fila."""
+        if not self._state:
+            self.publish_once()
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+            self._subscribers.add(q)
+            backlog = self._replay(last_event_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sse-dashboard", daemon=True)
+                self._thread.start()
+        return q, backlog
+
+    def unsubscribe(self, q: queue.Queue) -> None:
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            self.publish_once()
+
+    def format_event(self, seq: int, data: dict) -> str:
+        return f"id: {self.event_id(seq)}\ndata: {json.dumps(data)}\n\n"
+
+
+_broadcaster: DashboardBroadcaster | None = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster(app) -> DashboardBroadcaster:
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None or _broadcaster.app is not app:
+            _broadcaster = DashboardBroadcaster(
+                app,
+                interval=app.config.get("SSE_INTERVAL_SECONDS", 10),
+                max_subscribers=app.config.get("SSE_MAX_SUBSCRIBERS", 100),
+            )
+        return _broadcaster
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from . import db
+from .models import ActivityLog, ItemMovement
+
+
+_TIMESTAMP_COLUMN = {ItemMovement: "timestamp", ActivityLog: "created_at"}
+
+
+class EventSink:
+    """Grava eventos só-de-inclusão (scans de QR, logins) em segundo plano.
+
+    `emit` coloca a linha numa fila limitada e volta na hora; uma thread junta
+    as linhas e faz um INSERT em lote por tabela quando chega a `batch_size`
+    ou a cada `flush_seconds`. Com a fila cheia a linha é gravada na hora,
+    no próprio request. O que estiver na fila é gravado ao encerrar o processo."""
+
+    def __init__(self, app, max_queue: int = 10_000, batch_size: int = 500, flush_seconds: float = 1.0):
+        self.app = app
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.dropped = 0
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue)
+                self._thread = None
+                self._pid = os.getpid()
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="event-sink", daemon=True)
+                self._thread.start()
+
+    def emit(self, model, **values) -> None:
+        values.setdefault(_TIMESTAMP_COLUMN[model], datetime.utcnow())
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((model, values))
+        except queue.Full:
+            self._write([(model, values)])
+
+    def _write(self, events: list[tuple[type, dict]]) -> None:
+        from .history import record_history
+
+        grouped: dict[type, list[dict]] = {}
+        for model, values in events:
+            grouped.setdefault(model, []).append(values)
+        with self.app.app_context():
+            for model, rows in grouped.items():
+                try:
+                    with db.engine.begin() as conn:
+                        conn.execute(insert(model.__table__), rows)
+                        if model is ItemMovement:
+                            record_history(conn, rows)
+                except Exception as exc:
+                    self.app.logger.warning(f"Eventos: lote de {len(rows)} em {model.__tablename__} falhou: {exc}")
+                    self._write_one_by_one(model, rows)
+
+    def _write_one_by_one(self, model, rows: list[dict]) -> None:
+        from .history import record_history
+
+        for row in rows:
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(insert(model.__table__), [row])
+                    if model is ItemMovement:
+                        record_history(conn, [row])
+            except Exception as exc:
+                self.dropped += 1
+                self.app.logger.error(f"Eventos: linha descartada de {model.__tablename__}: {row} ({exc})")
+
+    def _drain(self, pending: list, limit: int) -> None:
+        while len(pending) < limit:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                return
+
+    def _run(self) -> None:
+        pending: list[tuple[type, dict]] = []
+        deadline = time.monotonic() + self.flush_seconds
+        while not self._stop.is_set():
+            try:
+                pending.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0.01)))
+                self._drain(pending, self.batch_size)
+            except queue.Empty:
+                pass
+            if len(pending) >= self.batch_size or (pending and time.monotonic() >= deadline):
+                self._write(pending)
+                pending = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_seconds
+        self._drain(pending, float("inf"))
+        if pending:
+            self._write(pending)
+
+    def flush(self) -> None:
+        """Grava na hora tudo o que está na fila (usado no encerramento e em testes)."""
+        pending: list[tuple[type, dict]] = []
+        self._drain(pending, float("inf"))
+        if pending:
+            self._write(pending)
+
+    def close(self, timeout: float = 10) -> None:
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        self.flush()
+
+
+_sink: EventSink | None = None
+_sink_lock = threading.Lock()
+
+
+def get_event_sink(app) -> EventSink:
+    global _sink
+    with _sink_lock:
+        if _sink is None or _sink.app is not app:
+            if _sink is not None:
+                _sink.close()
+            _sink = EventSink(
+                app,
+                max_queue=app.config.get("EVENT_QUEUE_SIZE", 10_000),
+                batch_size=app.config.get("EVENT_BATCH_SIZE", 500),
+                flush_seconds=app.config.get("EVENT_FLUSH_SECONDS", 1.0),
+            )
+            atexit.register(_sink.close)
+        return _sink
+
+
+def record_event(model, **values) -> None:
+    """Grava um ItemMovement/ActivityLog pelo EventSink, ou direto na sessão
+    quando EVENT_SINK_ENABLED está desligado."""
+    from flask import current_app
+
+    if not current_app.config.get("EVENT_SINK_ENABLED", True):
+        db.session.add(model(**values))
+        db.session.commit()
+        return
+    get_event_sink(current_app._get_current_object()).emit(model, **values)
@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import tempfile
+import zlib
+from datetime import datetime
+from typing import Iterator
+
+import xlsxwriter
+from sqlalchemy import or_
+
+from . import db
+from .models import Item
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def iter_item_rows(columns, filters=(), chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator:
+    """Percorre itens em blocos ordenados por id (keyset), projetando só `columns`.
+
+    Nunca mantém mais de `chunk_size` linhas em memória."""
+    columns = tuple(columns)
+    if Item.id not in columns:
+        columns = (Item.id,) + columns
+    last_id = 0
+    while True:
+        rows = (
+            db.session.query(*columns)
+            .filter(*filters)
+            .filter(Item.id > last_id)
+            .order_by(Item.id.asc())
+            .limit(chunk_size)
+            .all()
+        )
+        if not rows:
+            return
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1].id
+
+
+EXPORT_COLUMNS = {
+    name: getattr(Item, name) for name in (
+        "id", "code", "name", "status", "item_type", "origin_stock", "location", "patient_name",
+        "description", "lat", "lng", "quantity", "min_threshold", "owner_id", "movement_date",
+        "last_maintenance_date", "entry_date", "expiry_date",
+    )
+}
+DEFAULT_EXPORT_COLUMNS = (
+    "id", "name", "status", "item_type", "origin_stock", "location", "lat", "lng", "quantity", "min_threshold",
+)
+STREAM_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "json": ("application/json", "json"),
+}
+
+
+def export_columns(spec: str | None) -> list[str]:
+    """Colunas pedidas em ?columns=a,b,c (padrão: as de to_dict_summary).
+    Levanta ValueError com os nomes desconhecidos."""
+    if not spec:
+        return list(DEFAULT_EXPORT_COLUMNS)
+    names = [c.strip() for c in spec.split(",") if c.strip()]
+    unknown = [c for c in names if c not in EXPORT_COLUMNS]
+    if unknown or not names:
+        raise ValueError(", ".join(unknown) or "nenhuma coluna")
+    return list(dict.fromkeys(names))
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def stream_items(fmt: str, columns: list[str], filters=(), compress: bool = False,
+                 chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Gera a exportação em CSV, NDJSON ou array JSON, um bloco de linhas por vez,
+    opcionalmente comprimida em gzip à medida que é produzida."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def emit(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    selected = [EXPORT_COLUMNS[c] for c in columns]
+    buf = io.StringIO()
+    writer = csv.writer(buf) if fmt == "csv" else None
+    if writer:
+        writer.writerow(columns)
+    elif fmt == "json":
+        buf.write("[")
+    first = True
+    pending = 0
+    for row in iter_item_rows(selected, filters, chunk_size):
+        values = [getattr(row, c) for c in columns]
+        if writer:
+            writer.writerow([_json_value(v) for v in values])
+        else:
+            if fmt == "json" and not first:
+                buf.write(",")
+            buf.write(json.dumps({c: _json_value(v) for c, v in zip(columns, values)}, ensure_ascii=False))
+            if fmt == "ndjson":
+                buf.write("\n")
+        first = False
+        pending += 1
+        if pending >= chunk_size:
+            chunk = emit(buf.getvalue())
+            buf.seek(0)
+            buf.truncate()
+            pending = 0
+            if chunk:
+                yield chunk
+    if fmt == "json":
+        buf.write("]")
+    tail = emit(buf.getvalue())
+    if compressor:
+        tail += compressor.flush()
+    if tail:
+        yield tail
+
+
+def _fmt_date(value) -> str:
+    return value.strftime("%Y-%m-%d") if value else ""
+
+
+def write_items_xlsx(filters=(), chunk_size: int = EXPORT_CHUNK_SIZE) -> str:
+    """Gera a planilha de itens em um arquivo temporário e devolve o caminho.
+
+    Usa o modo constant_memory do XlsxWriter: cada linha vai para disco assim
+    que é escrita. Quem chama remove o arquivo."""
+    fd, path = tempfile.mkstemp(prefix="ghoststock_", suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "tmpdir": os.path.dirname(path)})
+        worksheet = workbook.add_worksheet("Itens")
+        worksheet.write_row(0, 0, ["ID", "Nome", "Status", "Local", "Qtd", "Min", "Entrada", "Vencimento"])
+        columns = (
+            Item.id, Item.name, Item.status, Item.location, Item.quantity,
+            Item.min_threshold, Item.entry_date, Item.expiry_date,
+        )
+        for row, r in enumerate(iter_item_rows(columns, filters, chunk_size), start=1):
+            worksheet.write_row(row, 0, [
+                r.id, r.name, r.status, r.location or "", r.quantity, r.min_threshold,
+                _fmt_date(r.entry_date), _fmt_date(r.expiry_date),
+            ])
+        workbook.close()
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def stream_and_remove(path: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Envia um arquivo temporário em blocos e o remove ao final (ou se o cliente desconectar)."""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    break
+                yield data
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class _InventoryPdf:
+    """Desenha o inventário em páginas A4 com cabeçalho, grupos e totais."""
+
+    COLUMNS = (
+        ("Código", 40, 12), ("Nome", 105, 24), ("Status", 245, 14), ("Local", 320, 22),
+        ("Últ. manut.", 445, 11), ("Entrada", 510, 11),
+    )
+    TOP = 800
+    BOTTOM = 50
+    LINE = 13
+
+    def __init__(self, path: str, subtitle: str):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+
+        self.c = canvas.Canvas(path, pagesize=A4, pageCompression=1)
+        self.c.setTitle("GhostStock - Inventário")
+        self.subtitle = subtitle
+        self.generated = datetime.utcnow().strftime("%Y-%m-%d %H:%M UTC")
+        self.page = 0
+        self.y = 0
+        self._new_page()
+
+    def _new_page(self) -> None:
+        if self.page:
+            self.c.showPage()
+        self.page += 1
+        c = self.c
+        c.setFont("Helvetica-Bold", 13)
+        c.drawString(40, self.TOP, "Relatório GhostStock - Inventário completo")
+        c.setFont("Helvetica", 8)
+        c.drawString(40, self.TOP - 12, f"{self.subtitle} • Gerado em {self.generated}")
+        c.drawRightString(555, self.TOP, f"Página {self.page}")
+        self.y = self.TOP - 34
+        self._column_header()
+
+    def _column_header(self) -> None:
+        self.c.setFont("Helvetica-Bold", 8)
+        for title, x, _width in self.COLUMNS:
+            self.c.drawString(x, self.y, title)
+        self.c.line(40, self.y - 3, 555, self.y - 3)
+        self.y -= self.LINE
+        self.c.setFont("Helvetica", 8)
+
+    def _ensure(self, lines: int = 1) -> None:
+        if self.y - lines * self.LINE < self.BOTTOM:
+            self._new_page()
+
+    def group(self, title: str) -> None:
+        self._ensure(3)
+        self.y -= 4
+        self.c.setFont("Helvetica-Bold", 9)
+        self.c.drawString(40, self.y, title)
+        self.c.setFont("Helvetica", 8)
+        self.y -= self.LINE
+
+    def row(self, values) -> None:
+        self._ensure()
+        for (_title, x, width), value in zip(self.COLUMNS, values):
+            text = str(value or "-")
+            self.c.drawString(x, self.y, text if len(text) <= width else text[: width - 1] + "…")
+        self.y -= self.LINE
+
+    def total(self, label: str, count: int, bold: bool = False) -> None:
+        self._ensure()
+        self.c.setFont("Helvetica-Bold" if bold else "Helvetica-Oblique", 8)
+        self.c.drawRightString(555, self.y, f"{label}: {count}")
+        self.c.setFont("Helvetica", 8)
+        self.y -= self.LINE
+
+    def save(self) -> None:
+        self.c.showPage()
+        self.c.save()
+
+
+def write_inventory_pdf(origin_stock: str | None = None, item_type: str | None = None,
+                        status: str | None = None, chunk_size: int = EXPORT_CHUNK_SIZE) -> str:
+    """Gera o PDF do inventário agrupado por estoque e tipo em um arquivo temporário.
+
+    Os grupos e seus totais vêm da tabela de contadores; as linhas de cada grupo
+    são lidas em blocos, então só um bloco fica em memória por vez."""
+    from .counters import counter_rows
+
+    groups: dict[tuple, int] = {}
+    for r in counter_rows():
+        if ((origin_stock and r.origin_stock != origin_stock) or (item_type and r.item_type != item_type)
+                or (status and r.status != status)):
+            continue
+        key = (r.origin_stock, r.item_type)
+        groups[key] = groups.get(key, 0) + r.total
+
+    subtitle = " • ".join(
+        f"{label}: {value}" for label, value in
+        (("Estoque", origin_stock), ("Tipo", item_type), ("Status", status)) if value
+    ) or "Todos os itens"
+    fd, path = tempfile.mkstemp(prefix="ghoststock_", suffix=".pdf")
+    os.close(fd)
+    try:
+        pdf = _InventoryPdf(path, subtitle)
+        columns = (Item.id, Item.code, Item.name, Item.status, Item.location,
+                   Item.last_maintenance_date, Item.entry_date)
+        stock_totals: dict[str, int] = {}
+        for stock, type_ in sorted(groups, key=lambda g: (g[0] or "", g[1] or "")):
+            filters = [
+                Item.origin_stock == stock if stock else or_(Item.origin_stock.is_(None), Item.origin_stock == ""),
+                Item.item_type == type_ if type_ else or_(Item.item_type.is_(None), Item.item_type == ""),
+            ]
+            if status:
+                filters.append(Item.status == status)
+            pdf.group(f"Estoque {stock or '-'} • {(type_ or 'sem tipo').replace('_', ' ')} ({groups[(stock, type_)]} itens)")
+            count = 0
+            for r in iter_item_rows(columns, filters, chunk_size):
+                pdf.row((r.code or r.id, r.name, r.status, r.location,
+                         _fmt_date(r.last_maintenance_date), _fmt_date(r.entry_date)))
+                count += 1
+            pdf.total("Subtotal", count)
+            stock_totals[stock or "-"] = stock_totals.get(stock or "-", 0) + count
+        pdf.group("Totais por estoque")
+        for stock in sorted(stock_totals):
+            pdf.total(f"Estoque {stock}", stock_totals[stock])
+        pdf.total("Total geral", sum(stock_totals.values()), bold=True)
+        pdf.save()
+    except Exception:
+        os.remove(path)
+        raise
+    return path
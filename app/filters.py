@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Mapping
+
+from sqlalchemy import tuple_
+
+from .models import Item
+from .search import search_condition
+from .stats import MAINTENANCE_DUE_DAYS, MAINTENANCE_SOON_DAYS
+
+
+EM_USO_FILTERS = ("em_uso", "em uso")
+MAINT_DUE_FILTERS = ("em_manutencao", "maint_due", "manutencao", "em-manutencao")
+MAINT_SOON_FILTERS = ("aguardando_manutencao", "maint_soon", "aguardando-manutencao")
+LIST_FILTER_ARGS = ("status", "maint", "origin_stock", "item_type", "q", "entry_from", "entry_to")
+
+
+def _parse_day(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def item_list_filters(args: Mapping, now: datetime | None = None) -> list:
+    """Filtros da listagem de itens (status, maint, origin_stock, item_type, q,
+    entry_from/entry_to), na mesma semântica da tela /items/."""
+    now = now or datetime.utcnow()
+    due_cutoff = now - timedelta(days=MAINTENANCE_DUE_DAYS)
+    soon_cutoff = now - timedelta(days=MAINTENANCE_SOON_DAYS)
+    filters = []
+    status = args.get("status")
+    if status:
+        status_norm = status.lower().strip()
+        if status_norm in EM_USO_FILTERS:
+            filters.append(Item.status == "locado")
+        elif status_norm in MAINT_DUE_FILTERS:
+            filters += [Item.last_maintenance_date.isnot(None), Item.last_maintenance_date <= due_cutoff]
+        elif status_norm in MAINT_SOON_FILTERS:
+            filters += [
+                Item.last_maintenance_date.isnot(None),
+                Item.last_maintenance_date > due_cutoff,
+                Item.last_maintenance_date <= soon_cutoff,
+            ]
+        else:
+            filters.append(Item.status == status)
+    if args.get("origin_stock"):
+        filters.append(Item.origin_stock == args.get("origin_stock"))
+    if args.get("item_type"):
+        filters.append(Item.item_type == args.get("item_type"))
+    if args.get("maint") == "due":
+        filters += [Item.last_maintenance_date.isnot(None), Item.last_maintenance_date <= due_cutoff]
+    q = (args.get("q") or "").strip()
+    if q:
+        filters.append(search_condition(q))
+    entry_from = _parse_day(args.get("entry_from"))
+    if entry_from:
+        filters.append(Item.entry_date >= entry_from)
+    entry_to = _parse_day(args.get("entry_to"))
+    if entry_to:
+        filters.append(Item.entry_date <= entry_to)
+    return filters
+
+
+LIST_ORDER = (Item.entry_date.desc(), Item.id.desc())
+LIST_ORDER_REVERSED = (Item.entry_date.asc(), Item.id.asc())
+
+
+def list_cursor(item: Item) -> list:
+    return [item.entry_date, item.id]
+
+
+def older_page(query, cursor: list | None, limit: int) -> list[Item]:
+    """Até `limit` itens depois de `cursor` (ou desde o início) na ordem da
+    listagem: entry_date desc, id desc, itens sem entry_date no fim.
+
+    A ordem é percorrida em duas fases, cada uma uma busca direta em
+    ix_item_entry_date_id: primeiro os itens com data, pela comparação de
+    linha (entry_date, id) < cursor; quando eles acabam, os sem data por id.
+    Um OR com "entry_date IS NULL" no mesmo predicado faria o banco varrer o
+    índice desde o começo a cada página."""
+    rows: list[Item] = []
+    if cursor is None or cursor[0] is not None:
+        dated = query.filter(Item.entry_date.isnot(None))
+        if cursor is not None:
+            dated = dated.filter(tuple_(Item.entry_date, Item.id) < tuple_(*cursor))
+        rows = dated.order_by(*LIST_ORDER).limit(limit).all()
+    if len(rows) < limit:
+        undated = query.filter(Item.entry_date.is_(None))
+        if cursor is not None and cursor[0] is None:
+            undated = undated.filter(Item.id < cursor[1])
+        rows += undated.order_by(Item.id.desc()).limit(limit - len(rows)).all()
+    return rows
+
+
+def newer_page(query, cursor: list, limit: int) -> list[Item]:
+    """Até `limit` itens antes de `cursor`, do mais próximo para o mais
+    distante (usado pelo link "Anterior"); as mesmas duas fases de
+    older_page, na ordem inversa."""
+    rows: list[Item] = []
+    dated = query.filter(Item.entry_date.isnot(None))
+    if cursor[0] is None:
+        rows = (
+            query.filter(Item.entry_date.is_(None), Item.id > cursor[1])
+            .order_by(Item.id.asc()).limit(limit).all()
+        )
+    else:
+        dated = dated.filter(tuple_(Item.entry_date, Item.id) > tuple_(*cursor))
+    if len(rows) < limit:
+        rows += dated.order_by(*LIST_ORDER_REVERSED).limit(limit - len(rows)).all()
+    return rows
+
+
+_count_cache: dict[tuple, tuple[float, int]] = {}
+_count_cache_lock = threading.Lock()
+COUNT_CACHE_MAX = 256
+
+
+def _counter_total(args: Mapping) -> int | None:
+    """Total exato a partir dos contadores quando só há filtros de estoque, tipo
+    e status simples; None quando a consulta precisa ir à tabela de itens."""
+    if any(args.get(k) for k in ("maint", "q", "entry_from", "entry_to")):
+        return None
+    status = args.get("status")
+    if status:
+        status_norm = status.lower().strip()
+        if status_norm in MAINT_DUE_FILTERS or status_norm in MAINT_SOON_FILTERS:
+            return None
+        if status_norm in EM_USO_FILTERS:
+            status = "locado"
+    from .counters import counter_rows
+    origin_stock, item_type = args.get("origin_stock"), args.get("item_type")
+    return sum(
+        r.total for r in counter_rows()
+        if (not origin_stock or r.origin_stock == origin_stock)
+        and (not item_type or r.item_type == item_type)
+        and (not status or r.status == status)
+    )
+
+
+def item_list_total(query, args: Mapping, ttl: int = 60) -> int:
+    """Total da listagem sem COUNT(*) a cada página.
+
+    Filtros simples usam os contadores; os demais (busca, datas, manutenção)
+    fazem um COUNT guardado em cache por `ttl` segundos para a mesma combinação
+    de filtros."""
+    from flask import current_app
+    if current_app.config.get("INVENTORY_COUNTERS", True):
+        total = _counter_total(args)
+        if total is not None:
+            return total
+    key = tuple((k, (args.get(k) or "").strip()) for k in LIST_FILTER_ARGS)
+    now = time.monotonic()
+    with _count_cache_lock:
+        hit = _count_cache.get(key)
+    if hit and now - hit[0] < ttl:
+        return hit[1]
+    total = query.order_by(None).count()
+    with _count_cache_lock:
+        if len(_count_cache) >= COUNT_CACHE_MAX:
+            _count_cache.clear()
+        _count_cache[key] = (now, total)
+    return total
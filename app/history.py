@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+from datetime import datetime
+from itertools import chain
+
+from sqlalchemy import insert, select, update
+
+from . import db
+from .models import ItemMovement, ItemPatient, MaintenancePeriod
+from .pagination import decode_cursor, encode_cursor, keyset_after
+from .schema import claim_marker, read_marker
+
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_PAGE_MAX = 500
+HISTORY_CHUNK = 900
+MAINTENANCE_STATUS = "em_manutencao"
+HISTORY_ACTIONS = ("status_change", "patient_change")
+HISTORY_MARKER = "item_history"
+
+_history_ready = False
+
+
+class _HistoryState:
+    """Estado por item durante a aplicação de um lote de movimentos."""
+
+    def __init__(self, conn, item_ids: list[int]):
+        self.conn = conn
+        self.open: dict[int, dict | None] = {}
+        self.patients: set[tuple[int, str]] = set()
+        mp, ip = MaintenancePeriod.__table__, ItemPatient.__table__
+        for i in range(0, len(item_ids), HISTORY_CHUNK):
+            chunk = item_ids[i:i + HISTORY_CHUNK]
+            for (item_id,) in conn.execute(
+                select(mp.c.item_id).where(mp.c.item_id.in_(chunk), mp.c.ended_at.is_(None))
+            ):
+                self.open[item_id] = None
+            self.patients.update(
+                (r.item_id, r.patient_name)
+                for r in conn.execute(select(ip.c.item_id, ip.c.patient_name).where(ip.c.item_id.in_(chunk)))
+            )
+        self.new_periods: list[dict] = []
+        self.closed: dict[datetime, list[int]] = {}
+        self.new_patients: list[dict] = []
+
+    def apply(self, item_id: int, action: str, from_value, to_value, timestamp: datetime) -> None:
+        if action == "patient_change":
+            if to_value and (item_id, to_value) not in self.patients:
+                self.patients.add((item_id, to_value))
+                self.new_patients.append({"item_id": item_id, "patient_name": to_value, "first_seen": timestamp})
+            return
+        if action != "status_change":
+            return
+        if to_value == MAINTENANCE_STATUS and item_id not in self.open:
+            period = {"item_id": item_id, "started_at": timestamp, "ended_at": None}
+            self.new_periods.append(period)
+            self.open[item_id] = period
+        elif item_id in self.open and from_value == MAINTENANCE_STATUS and to_value != MAINTENANCE_STATUS:
+            period = self.open.pop(item_id)
+            if period is None:
+                self.closed.setdefault(timestamp, []).append(item_id)
+            else:
+                period["ended_at"] = timestamp
+
+    def flush(self) -> None:
+        mp = MaintenancePeriod.__table__
+        for ended_at, ids in self.closed.items():
+            for i in range(0, len(ids), HISTORY_CHUNK):
+                self.conn.execute(
+                    update(mp)
+                    .where(mp.c.item_id.in_(ids[i:i + HISTORY_CHUNK]), mp.c.ended_at.is_(None))
+                    .values(ended_at=ended_at)
+                )
+        if self.new_periods:
+            self.conn.execute(insert(mp), self.new_periods)
+            for item_id, period in self.open.items():
+                if period is not None:
+                    self.open[item_id] = None
+        if self.new_patients:
+            self.conn.execute(insert(ItemPatient.__table__), self.new_patients)
+        self.new_periods, self.closed, self.new_patients = [], {}, []
+
+
+def record_history(conn, movements: list[dict]) -> None:
+    """Atualiza períodos de manutenção e pacientes a partir de movimentos
+    recém-gravados (dicts com item_id, action, from_value, to_value e
+    timestamp, na ordem em que aconteceram). Roda na mesma transação do
+    INSERT dos movimentos.
+
+    Enquanto o preenchimento inicial (ensure_history) não rodou, não faz
+    nada: ele vai reprocessar estes movimentos junto com os antigos."""
+    global _history_ready
+    relevant = [m for m in movements if m["action"] in HISTORY_ACTIONS]
+    if not relevant:
+        return
+    if not _history_ready:
+        if read_marker(conn, HISTORY_MARKER, lock=True) != "done":
+            return
+        _history_ready = True
+    state = _HistoryState(conn, sorted({m["item_id"] for m in relevant}))
+    for m in relevant:
+        state.apply(m["item_id"], m["action"], m.get("from_value"), m.get("to_value"), m["timestamp"])
+    state.flush()
+
+
+def rebuild_history(batch: int = 5000, force: bool = True) -> tuple[int, int] | None:
+    """Recria as tabelas de histórico reprocessando todos os movimentos em
+    ordem, primeiro os arquivados (mês a mês) e depois os da tabela quente.
+    Retorna (períodos, pacientes).
+
+    O marcador HISTORY_MARKER é gravado na mesma transação; sem `force`, não
+    faz nada (retorna None) se ele já estava marcado."""
+    from flask import current_app
+    from .archive import iter_archived
+
+    conn = db.session.connection()
+    if not claim_marker(conn, HISTORY_MARKER, "done", force=force):
+        db.session.rollback()
+        return None
+    conn.execute(MaintenancePeriod.__table__.delete())
+    conn.execute(ItemPatient.__table__.delete())
+    query = (
+        select(ItemMovement.item_id, ItemMovement.action, ItemMovement.from_value,
+               ItemMovement.to_value, ItemMovement.timestamp)
+        .where(ItemMovement.action.in_(HISTORY_ACTIONS))
+        .order_by(ItemMovement.item_id, ItemMovement.timestamp, ItemMovement.id)
+        .execution_options(yield_per=batch)
+    )
+    archived = (
+        r for r in iter_archived(current_app._get_current_object())
+        if r["action"] in HISTORY_ACTIONS
+    )
+    hot = (r._mapping for r in db.session.execute(query))
+    state = _HistoryState(conn, [])
+    periods = patients = 0
+    for n, r in enumerate(chain(archived, hot), 1):
+        state.apply(r["item_id"], r["action"], r["from_value"], r["to_value"], r["timestamp"])
+        if n % batch == 0:
+            periods += len(state.new_periods)
+            patients += len(state.new_patients)
+            state.flush()
+    periods += len(state.new_periods)
+    patients += len(state.new_patients)
+    state.flush()
+    db.session.commit()
+    return periods, patients
+
+
+def ensure_history() -> None:
+    """Preenche as tabelas de histórico de uma base que ainda não passou pelo
+    rebuild (roda na subida do app; ver schema.upgrade_schema)."""
+    if read_marker(db.session.connection(), HISTORY_MARKER) != "done":
+        rebuild_history(force=False)
+
+
+def patient_names(item_id: int) -> list[str]:
+    """Pacientes que já usaram o item, na ordem da primeira vez."""
+    rows = (
+        db.session.query(ItemPatient.patient_name)
+        .filter(ItemPatient.item_id == item_id)
+        .order_by(ItemPatient.first_seen.asc(), ItemPatient.patient_name.asc())
+        .all()
+    )
+    return [r.patient_name for r in rows]
+
+
+def maintenance_periods(item_id: int) -> list[MaintenancePeriod]:
+    """Períodos de manutenção encerrados do item, do mais antigo ao mais recente."""
+    return (
+        MaintenancePeriod.query
+        .filter(MaintenancePeriod.item_id == item_id, MaintenancePeriod.ended_at.isnot(None))
+        .order_by(MaintenancePeriod.started_at.asc())
+        .all()
+    )
+
+
+def movement_page(item_id: int, cursor: str | None = None, limit: int = HISTORY_PAGE_SIZE):
+    """Uma página de movimentos do item, do mais recente para o mais antigo,
+    pelo índice (item_id, timestamp, id). Retorna (movimentos, próximo cursor).
+
+    Quando a tabela quente acaba, a página continua nos meses arquivados (ver
+    archive.py), que são sempre mais antigos que qualquer linha quente."""
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
+    query = ItemMovement.query.filter(ItemMovement.item_id == item_id, ItemMovement.timestamp.isnot(None))
+    values = decode_cursor(cursor, 2)
+    if values:
+        query = query.filter(keyset_after((ItemMovement.timestamp, ItemMovement.id), values, descending=True))
+    rows = query.order_by(ItemMovement.timestamp.desc(), ItemMovement.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        rows += _archived_page(item_id, values, limit + 1 - len(rows))
+    next_cursor = encode_cursor(rows[limit - 1].timestamp, rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def _archived_page(item_id: int, values: list | None, wanted: int) -> list[ItemMovement]:
+    from flask import current_app
+    from .archive import archived_months, archived_movement, iter_month, month_bounds
+
+    app = current_app._get_current_object()
+    found: list[ItemMovement] = []
+    for month in archived_months():
+        if values and month_bounds(month)[0] > values[0]:
+            continue
+        rows = [
+            r for r in iter_month(app, month, item_id)
+            if not values or (r["timestamp"], r["id"]) < (values[0], values[1])
+        ]
+        rows.sort(key=lambda r: (r["timestamp"], r["id"]), reverse=True)
+        found += [archived_movement(r) for r in rows[:wanted - len(found)]]
+        if len(found) >= wanted:
+            break
+    return found
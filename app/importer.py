@@ -0,0 +1,483 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+import re
+import tempfile
+import threading
+import uuid
+import zipfile
+from datetime import datetime, timedelta
+from typing import Iterator
+from xml.etree.ElementTree import iterparse
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .codes import advance_past, code_prefix, format_code, parse_code, reserve_codes
+from .models import Item
+
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_FORMATS = ("csv", "json", "xlsx")
+MAX_JSON_BUFFER = 16 * 1024 * 1024
+IMPORT_FIELDS = (
+    "code", "name", "item_type", "description", "status", "origin_stock", "location",
+    "patient_name", "entry_date", "expiry_date", "last_maintenance_date", "quantity", "min_threshold",
+)
+FIELD_ALIASES = {
+    "codigo": "code", "código": "code", "nome": "name", "tipo": "item_type", "descricao": "description",
+    "descrição": "description", "estoque": "origin_stock", "local": "location", "paciente": "patient_name",
+    "entrada": "entry_date", "vencimento": "expiry_date", "ultima_manutencao": "last_maintenance_date",
+    "qtd": "quantity", "min": "min_threshold",
+}
+DATE_FIELDS = ("entry_date", "expiry_date", "last_maintenance_date")
+INT_FIELDS = ("quantity", "min_threshold")
+STATUS_ALIASES = {
+    "disponivel": "disponivel",
+    "locado": "locado",
+    "em_uso": "locado",
+    "em uso": "locado",
+    "vencido": "vencido",
+    "em_manutencao": "em_manutencao",
+    "aguardando_manutencao": "em_manutencao",
+}
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+_IMPORT_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class RowError(ValueError):
+    pass
+
+
+def _parse_date(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    text = str(value).strip()
+    try:
+        serial = float(text)
+    except ValueError:
+        pass
+    else:
+        return _EXCEL_EPOCH + timedelta(days=serial)
+    for fmt in ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(text[:19], fmt)
+        except ValueError:
+            continue
+    raise RowError(f"data inválida: {text!r}")
+
+
+def normalize_row(raw: dict) -> dict:
+    """Valida uma linha e devolve só os campos informados, já convertidos."""
+    values: dict = {}
+    for key, value in raw.items():
+        if key is None:
+            continue
+        field = str(key).strip().lower()
+        field = FIELD_ALIASES.get(field, field)
+        if field not in IMPORT_FIELDS or value is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+            if not value:
+                continue
+        if field in DATE_FIELDS:
+            value = _parse_date(value)
+        elif field in INT_FIELDS:
+            try:
+                value = int(float(value))
+            except (TypeError, ValueError):
+                raise RowError(f"{field} deve ser um número inteiro")
+            if value < 0:
+                raise RowError(f"{field} não pode ser negativo")
+        else:
+            value = str(value)
+        values[field] = value
+    if "status" in values:
+        status = STATUS_ALIASES.get(values["status"].lower())
+        if not status:
+            raise RowError(f"status inválido: {values['status']!r}")
+        values["status"] = status
+    if "origin_stock" in values:
+        values["origin_stock"] = values["origin_stock"].upper()
+        if len(values["origin_stock"]) > 2:
+            raise RowError(f"origin_stock inválido: {values['origin_stock']!r}")
+    for field, size in (("code", 32), ("name", 120), ("item_type", 40), ("location", 120), ("patient_name", 120)):
+        if len(values.get(field, "")) > size:
+            raise RowError(f"{field} excede {size} caracteres")
+    if not values:
+        raise RowError("linha vazia")
+    return values
+
+
+def _iter_csv(path: str) -> Iterator[tuple[int, dict]]:
+    with open(path, "r", encoding="utf-8-sig", errors="ignore", newline="") as fh:
+        reader = csv.DictReader(fh)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _iter_json(path: str, chunk_size: int = 64 * 1024) -> Iterator[tuple[int, object]]:
+    """Lê um array JSON (ou NDJSON) objeto a objeto, sem carregar o arquivo."""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8-sig", errors="ignore") as fh:
+        buf, pos, eof, array, n = "", 0, False, None, 0
+        while True:
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buf) or eof:
+                    break
+                data = fh.read(chunk_size)
+                eof = not data
+                buf, pos = buf[pos:] + data, 0
+            if pos >= len(buf):
+                return
+            if array is None:
+                array = buf[pos] == "["
+                if array:
+                    pos += 1
+                    continue
+            if array and buf[pos] == "]":
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as exc:
+                if eof or len(buf) - pos > MAX_JSON_BUFFER:
+                    raise ValueError(f"JSON inválido no objeto {n + 1}: {exc.msg}")
+                data = fh.read(chunk_size)
+                eof = not data
+                buf, pos = buf[pos:] + data, 0
+                continue
+            pos = end
+            n += 1
+            yield n, obj
+
+
+_XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+def _xlsx_column(ref: str) -> int:
+    col = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        col = col * 26 + ord(ch.upper()) - 64
+    return col - 1
+
+
+def _xlsx_text(elem) -> str:
+    return "".join(t.text or "" for t in elem.iter(f"{_XLSX_NS}t"))
+
+
+def _iter_xlsx(path: str) -> Iterator[tuple[int, dict]]:
+    """Lê a primeira planilha de um .xlsx linha a linha (iterparse sobre o XML).
+
+    Só a tabela de textos compartilhados fica em memória."""
+    with zipfile.ZipFile(path) as zf:
+        names = zf.namelist()
+        shared: list[str] = []
+        if "xl/sharedStrings.xml" in names:
+            with zf.open("xl/sharedStrings.xml") as fh:
+                for _event, elem in iterparse(fh):
+                    if elem.tag == f"{_XLSX_NS}si":
+                        shared.append(_xlsx_text(elem))
+                        elem.clear()
+        sheets = sorted(
+            (n for n in names if re.fullmatch(r"xl/worksheets/sheet\d+\.xml", n)),
+            key=lambda n: int(re.search(r"(\d+)", n.rsplit("/", 1)[1]).group(1)),
+        )
+        if not sheets:
+            raise ValueError("planilha vazia")
+        header: list[str] | None = None
+        with zf.open(sheets[0]) as fh:
+            for _event, elem in iterparse(fh):
+                if elem.tag != f"{_XLSX_NS}row":
+                    continue
+                cells: dict[int, object] = {}
+                for i, c in enumerate(elem.iter(f"{_XLSX_NS}c")):
+                    kind = c.get("t")
+                    if kind == "inlineStr":
+                        value = _xlsx_text(c)
+                    else:
+                        v = c.find(f"{_XLSX_NS}v")
+                        value = v.text if v is not None else None
+                        if kind == "s" and value is not None:
+                            value = shared[int(value)]
+                    ref = c.get("r")
+                    cells[_xlsx_column(ref) if ref else i] = value
+                row_num = int(elem.get("r") or 0)
+                elem.clear()
+                if header is None:
+                    header = [str(cells.get(i) or "").strip() for i in range(max(cells, default=-1) + 1)]
+                    continue
+                if any(v not in (None, "") for v in cells.values()):
+                    yield row_num, {h: cells.get(i) for i, h in enumerate(header) if h}
+
+
+def iter_rows(path: str, fmt: str) -> Iterator[tuple[int, object]]:
+    if fmt == "csv":
+        return _iter_csv(path)
+    if fmt == "json":
+        return _iter_json(path)
+    if fmt == "xlsx":
+        return _iter_xlsx(path)
+    raise ValueError(f"formato não suportado: {fmt}")
+
+
+def import_format(filename: str | None) -> str | None:
+    ext = (filename or "").rsplit(".", 1)[-1].lower()
+    return ext if ext in IMPORT_FORMATS else None
+
+
+class ItemImporter:
+    """Importa itens em lotes: insere os novos, atualiza os existentes (upsert
+    por `code`) e mantém contadores e índice de autocomplete em dia.
+
+    Cada lote é uma transação; linhas inválidas ou que conflitam no banco vão
+    para `errors` e não interrompem a importação."""
+
+    def __init__(self, owner_id: int, batch_size: int = IMPORT_BATCH_SIZE, on_error=None, on_progress=None):
+        self.owner_id = owner_id
+        self.batch_size = batch_size
+        self.on_error = on_error or (lambda row, code, message: None)
+        self.on_progress = on_progress or (lambda stats: None)
+        self.stats = {"processed": 0, "created": 0, "updated": 0, "errors": 0}
+        self._seen: dict[str, int] = {}
+
+    def error(self, row: int, code, message: str) -> None:
+        self.stats["errors"] += 1
+        self.on_error(row, code or "", message)
+
+    def run(self, rows: Iterator[tuple[int, object]]) -> dict:
+        batch: list[tuple[int, dict]] = []
+        for row_num, raw in rows:
+            self.stats["processed"] += 1
+            if not isinstance(raw, dict):
+                self.error(row_num, "", "esperado um objeto com os campos do item")
+                continue
+            try:
+                values = normalize_row(raw)
+            except RowError as exc:
+                self.error(row_num, raw.get("code"), str(exc))
+                continue
+            code = values.get("code")
+            if code:
+                if code in self._seen:
+                    self.error(row_num, code, f"código repetido no arquivo (linha {self._seen[code]})")
+                    continue
+                self._seen[code] = row_num
+            batch.append((row_num, values))
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+        return self.stats
+
+    def _flush(self, batch: list[tuple[int, dict]]) -> None:
+        """Grava o lote numa transação. Se ele esbarra numa restrição do banco
+        (ex.: o mesmo código gravado por outra importação enquanto isso), refaz
+        linha a linha, cada uma num savepoint: as que ainda conflitam vão para
+        `errors` e as demais são gravadas (um código que passou a existir vira
+        atualização)."""
+        from .autocomplete import record_name_changes
+
+        try:
+            created, updated, renames = self._write(batch)
+        except IntegrityError:
+            db.session.rollback()
+            created, updated, renames = 0, 0, {}
+            for row_num, values in batch:
+                try:
+                    with db.session.begin_nested():
+                        c, u, r = self._write([(row_num, values)])
+                except IntegrityError as exc:
+                    self.error(row_num, values.get("code"), f"conflito ao gravar: {exc.orig}")
+                    continue
+                created, updated = created + c, updated + u
+                renames.update(r)
+        if renames:
+            record_name_changes(renames)
+        db.session.commit()
+        self.stats["created"] += created
+        self.stats["updated"] += updated
+        self.on_progress(self.stats)
+
+    def _write(self, batch: list[tuple[int, dict]]) -> tuple[int, int, dict]:
+        """Insere/atualiza o lote na transação corrente, sem commit. Mudanças de
+        status, local ou paciente em itens existentes geram movimentos (com o
+        dono da importação como usuário) e atualizam o histórico, como em
+        bulk_status_update. Retorna (criados, atualizados, renomeações para o
+        autocomplete)."""
+        from .counters import KEY_FIELDS as COUNTER_FIELDS, add_delta, apply_deltas, counter_key
+        from .history import record_history
+        from .models import ItemMovement
+        from .movements import MOVEMENT_FIELDS
+
+        codes = [v["code"] for _, v in batch if v.get("code")]
+        existing = {}
+        if codes:
+            existing = {
+                r.code: r for r in db.session.query(
+                    Item.id, Item.code, Item.name, Item.origin_stock, Item.item_type,
+                    Item.status, Item.location, Item.patient_name,
+                    Item.last_maintenance_date, Item.expiry_date, Item.entry_date,
+                ).filter(Item.code.in_(codes))
+            }
+        conn = db.session.connection()
+        now = datetime.utcnow()
+        inserts: list[dict] = []
+        updates: list[dict] = []
+        movements: list[dict] = []
+        deltas: dict = {}
+        renames: dict = {}
+        need_codes: dict[str, list[dict]] = {}
+        explicit_max: dict[str, int] = {}
+        for _row_num, values in batch:
+            old = existing.get(values.get("code"))
+            if old is not None:
+                moved = False
+                for field, action in MOVEMENT_FIELDS:
+                    if field in values and values[field] != getattr(old, field):
+                        movements.append({
+                            "item_id": old.id, "user_id": self.owner_id, "action": action,
+                            "from_value": getattr(old, field), "to_value": values[field], "timestamp": now,
+                        })
+                        moved = True
+                updates.append({"id": old.id, **values, **({"movement_date": now} if moved else {})})
+                before = counter_key(*(getattr(old, field) for field in COUNTER_FIELDS))
+                after = counter_key(*(values.get(field, getattr(old, field)) for field in COUNTER_FIELDS))
+                if before != after:
+                    add_delta(deltas, before, -1)
+                    add_delta(deltas, after, 1)
+                if values.get("name", old.name) != old.name:
+                    renames[old.id] = (values["name"], old.code)
+                continue
+            row = {field: values.get(field) for field in IMPORT_FIELDS}
+            row.update(
+                name=values.get("name") or "Sem nome",
+                status=values.get("status") or "disponivel",
+                quantity=values.get("quantity", 1),
+                min_threshold=values.get("min_threshold", 1),
+                entry_date=values.get("entry_date") or now,
+                movement_date=now,
+                owner_id=self.owner_id,
+            )
+            parsed = parse_code(row["code"])
+            if parsed:
+                explicit_max[parsed[0]] = max(explicit_max.get(parsed[0], 0), parsed[1])
+            elif not row["code"]:
+                need_codes.setdefault(code_prefix(row["item_type"]), []).append(row)
+            inserts.append(row)
+            add_delta(deltas, counter_key(*(row[field] for field in COUNTER_FIELDS)), 1)
+        for prefix, number in explicit_max.items():
+            advance_past(conn, prefix, number)
+        for prefix, rows in need_codes.items():
+            first = reserve_codes(conn, prefix, len(rows))
+            for offset, row in enumerate(rows):
+                row["code"] = format_code(prefix, first + offset)
+        if inserts:
+            db.session.execute(insert(Item), inserts)
+        if updates:
+            db.session.execute(update(Item), updates)
+        if movements:
+            db.session.execute(insert(ItemMovement), movements)
+            record_history(conn, movements)
+        apply_deltas(conn, deltas)
+        return len(inserts), len(updates), renames
+
+
+def import_folder(app) -> str:
+    folder = app.config.get("IMPORT_FOLDER") or os.path.join(tempfile.gettempdir(), "ghoststock_imports")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def job_paths(app, import_id: str) -> dict[str, str] | None:
+    if not _IMPORT_ID.fullmatch(import_id or ""):
+        return None
+    folder = import_folder(app)
+    return {
+        "upload": os.path.join(folder, f"{import_id}.upload"),
+        "status": os.path.join(folder, f"{import_id}.json"),
+        "report": os.path.join(folder, f"{import_id}_erros.csv"),
+    }
+
+
+def read_status(app, import_id: str) -> dict | None:
+    paths = job_paths(app, import_id)
+    if not paths or not os.path.exists(paths["status"]):
+        return None
+    with open(paths["status"], "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _write_status(path: str, status: dict) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(status, fh)
+    os.replace(tmp, path)
+
+
+def start_import(app, upload, fmt: str, owner_id: int, background: bool = True) -> dict:
+    """Grava o upload em disco e processa em segundo plano (ou no próprio
+    request com background=False). O progresso fica num JSON por importação,
+    legível por qualquer worker."""
+    import_id = uuid.uuid4().hex
+    paths = job_paths(app, import_id)
+    upload.save(paths["upload"])
+    status = {
+        "import_id": import_id, "state": "queued", "format": fmt,
+        "filename": getattr(upload, "filename", None),
+        "processed": 0, "created": 0, "updated": 0, "errors": 0,
+        "started_at": datetime.utcnow().isoformat() + "Z", "finished_at": None,
+    }
+    _write_status(paths["status"], status)
+    if background:
+        threading.Thread(
+            target=run_import, args=(app, import_id, fmt, owner_id), name=f"import-{import_id[:8]}", daemon=True,
+        ).start()
+        return status
+    return run_import(app, import_id, fmt, owner_id)
+
+
+def run_import(app, import_id: str, fmt: str, owner_id: int) -> dict:
+    paths = job_paths(app, import_id)
+    status = read_status(app, import_id)
+    status["state"] = "running"
+    _write_status(paths["status"], status)
+    with open(paths["report"], "w", encoding="utf-8", newline="") as report, app.app_context():
+        writer = csv.writer(report)
+        writer.writerow(["linha", "codigo", "erro"])
+
+        def on_progress(stats: dict) -> None:
+            status.update(stats)
+            _write_status(paths["status"], status)
+            report.flush()
+
+        importer = ItemImporter(
+            owner_id,
+            batch_size=app.config.get("IMPORT_BATCH_SIZE", IMPORT_BATCH_SIZE),
+            on_error=lambda row, code, message: writer.writerow([row, code, message]),
+            on_progress=on_progress,
+        )
+        try:
+            importer.run(iter_rows(paths["upload"], fmt))
+            status["state"] = "done"
+        except Exception as exc:
+            db.session.rollback()
+            app.logger.exception(f"Importação {import_id} falhou")
+            status["state"] = "failed"
+            status["detail"] = str(exc)
+        finally:
+            db.session.remove()
+            if os.path.exists(paths["upload"]):
+                os.remove(paths["upload"])
+    status.update(importer.stats)
+    status["finished_at"] = datetime.utcnow().isoformat() + "Z"
+    _write_status(paths["status"], status)
+    return status
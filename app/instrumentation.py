@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import heapq
+import time
+from flask import Flask, g, has_request_context, request
+from sqlalchemy import event
+
+from . import db
+
+
+MAX_LOGGED_STATEMENTS = 10
+MAX_SQL_CHARS = 500
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "sql_stats" in g:
+        conn.info.setdefault("sql_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("sql_started")
+    if not started or not has_request_context() or "sql_stats" not in g:
+        return
+    elapsed = (time.perf_counter() - started.pop()) * 1000.0
+    stats = g.sql_stats
+    stats["count"] += 1
+    stats["ms"] += elapsed
+    if len(stats["statements"]) < MAX_LOGGED_STATEMENTS:
+        heapq.heappush(stats["statements"], (elapsed, statement))
+    else:
+        heapq.heappushpop(stats["statements"], (elapsed, statement))
+
+
+def init_sql_instrumentation(app: Flask) -> None:
+    """Conta comandos SQL e tempo de banco por requisição.
+
+    Expõe os números no cabeçalho Server-Timing e registra no log as
+    requisições acima de SLOW_REQUEST_MS ou SLOW_REQUEST_STATEMENTS, com
+    blueprint, endpoint e os comandos mais lentos."""
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.before_request
+    def _sql_stats_start():
+        g.sql_stats = {"count": 0, "ms": 0.0, "statements": [], "started": time.perf_counter()}
+
+    @app.after_request
+    def _sql_stats_report(resp):
+        stats = g.pop("sql_stats", None)
+        if stats is None:
+            return resp
+        total_ms = (time.perf_counter() - stats["started"]) * 1000.0
+        resp.headers.add(
+            "Server-Timing",
+            f'db;dur={stats["ms"]:.1f};desc="{stats["count"]} SQL", app;dur={total_ms:.1f}',
+        )
+        max_ms = app.config.get("SLOW_REQUEST_MS", 500)
+        max_statements = app.config.get("SLOW_REQUEST_STATEMENTS", 20)
+        if total_ms >= max_ms or stats["count"] >= max_statements:
+            slowest = sorted(stats["statements"], key=lambda s: s[0], reverse=True)
+            lines = [
+                f"Requisição lenta: {request.method} {request.path} "
+                f"(blueprint={request.blueprint or '-'}, endpoint={request.endpoint or '-'}) "
+                f"{total_ms:.1f}ms total, {stats['count']} SQL em {stats['ms']:.1f}ms"
+            ]
+            for ms, sql in slowest:
+                sql = " ".join(sql.split())
+                lines.append(f"  {ms:8.1f}ms  {sql[:MAX_SQL_CHARS]}")
+            app.logger.warning("\n".join(lines))
+        return resp
@@ -27,6 +27,11 @@ class User(UserMixin, db.Model):
 
 
 class Item(db.Model):
+    __table_args__ = (
+        db.Index("ix_item_type_maintenance", "item_type", "last_maintenance_date", "id"),
+        db.Index("ix_item_entry_date_id", "entry_date", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
                                         
     code = db.Column(db.String(32), unique=True, nullable=True)
@@ -124,6 +129,11 @@ class Item(db.Model):
 
 
 class ItemMovement(db.Model):
+    __table_args__ = (
+        db.Index("ix_item_movement_item_ts", "item_id", "timestamp", "id"),
+        db.Index("ix_item_movement_ts", "timestamp"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     item_id = db.Column(db.Integer, db.ForeignKey("item.id"), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
@@ -141,7 +151,46 @@ class ItemMovement(db.Model):
         }
 
 
+class MaintenancePeriod(db.Model):
+    __table_args__ = (
+        db.Index("ix_maintenance_period_item_start", "item_id", "started_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey("item.id"), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    ended_at = db.Column(db.DateTime, nullable=True)
+
+
+class MovementArchive(db.Model):
+    month = db.Column(db.String(7), primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ItemCheckpoint(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime, nullable=False, unique=True, index=True)
+    max_item_id = db.Column(db.Integer, nullable=False, default=0)
+    items = db.Column(db.Integer, nullable=False, default=0)
+    payload = db.Column(db.LargeBinary, nullable=False)
+
+
+class ItemPatient(db.Model):
+    item_id = db.Column(db.Integer, db.ForeignKey("item.id"), primary_key=True)
+    patient_name = db.Column(db.String(120), primary_key=True)
+    first_seen = db.Column(db.DateTime, nullable=False)
+
+
 class ActivityLog(db.Model):
+    __table_args__ = (
+        db.Index("ix_activity_log_created_id", "created_at", "id"),
+        db.Index("ix_activity_log_user_created", "user_id", "created_at"),
+        db.Index("ix_activity_log_action_created", "action", "created_at"),
+        db.Index("ix_activity_log_ip_created", "ip", "created_at"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
     ip = db.Column(db.String(64), nullable=True)
@@ -149,3 +198,22 @@ class ActivityLog(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class InventoryCounter(db.Model):
+    origin_stock = db.Column(db.String(2), primary_key=True, default="")
+    item_type = db.Column(db.String(40), primary_key=True, default="")
+    status = db.Column(db.String(20), primary_key=True, default="")
+    maintenance = db.Column(db.String(4), primary_key=True, default="")
+    expiring = db.Column(db.Boolean, primary_key=True, default=False)
+    recent = db.Column(db.Boolean, primary_key=True, default=False)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SystemMarker(db.Model):
+    name = db.Column(db.String(40), primary_key=True)
+    value = db.Column(db.String(40), nullable=False, default="")
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CodeSequence(db.Model):
+    prefix = db.Column(db.String(16), primary_key=True, default="")
+    next_value = db.Column(db.Integer, nullable=False, default=1)
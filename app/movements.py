@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import insert, update
+
+from . import db
+from .history import record_history
+from .models import Item, ItemMovement
+
+
+STATUS_TRANSITIONS = {
+    "aguardando_manutencao": "em_manutencao",
+    "em_manutencao": "em_manutencao",
+    "locado": "locado",
+    "vencido": "vencido",
+    "disponivel": "disponivel",
+}
+BULK_STATUS_MAX = 5000
+BULK_CHUNK = 900
+
+MOVEMENT_FIELDS = (
+    ("status", "status_change"),
+    ("location", "location_change"),
+    ("patient_name", "patient_change"),
+)
+
+
+def snapshot(item: Item) -> dict:
+    """Valores rastreados de um item antes de uma edição (ver MovementRecorder.changes)."""
+    return {field: getattr(item, field) for field, _action in MOVEMENT_FIELDS}
+
+
+class MovementRecorder:
+    """Acumula as movimentações de uma operação e grava tudo numa única
+    transação: as alterações dos itens, um INSERT em lote dos movimentos e a
+    atualização das tabelas de histórico (ver history.record_history)."""
+
+    def __init__(self, user_id: int | None = None):
+        self.user_id = user_id
+        self._pending: list[tuple[Item, str, str | None, str | None]] = []
+
+    def add(self, item: Item, action: str, from_value=None, to_value=None) -> None:
+        self._pending.append((item, action, from_value, to_value))
+
+    def changes(self, item: Item, before: dict) -> None:
+        """Registra status/local/paciente que mudaram em relação a `before`."""
+        for field, action in MOVEMENT_FIELDS:
+            old, new = before.get(field), getattr(item, field)
+            if old != new:
+                self.add(item, action, old, new)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def commit(self) -> None:
+        if self._pending:
+            db.session.flush()
+            now = datetime.utcnow()
+            rows = [
+                {
+                    "item_id": item.id, "user_id": self.user_id, "action": action,
+                    "from_value": from_value, "to_value": to_value, "timestamp": now,
+                }
+                for item, action, from_value, to_value in self._pending
+            ]
+            db.session.execute(insert(ItemMovement), rows)
+            record_history(db.session.connection(), rows)
+        db.session.commit()
+        self._pending.clear()
+
+
+def bulk_status_update(rows, status: str, location: str | None, user_id: int | None, is_admin: bool) -> list[dict]:
+    """Aplica `status` (e `location`, se informado) a vários itens de uma vez.
+
+    `rows` são as linhas já lidas (id, code, owner_id, status, location e os
+    campos dos contadores). Itens de outros donos voltam como "forbidden" para
+    não-admins; os demais recebem um UPDATE por conjunto, os movimentos entram
+    num INSERT em lote e os contadores são ajustados, tudo num único commit."""
+    from .counters import add_delta, apply_deltas, counter_key
+
+    now = datetime.utcnow()
+    results: list[dict] = []
+    changed: list[int] = []
+    movements: list[dict] = []
+    deltas: dict = {}
+    for r in rows:
+        result = {"id": r.id, "code": r.code}
+        if not is_admin and r.owner_id != user_id:
+            results.append({**result, "result": "forbidden"})
+            continue
+        new_location = r.location if location is None else location
+        if r.status == status and r.location == new_location:
+            results.append({**result, "result": "unchanged"})
+            continue
+        changed.append(r.id)
+        for action, old, new in (("status_change", r.status, status), ("location_change", r.location, new_location)):
+            if old != new:
+                movements.append({
+                    "item_id": r.id, "user_id": user_id, "action": action,
+                    "from_value": old, "to_value": new, "timestamp": now,
+                })
+        dates = (r.last_maintenance_date, r.expiry_date, r.entry_date)
+        add_delta(deltas, counter_key(r.origin_stock, r.item_type, r.status, *dates), -1)
+        add_delta(deltas, counter_key(r.origin_stock, r.item_type, status, *dates), 1)
+        results.append({**result, "result": "ok", "from": r.status, "to": status})
+
+    values = {"status": status, "movement_date": now}
+    if location is not None:
+        values["location"] = location
+    for i in range(0, len(changed), BULK_CHUNK):
+        db.session.execute(
+            update(Item).where(Item.id.in_(changed[i:i + BULK_CHUNK])).values(**values),
+            execution_options={"synchronize_session": False},
+        )
+    if movements:
+        db.session.execute(insert(ItemMovement), movements)
+        record_history(db.session.connection(), movements)
+    apply_deltas(db.session.connection(), deltas)
+    db.session.commit()
+    return results
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import hashlib
+import multiprocessing
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from .codes import ITEM_CODE_PREFIXES, format_code
+
+
+DEFAULT_MAX_SIDE = 1600
+CACHE_MAX = 512
+MAX_TEXT_TERMS = 3
+TASKS_PER_WORKER = 50
+
+_DIGIT_FIXES = str.maketrans({"O": "0", "Q": "0", "D": "0", "I": "1", "L": "1", "|": "1", "S": "5", "B": "8"})
+_PREFIXES = "|".join(sorted(ITEM_CODE_PREFIXES.values(), key=len, reverse=True))
+_CODE_TOKEN = re.compile(rf"(?<![A-Z0-9])({_PREFIXES})[\s\-_.]?([0-9OQDILSB|]{{3,6}})(?![A-Z0-9])")
+_BARE_CODE = re.compile(r"(?<![A-Z0-9])(\d{6})(?![A-Z0-9])")
+
+
+class OcrError(Exception):
+    """Falha de OCR com um código curto para a resposta JSON."""
+
+    def __init__(self, code: str, detail: str):
+        super().__init__(code, detail)
+        self.code = code
+        self.detail = detail
+
+    def __str__(self) -> str:
+        return self.detail
+
+
+def _ocr_worker(data: bytes, max_side: int, timeout: int) -> str:
+    """Roda no processo do pool: decodifica, passa para tons de cinza, reduz
+    para no máximo `max_side` px e chama o tesseract com tempo limite."""
+    from io import BytesIO
+
+    import pytesseract
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(data)) as img:
+        img.draft("L", (max_side, max_side))
+        img = ImageOps.exif_transpose(img).convert("L")
+        img.thumbnail((max_side, max_side))
+        img = ImageOps.autocontrast(img)
+    try:
+        return pytesseract.image_to_string(img, timeout=timeout) or ""
+    except pytesseract.TesseractNotFoundError as exc:
+        raise OcrError("ocr_unavailable", "Tesseract não está instalado no servidor.") from exc
+    except RuntimeError as exc:
+        if "timeout" in str(exc).lower():
+            raise OcrError("ocr_timeout", "Tempo limite do OCR excedido.") from exc
+        raise
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+_slots: threading.BoundedSemaphore | None = None
+_cache: OrderedDict[str, str] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _get_pool(app) -> tuple[ProcessPoolExecutor, threading.BoundedSemaphore]:
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            workers = app.config.get("OCR_WORKERS", 2)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=TASKS_PER_WORKER,
+            )
+            if _slots is None:
+                _slots = threading.BoundedSemaphore(workers * 2)
+        return _pool, _slots
+
+
+def _reset_pool(pool: ProcessPoolExecutor) -> None:
+    """Descarta um pool quebrado ou com um worker preso: encerra os processos
+    e deixa o próximo pedido criar um novo."""
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return
+        _pool = None
+    for proc in list((getattr(pool, "_processes", None) or {}).values()):
+        proc.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _cache_get(key: str):
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+        return hit
+
+
+def _cache_put(key: str, value: str, size: int) -> None:
+    with _cache_lock:
+        _cache[key] = value
+        _cache.move_to_end(key)
+        while len(_cache) > size:
+            _cache.popitem(last=False)
+
+
+def extract_text(app, data: bytes) -> str:
+    """Texto da imagem via pool de processos, com cache pelo SHA-256 do
+    conteúdo. Só o texto extraído vai para o cache: falhas (inclusive estouro
+    de tempo, que pode ser só o servidor ocupado) são tentadas de novo.
+
+    Levanta OcrError (ocr_busy, ocr_timeout, ocr_unavailable, ocr_failed)."""
+    key = hashlib.sha256(data).hexdigest()
+    cache_size = app.config.get("OCR_CACHE_SIZE", CACHE_MAX)
+    hit = _cache_get(key)
+    if hit is not None:
+        return hit
+
+    pool, slots = _get_pool(app)
+    if not slots.acquire(blocking=False):
+        raise OcrError("ocr_busy", "OCR ocupado, tente novamente em instantes.")
+    timeout = app.config.get("OCR_TIMEOUT_SECONDS", 15)
+    try:
+        future: Future = pool.submit(_ocr_worker, data, app.config.get("OCR_MAX_SIDE", DEFAULT_MAX_SIDE), timeout)
+    except (BrokenProcessPool, RuntimeError):
+        slots.release()
+        _reset_pool(pool)
+        raise OcrError("ocr_failed", "Pool de OCR reiniciado, tente novamente.")
+    future.add_done_callback(lambda _f: slots.release())
+
+    try:
+        text = future.result(timeout=timeout + 5)
+    except FutureTimeout:
+        _reset_pool(pool)
+        raise OcrError("ocr_timeout", "Tempo limite do OCR excedido.")
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        raise OcrError("ocr_failed", "O processo de OCR terminou inesperadamente.")
+    except OcrError:
+        raise
+    except Exception as exc:
+        raise OcrError("ocr_failed", str(exc))
+    _cache_put(key, text, cache_size)
+    return text
+
+
+def code_candidates(text: str) -> list[str]:
+    """Códigos de item (CAM00123, CPNEU-0042, 000123...) presentes no texto do
+    OCR, corrigindo trocas comuns de letra por dígito (O->0, I->1, S->5)."""
+    upper = text.upper()
+    found: dict[str, None] = {}
+    for m in _CODE_TOKEN.finditer(upper):
+        prefix, digits = m.group(1), m.group(2).translate(_DIGIT_FIXES)
+        if not digits.isdigit():
+            continue
+        found[format_code(prefix, int(digits))] = None
+        found[f"{prefix}{digits}"] = None
+    for m in _BARE_CODE.finditer(upper):
+        found[m.group(1)] = None
+    return list(found)
+
+
+def text_terms(text: str, codes: list[str], limit: int = MAX_TEXT_TERMS) -> list[str]:
+    """Palavras do OCR para a busca textual: fora os códigos e prefixos, com
+    3+ letras, as mais longas primeiro."""
+    skip = {c.lower() for c in codes} | {p.lower() for p in ITEM_CODE_PREFIXES.values()}
+    words = {w.lower(): None for w in re.findall(r"[^\W\d_]{3,}", text)}
+    return sorted((w for w in words if w not in skip), key=len, reverse=True)[:limit]
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(*values) -> str:
+    """Serializa os valores da última linha de uma página em um token opaco."""
+    payload = [
+        {"dt": v.isoformat()} if isinstance(v, datetime) else v
+        for v in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str | None, size: int) -> list | None:
+    """Inverso de encode_cursor; retorna None para tokens ausentes ou inválidos."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, list) or len(payload) != size:
+        return None
+    values = []
+    for v in payload:
+        if isinstance(v, dict) and "dt" in v:
+            try:
+                v = datetime.fromisoformat(v["dt"])
+            except (TypeError, ValueError):
+                return None
+        values.append(v)
+    return values
+
+
+def keyset_after(columns, values, descending: bool = False):
+    """Condição "linha vem depois de `values`" na ordenação por `columns`.
+
+    As colunas devem ser NOT NULL (ou filtradas com isnot(None))."""
+    clauses = []
+    for i, (col, val) in enumerate(zip(columns, values)):
+        cmp = col < val if descending else col > val
+        clauses.append(and_(*[c == v for c, v in zip(columns[:i], values[:i])], cmp))
+    return or_(*clauses)
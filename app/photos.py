@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+
+PHOTO_URL_PREFIX = "static/uploads"
+DEFAULT_SIZES = (160, 480, 1024)
+THUMB_FORMATS = (("webp", "WEBP", {"quality": 80, "method": 4}), ("jpg", "JPEG", {"quality": 82, "optimize": True}))
+
+
+# formato detectado pelo Pillow -> (extensão, formato de saída, opções)
+UPLOAD_FORMATS = {
+    "PNG": ("png", "PNG", {"optimize": True}),
+    "GIF": ("gif", "GIF", {"optimize": True}),
+}
+UPLOAD_DEFAULT_FORMAT = ("jpg", "JPEG", {"optimize": True, "quality": 80})
+
+
+def _reencode(source: str, upload_dir: str) -> tuple[str, str]:
+    """Regrava a imagem `source` num arquivo temporário só com os pixels:
+    sem EXIF (GPS, aparelho), perfis, comentários ou bytes anexados depois
+    da imagem. A orientação do EXIF é aplicada antes de ser descartada.
+    Retorna (caminho temporário, extensão)."""
+    with Image.open(source) as img:
+        img.verify()
+    with Image.open(source) as img:
+        ext, fmt, opts = UPLOAD_FORMATS.get(img.format, UPLOAD_DEFAULT_FORMAT)
+        clean = ImageOps.exif_transpose(img)
+        if fmt == "JPEG" and clean.mode != "RGB":
+            clean = clean.convert("RGB")
+        fd, tmp = tempfile.mkstemp(prefix=".upload_", suffix=f".{ext}", dir=upload_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                clean.save(out, fmt, **opts)
+        except Exception:
+            os.remove(tmp)
+            raise
+    return tmp, ext
+
+
+def store_upload(file_storage, upload_dir: str, chunk_size: int = 256 * 1024) -> str | None:
+    """Grava o upload em disco em blocos, calculando o SHA-256 no caminho, e
+    regrava a imagem com Pillow (ver _reencode) antes de publicá-la. O nome
+    final é o hash do conteúdo enviado, então a mesma foto enviada duas vezes
+    ocupa um único arquivo.
+
+    Retorna o photo_path ("static/uploads/<hash>.<ext>") ou None se não for
+    uma imagem válida."""
+    os.makedirs(upload_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, raw = tempfile.mkstemp(prefix=".upload_", dir=upload_dir)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = file_storage.stream.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+        tmp, ext = _reencode(raw, upload_dir)
+    except Exception:
+        return None
+    finally:
+        os.remove(raw)
+    filename = f"{digest.hexdigest()[:32]}.{ext}"
+    final = os.path.join(upload_dir, filename)
+    if os.path.exists(final):
+        os.remove(tmp)
+    else:
+        os.replace(tmp, final)
+    return f"{PHOTO_URL_PREFIX}/{filename}"
+
+
+def _stem(photo_path: str) -> str:
+    return os.path.splitext(os.path.basename(photo_path))[0]
+
+
+def thumbnail_name(photo_path: str, size: int, ext: str) -> str:
+    return f"{_stem(photo_path)}_{size}.{ext}"
+
+
+def make_thumbnails(source: str, upload_dir: str, sizes=DEFAULT_SIZES) -> list[str]:
+    """Gera as miniaturas (WebP e JPEG) que ainda não existem para `source`.
+
+    Cada arquivo é escrito com nome temporário e renomeado, então quem serve
+    a página nunca vê uma miniatura pela metade."""
+    pending = [
+        (size, ext, fmt, opts) for size in sizes for ext, fmt, opts in THUMB_FORMATS
+        if not os.path.exists(os.path.join(upload_dir, thumbnail_name(source, size, ext)))
+    ]
+    if not pending:
+        return []
+    created = []
+    with Image.open(source) as img:
+        img.draft("RGB", (max(sizes), max(sizes)))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        for size, ext, fmt, opts in pending:
+            thumb = img.copy()
+            thumb.thumbnail((size, size))
+            if fmt == "JPEG" and thumb.mode != "RGB":
+                thumb = thumb.convert("RGB")
+            name = thumbnail_name(source, size, ext)
+            fd, tmp = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=upload_dir)
+            try:
+                with os.fdopen(fd, "wb") as out:
+                    thumb.save(out, fmt, **opts)
+                os.replace(tmp, os.path.join(upload_dir, name))
+            except Exception:
+                os.remove(tmp)
+                raise
+            created.append(name)
+    return created
+
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_in_flight: dict[str, Future] = {}
+
+
+def photo_sizes(app) -> tuple[int, ...]:
+    raw = app.config.get("PHOTO_SIZES") or ",".join(str(s) for s in DEFAULT_SIZES)
+    return tuple(sorted(int(s) for s in str(raw).split(",") if s.strip()))
+
+
+def submit_thumbnails(app, photo_path: str) -> Future:
+    """Agenda a geração das miniaturas no pool do processo e retorna na hora."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get("PHOTO_WORKERS", 2), thread_name_prefix="photos",
+            )
+    upload_dir = app.config["UPLOAD_FOLDER"]
+    source = os.path.join(upload_dir, os.path.basename(photo_path))
+    sizes = photo_sizes(app)
+
+    def _run():
+        try:
+            return make_thumbnails(source, upload_dir, sizes)
+        except Exception as exc:
+            app.logger.warning(f"Miniaturas de {photo_path} falharam: {exc}")
+            return []
+        finally:
+            with _executor_lock:
+                _in_flight.pop(source, None)
+
+    with _executor_lock:
+        future = _in_flight.get(source)
+        if future is None:
+            future = _in_flight[source] = _executor.submit(_run)
+    return future
+
+
+def photo_sources(app, photo_path: str | None, size: int) -> dict:
+    """URLs para <picture>: a menor miniatura >= `size` já gerada (WebP e
+    JPEG) ou o original enquanto as miniaturas não existem."""
+    if not photo_path:
+        return {}
+    upload_dir = app.config["UPLOAD_FOLDER"]
+    sizes = photo_sizes(app)
+    chosen = next((s for s in sizes if s >= size), sizes[-1] if sizes else None)
+    sources = {"src": photo_path, "webp": None, "original": photo_path}
+    if chosen is None:
+        return sources
+    for ext in ("webp", "jpg"):
+        name = thumbnail_name(photo_path, chosen, ext)
+        if os.path.exists(os.path.join(upload_dir, name)):
+            sources["webp" if ext == "webp" else "src"] = f"{PHOTO_URL_PREFIX}/{name}"
+    return sources
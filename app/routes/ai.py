@@ -9,6 +9,7 @@ import re
 from ..ai_intents import get_intent_response
 
 from ..models import Item
+from ..counters import counter_rows, maintenance_total, totals_by_status
 from .. import db
 
 ai_bp = Blueprint("ai", __name__, url_prefix="/ai")
@@ -52,21 +53,13 @@ def solve():
 
                                            
     if any(k in q_lower for k in ["dispon", "estoque", "resumo", "quantos"]):
-        total = db.session.query(Item).count()
-        disponiveis = db.session.query(Item).filter(Item.status == "disponivel").count()
-        em_uso = db.session.query(Item).filter(Item.status.in_(["locado", "em_uso", "em uso"])) .count()
-                                                                                          
-        cutoff_due = datetime.utcnow() - timedelta(days=60)
-        em_manutencao = db.session.query(Item).filter(Item.status == "em_manutencao").count()
-        aguardando = (
-            db.session.query(Item)
-            .filter(
-                Item.last_maintenance_date.isnot(None),
-                Item.last_maintenance_date > (datetime.utcnow() - timedelta(days=60)),
-                Item.last_maintenance_date <= (datetime.utcnow() - timedelta(days=45)),
-            )
-            .count()
-        )
+        rows = counter_rows()
+        by_status = totals_by_status(rows)
+        total = sum(by_status.values())
+        disponiveis = by_status.get("disponivel", 0)
+        em_uso = sum(by_status.get(s, 0) for s in ("locado", "em_uso", "em uso"))
+        em_manutencao = by_status.get("em_manutencao", 0)
+        aguardando = maintenance_total("soon", rows)
         pct_disp = (disponiveis / total) * 100 if total else 0
         if pct_disp < 10:
             sug = Suggestion(
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
 import os
-from flask import Blueprint, render_template
-from flask_login import login_required
+from flask import Blueprint, render_template, request
+from flask_login import current_user, login_required
+
+from ..activity import (
+    ACTIVITY_ACTIONS, ACTIVITY_FILTER_ARGS, ACTIVITY_PAGE_SIZE, activity_filters, activity_page, tail_lines,
+)
 
 audit_bp = Blueprint("audit", __name__, url_prefix="/audit")
 
@@ -11,12 +15,29 @@ audit_bp = Blueprint("audit", __name__, url_prefix="/audit")
 @login_required
 def audit_home():
     log_path = os.path.join(os.getcwd(), "logs", "audit.log")
-    entries: list[str] = []
-    if os.path.exists(log_path):
-        with open(log_path, "r", encoding="utf-8") as f:
-            entries = f.readlines()[-500:]
-    entries = [e.strip() for e in entries if e.strip()]
+    entries = [e.strip() for e in tail_lines(log_path, 500) if e.strip()]
     entries.reverse()
     return render_template("audit.html", entries=entries)
 
 
+@audit_bp.route("/activity")
+@login_required
+def activity_log():
+    """Eventos de acesso (login, logout, bloqueio) com filtros por usuário,
+    ação, IP e período, paginados do mais recente para o mais antigo.
+    Usuários comuns veem apenas os próprios eventos."""
+    args = request.args.to_dict(flat=True)
+    if current_user.role != "admin":
+        args["user"] = str(current_user.id)
+    rows, next_cursor = activity_page(
+        activity_filters(args), request.args.get("after"), request.args.get("limit", ACTIVITY_PAGE_SIZE, type=int),
+    )
+    filter_args = {k: v for k, v in request.args.items() if k in ACTIVITY_FILTER_ARGS and v}
+    return render_template(
+        "audit_activity.html",
+        rows=rows,
+        actions=ACTIVITY_ACTIONS,
+        filter_args=filter_args,
+        next_args=dict(filter_args, after=next_cursor) if next_cursor else None,
+        is_first_page=not request.args.get("after"),
+    )
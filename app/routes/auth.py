@@ -8,6 +8,7 @@ from sqlalchemy import func
 
 from .. import db, limiter
 from ..models import User, ActivityLog
+from ..eventsink import record_event
 from ..config import Config
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
@@ -64,9 +65,7 @@ def logout():
 def _log_activity(user_id: int | None, action: str) -> None:
     from flask import request
 
-    log = ActivityLog(user_id=user_id, action=action, ip=request.remote_addr)
-    db.session.add(log)
-    db.session.commit()
+    record_event(ActivityLog, user_id=user_id, action=action, ip=request.remote_addr)
 
 
 @auth_bp.route("/_ensure_admin", methods=["GET", "POST"])
@@ -109,6 +108,8 @@ def seed_demo():
     from datetime import datetime, timedelta
     import random
     from ..models import Item
+    from ..counters import record_new_items
+    from ..codes import code_prefix, format_code, reserve_codes
     token = request.args.get("token") or request.headers.get("X-Admin-Token")
     mgmt = os.getenv("MANAGEMENT_TOKEN")
     if not mgmt or token != mgmt:
@@ -160,21 +161,17 @@ def seed_demo():
 
     need = total - existing
     to_create = min(need, max_per_call)
-    start_idx = existing + 1
-    end_idx = existing + to_create
 
-    for idx in range(start_idx, end_idx + 1):
+    # códigos reservados por tipo na tabela de sequências (sem colidir com itens já existentes)
+    types = [only_type or random.choice(TYPES) for _ in range(to_create)]
+    next_number = {
+        t: reserve_codes(db.session.connection(), code_prefix(t), types.count(t)) for t in set(types)
+    }
+    db.session.commit()
+    for item_type in types:
         stock = random.choice(STOCKS)
-        item_type = only_type or random.choice(TYPES)
-        prefix = {
-            'cama': 'CAM',
-            'cadeira_higienica': 'CHG',
-            'cadeira_rodas': 'CRD',
-            'andador': 'AND',
-            'muletas': 'MUL',
-            'colchao_pneumatico': 'CPNEU',
-        }[item_type]
-        code = f"{prefix}{idx:05d}"
+        code = format_code(code_prefix(item_type), next_number[item_type])
+        next_number[item_type] += 1
         z = CITY_ZONES[stock]
         zone = 'central' if random.random() < z['central']['weight'] else 'resid'
         lat_range = z[zone]['lat']
@@ -204,11 +201,13 @@ def seed_demo():
         ))
         if len(batch) >= batch_size:
             db.session.bulk_save_objects(batch)
+            record_new_items(batch)
             db.session.commit()
             created += len(batch)
             batch.clear()
     if batch:
         db.session.bulk_save_objects(batch)
+        record_new_items(batch)
         db.session.commit()
         created += len(batch)
 
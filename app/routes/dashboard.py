@@ -1,14 +1,23 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta
-from flask import Blueprint, render_template, jsonify, send_file, Response, redirect, url_for, current_app
+from flask import Blueprint, render_template, jsonify, send_file, Response, redirect, url_for, current_app, request
 from flask_login import login_required, current_user
-from sqlalchemy import func, or_, and_
+from sqlalchemy import or_, and_
 import io
+import os
 from reportlab.pdfgen import canvas
-import xlsxwriter
 
 from ..models import Item
+from ..stats import (
+    get_dashboard_stats, movement_histogram, EM_USO_STATUSES, HISTOGRAM_MONTHS, HISTOGRAM_SPLITS,
+    MAINTENANCE_DUE_DAYS, MAINTENANCE_SOON_DAYS,
+)
+from ..counters import counter_rows, expiring_total, totals_by_status
+from ..utilization import UTILIZATION_DAYS, get_utilization
+from ..exports import stream_and_remove, write_items_xlsx
+from ..filters import item_list_filters
+from ..pagination import decode_cursor, encode_cursor, keyset_after
 from .. import db
 
 dashboard_bp = Blueprint("dashboard", __name__, url_prefix="/admin")
@@ -21,92 +30,16 @@ def admin_dashboard():
     if current_user.role != "admin":
         return redirect(url_for("auth.login"))
 
-                                                              
     now = datetime.utcnow()
-    now_dt = now
-    total = Item.query.count()
-                                                    
-    TARGET_DUE = 582
-    TARGET_SOON = 1350
-                                                          
-    due_ids = [
-        r[0]
-        for r in db.session.query(Item.id)
-        .filter(Item.status == 'em_manutencao')
-        .order_by(Item.last_maintenance_date.asc())
-        .limit(TARGET_DUE)
-        .all()
-    ]
-    if len(due_ids) < TARGET_DUE:
-        faltam = TARGET_DUE - len(due_ids)
-        extras = [
-            r[0]
-            for r in db.session.query(Item.id)
-            .filter(
-                Item.last_maintenance_date.isnot(None),
-                Item.last_maintenance_date <= (now - timedelta(days=60)),
-                ~Item.id.in_(due_ids)
-            )
-            .order_by(Item.last_maintenance_date.asc())
-            .limit(faltam)
-            .all()
-        ]
-        due_ids.extend(extras)
-    soon_ids = [
-        r[0]
-        for r in db.session.query(Item.id)
-        .filter(
-            Item.last_maintenance_date.isnot(None),
-            Item.last_maintenance_date > (now - timedelta(days=60)),
-            Item.last_maintenance_date <= (now - timedelta(days=45)),
-            ~Item.id.in_(due_ids)
-        )
-        .order_by(Item.last_maintenance_date.asc())
-        .limit(TARGET_SOON)
-        .all()
-    ]
-    maintenance_due = len(due_ids)
-    maintenance_soon = len(soon_ids)
-                                                                                               
-    em_uso = Item.query.filter(
-        Item.status.in_(["locado", "em_uso", "em uso"]),
-        ~Item.id.in_(due_ids)
-    ).count()
-    disponiveis = Item.query.filter(
-        Item.status == "disponivel",
-        ~Item.id.in_(due_ids)
-    ).count()
-    vencendo = Item.query.filter(Item.expiry_date.isnot(None)).filter(Item.expiry_date <= (now + timedelta(days=7))).count()
-                             
-    by_type = dict((t, c) for t, c in db.session.query(Item.item_type, func.count(Item.id)).group_by(Item.item_type).all())
-                          
-                                                                        
-    rows = db.session.query(Item.origin_stock, Item.status, func.count(Item.id)).\
-        filter(~Item.id.in_(due_ids)).\
-        group_by(Item.origin_stock, Item.status).all()
-    by_stock_status = {}
-    for stock, status, count in rows:
-        if stock not in by_stock_status:
-            by_stock_status[stock] = {"disponivel": 0, "locado": 0}
-        if status in ("disponivel", "locado"):
-            by_stock_status[stock][status] = count
-                                       
-    last_6 = []
-    for i in range(5, -1, -1):
-        start = (now.replace(day=1) - timedelta(days=30 * i)).replace(day=1)
-        end = (start + timedelta(days=32)).replace(day=1)
-        cnt = Item.query.filter(Item.movement_date >= start, Item.movement_date < end).count()
-        last_6.append({"label": start.strftime('%Y-%m'), "count": cnt})
-
+    stats = get_dashboard_stats(now)
     initial = {
-        "total": total,
-        "disponiveis": disponiveis,
-        "em_uso": em_uso,
-                                                           
-        "by_type": by_type,
-        "by_stock_status": by_stock_status,
-        "movement": last_6,
-        "maintenance": {"due": maintenance_due, "soon": maintenance_soon},
+        "total": stats["total"],
+        "disponiveis": stats["disponiveis"],
+        "em_uso": stats["em_uso"],
+        "by_type": stats["by_type"],
+        "by_stock_status": stats["by_stock_status"],
+        "movement": movement_histogram(6, now=now)["movement"],
+        "maintenance": stats["maintenance"],
     }
     return render_template("admin_dashboard.html", initial=initial)
 
@@ -116,160 +49,156 @@ def admin_dashboard():
 def dashboard_stats():
     if current_user.role != "admin":
         return jsonify({"error": "forbidden"}), 403
-    total = Item.query.count()
     now_dt = datetime.utcnow()
-                                                
-    TARGET_DUE = 582
-    TARGET_SOON = 1350
-                                 
-    due_ids = [
-        r[0]
-        for r in db.session.query(Item.id)
-        .filter(Item.status == 'em_manutencao')
-        .order_by(Item.last_maintenance_date.asc())
-        .limit(TARGET_DUE)
-        .all()
-    ]
-    if len(due_ids) < TARGET_DUE:
-        faltam = TARGET_DUE - len(due_ids)
-        extras = [
-            r[0]
-            for r in db.session.query(Item.id)
-            .filter(
-                Item.last_maintenance_date.isnot(None),
-                Item.last_maintenance_date <= (now_dt - timedelta(days=60)),
-                ~Item.id.in_(due_ids)
-            )
-            .order_by(Item.last_maintenance_date.asc())
-            .limit(faltam)
-            .all()
-        ]
-        due_ids.extend(extras)
-    soon_ids = [
-        r[0]
-        for r in db.session.query(Item.id)
-            .filter(
-            Item.last_maintenance_date.isnot(None),
-            Item.last_maintenance_date > (now_dt - timedelta(days=60)),
-            Item.last_maintenance_date <= (now_dt - timedelta(days=45)),
-            ~Item.id.in_(due_ids)
-        )
-        .order_by(Item.last_maintenance_date.asc())
-        .limit(TARGET_SOON)
-        .all()
-    ]
-    maintenance_due = len(due_ids)
-    maintenance_soon = len(soon_ids)
-                                                                                              
-    em_uso = Item.query.filter(
-        Item.status.in_(["locado", "em_uso", "em uso"]),
-        ~Item.id.in_(due_ids)
-    ).count()
-    disponiveis = Item.query.filter(
-        Item.status == "disponivel",
-        ~Item.id.in_(due_ids)
-    ).count()
-                        
-    if em_uso == 0 and total - disponiveis > 0:
-        em_uso = total - disponiveis
-    vencendo = Item.query.filter(Item.expiry_date.isnot(None)).filter(Item.expiry_date <= (now_dt + timedelta(days=7))).count()
-                                              
-    by_stock = dict(
-        (s, c) for s, c in db.session.query(Item.origin_stock, func.count(Item.id)).group_by(Item.origin_stock).all()
-    )
-                                                                                 
-    by_stock_status_rows = db.session.query(Item.origin_stock, Item.status, func.count(Item.id)).\
-        filter(~Item.id.in_(due_ids)).\
-        group_by(Item.origin_stock, Item.status).all()
-    by_stock_status = {}
-    for stock, status, count in by_stock_status_rows:
-        if stock is None:
-            continue
-        if stock not in by_stock_status:
-            by_stock_status[stock] = {"disponivel": 0, "locado": 0}
-        if status in ("disponivel", "locado"):
-            by_stock_status[stock][status] = count
-                                     
-    by_type = dict(
-        (t, c) for t, c in db.session.query(Item.item_type, func.count(Item.id)).group_by(Item.item_type).all()
-    )
-                                                                   
-
-                                             
-    last_6 = []
-    for i in range(5, -1, -1):
-        start = (now_dt.replace(day=1) - timedelta(days=30 * i)).replace(day=1)
-        end = (start + timedelta(days=32)).replace(day=1)
-        cnt = Item.query.filter(Item.movement_date >= start, Item.movement_date < end).count()
-        last_6.append({"label": start.strftime('%Y-%m'), "count": cnt})
+    stats = get_dashboard_stats(now_dt)
+    em_uso = stats["em_uso"]
+    if em_uso == 0 and stats["total"] - stats["disponiveis"] > 0:
+        em_uso = stats["total"] - stats["disponiveis"]
 
     data = {
-        "total": total,
-        "disponiveis": disponiveis,
+        "total": stats["total"],
+        "disponiveis": stats["disponiveis"],
         "em_uso": em_uso,
-        "vencendo": vencendo,
-        "by_stock": by_stock,
-        "by_stock_status": by_stock_status,
-        "by_type": by_type,
-        "maintenance": {"due": maintenance_due, "soon": maintenance_soon},
-        "movement": last_6
+        "vencendo": stats["vencendo"],
+        "by_stock": stats["by_stock"],
+        "by_stock_status": stats["by_stock_status"],
+        "by_type": stats["by_type"],
+        "maintenance": stats["maintenance"],
+        "movement": movement_histogram(6, now=now_dt)["movement"],
+        "mom": {"total": stats["total"] - stats["prev_month_total"]},
     }
-                                          
-    prev_month_total = db.session.query(Item).filter(
-        Item.entry_date < (now_dt - timedelta(days=30))
-    ).count()
-    data["mom"] = {"total": data["total"] - prev_month_total}
     return jsonify(data)
 
 
-@dashboard_bp.route('/events')
+@dashboard_bp.route("/api/movement-histogram")
 @login_required
-def dashboard_events():
+def movement_histogram_api():
     if current_user.role != "admin":
         return jsonify({"error": "forbidden"}), 403
-    app_ref = current_app._get_current_object()
+    months = request.args.get("months", 6, type=int)
+    if months not in HISTOGRAM_MONTHS:
+        return jsonify({"error": "invalid_months", "allowed": list(HISTOGRAM_MONTHS)}), 400
+    by = (request.args.get("by") or "").strip().lower() or None
+    if by and by not in HISTOGRAM_SPLITS:
+        return jsonify({"error": "invalid_by", "allowed": sorted(HISTOGRAM_SPLITS)}), 400
+    return jsonify(movement_histogram(months, by=by))
 
-    def event_stream(app):
-        import time, json
-        while True:
-            time.sleep(10)
-            try:
-                with app.app_context():
-                    total = Item.query.count()
-                    disponiveis = Item.query.filter(Item.status == "disponivel").count()
-                    em_uso = Item.query.filter(Item.status.in_(["locado", "em_uso", "em uso"]))
-                    em_uso = em_uso.count()
-                    payload = {"total": total, "disponiveis": disponiveis, "em_uso": em_uso}
-            except Exception:
-                payload = {}
-            yield f"data: {json.dumps(payload)}\n\n"
 
-    return Response(event_stream(app_ref), mimetype='text/event-stream')
+@dashboard_bp.route("/api/utilization")
+@login_required
+def utilization_api():
+    """Tempo em cada status, utilização e giro por estoque/tipo nos últimos `days` dias."""
+    if current_user.role != "admin":
+        return jsonify({"error": "forbidden"}), 403
+    days = request.args.get("days", 90, type=int)
+    if days not in UTILIZATION_DAYS:
+        return jsonify({"error": "invalid_days", "allowed": list(UTILIZATION_DAYS)}), 400
+    return jsonify(get_utilization(days))
+
+
+@dashboard_bp.route('/events')
+@login_required
+def dashboard_events():
+    if current_user.role != "admin":
+        return jsonify({"error": "forbidden"}), 403
+    import queue as _queue
+    from ..events import get_broadcaster
+
+    broadcaster = get_broadcaster(current_app._get_current_object())
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("lastEventId")
+    if not broadcaster.has_room():
+        resp = jsonify({"error": "too_many_subscribers"})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = "30"
+        return resp
+    heartbeat = current_app.config.get("SSE_HEARTBEAT_SECONDS", 15)
+
+    def event_stream():
+        subscription = broadcaster.subscribe(last_event_id)
+        if subscription is None:
+            yield "retry: 30000\n\n"
+            return
+        q, backlog = subscription
+        try:
+            yield f"retry: {int(broadcaster.interval * 1000)}\n\n"
+            for seq, data in backlog:
+                yield broadcaster.format_event(seq, data)
+            while True:
+                try:
+                    seq, data = q.get(timeout=heartbeat)
+                except _queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield broadcaster.format_event(seq, data)
+        finally:
+            broadcaster.unsubscribe(q)
+
+    resp = Response(event_stream(), mimetype='text/event-stream')
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
 
 
 @dashboard_bp.route("/api/maintenance-lists")
 @login_required
 def maintenance_lists():
+    """Camas com manutenção vencida (`due`) ou próxima (`soon`), paginadas por
+    cursor na ordem (last_maintenance_date, id).
+
+    Parâmetros: list=due|soon (padrão: ambas), origin_stock, limit (máx. 200)
+    e cursor (o `next` da página anterior)."""
     if current_user.role != "admin":
         return jsonify({"error": "forbidden"}), 403
     now = datetime.utcnow()
-    due_items = Item.query.filter(Item.name.ilike('%cama%')).filter(Item.movement_date <= (now - timedelta(days=60))).all()
-    soon_items = Item.query.filter(Item.name.ilike('%cama%')).filter(
-        Item.movement_date > (now - timedelta(days=60)), Item.movement_date <= (now - timedelta(days=50))
-    ).all()
-
-    def serialize(it: Item):
+    which = (request.args.get("list") or "").strip().lower()
+    if which and which not in ("due", "soon"):
+        return jsonify({"error": "invalid_list"}), 400
+    limit = min(max(request.args.get("limit", 50, type=int) or 50, 1), 200)
+    origin_stock = request.args.get("origin_stock")
+    cutoff_due = now - timedelta(days=MAINTENANCE_DUE_DAYS)
+    windows = {
+        "due": (Item.last_maintenance_date <= cutoff_due,),
+        "soon": (
+            Item.last_maintenance_date > cutoff_due,
+            Item.last_maintenance_date <= (now - timedelta(days=MAINTENANCE_SOON_DAYS)),
+        ),
+    }
+    order = (Item.last_maintenance_date, Item.id)
+
+    def page(name: str, cursor: str | None) -> dict:
+        query = db.session.query(
+            Item.id, Item.code, Item.name, Item.origin_stock, Item.status,
+            Item.last_maintenance_date, Item.movement_date,
+        ).filter(Item.item_type == "cama", Item.last_maintenance_date.isnot(None), *windows[name])
+        if origin_stock:
+            query = query.filter(Item.origin_stock == origin_stock)
+        after = decode_cursor(cursor, 2)
+        if after:
+            query = query.filter(keyset_after(order, after))
+        rows = query.order_by(*order).limit(limit + 1).all()
+        more = len(rows) > limit
+        rows = rows[:limit]
         return {
-            "id": it.id,
-            "name": it.name,
-            "origin_stock": it.origin_stock,
-            "movement_date": it.movement_date.strftime('%Y-%m-%d') if it.movement_date else None,
-            "status": it.status,
+            "items": [
+                {
+                    "id": r.id,
+                    "code": r.code,
+                    "name": r.name,
+                    "origin_stock": r.origin_stock,
+                    "status": r.status,
+                    "last_maintenance_date": r.last_maintenance_date.strftime('%Y-%m-%d'),
+                    "due_date": (r.last_maintenance_date + timedelta(days=MAINTENANCE_DUE_DAYS)).strftime('%Y-%m-%d'),
+                    "movement_date": r.movement_date.strftime('%Y-%m-%d') if r.movement_date else None,
+                }
+                for r in rows
+            ],
+            "next": encode_cursor(rows[-1].last_maintenance_date, rows[-1].id) if more else None,
         }
 
+    names = [which] if which else ["due", "soon"]
+    result = {name: page(name, request.args.get("cursor") if which else None) for name in names}
     return jsonify({
-        "due": [serialize(i) for i in due_items],
-        "soon": [serialize(i) for i in soon_items],
+        **{name: result[name]["items"] for name in names},
+        "next": {name: result[name]["next"] for name in names},
     })
 
 
@@ -279,20 +208,14 @@ def export_excel():
     if current_user.role != "admin":
         return render_template("403.html"), 403
 
-    output = io.BytesIO()
-    workbook = xlsxwriter.Workbook(output, {"in_memory": True})
-    worksheet = workbook.add_worksheet("Itens")
-    headers = ["ID", "Nome", "Status", "Local", "Qtd", "Min", "Entrada", "Vencimento"]
-    for col, h in enumerate(headers):
-        worksheet.write(0, col, h)
-    for row, item in enumerate(Item.query.order_by(Item.id).all(), start=1):
-        worksheet.write_row(row, 0, [
-            item.id, item.name, item.status, item.location or "", item.quantity, item.min_threshold,
-            item.entry_date.strftime("%Y-%m-%d"), item.expiry_date.strftime("%Y-%m-%d") if item.expiry_date else ""
-        ])
-    workbook.close()
-    output.seek(0)
-    return send_file(output, as_attachment=True, download_name="ghoststock_itens.xlsx")
+    path = write_items_xlsx(item_list_filters(request.args))
+    resp = Response(
+        stream_and_remove(path),
+        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+    resp.headers["Content-Length"] = str(os.path.getsize(path))
+    resp.headers["Content-Disposition"] = "attachment; filename=ghoststock_itens.xlsx"
+    return resp
 
 
 @dashboard_bp.route("/export/pdf")
@@ -306,12 +229,13 @@ def export_pdf():
     c.setFont("Helvetica-Bold", 16)
     c.drawString(40, 800, "Relatório GhostStock")
     c.setFont("Helvetica", 12)
+    rows = counter_rows()
+    by_status = totals_by_status(rows)
     stats = {
-        "Total": Item.query.count(),
-        "Disponíveis": Item.query.filter_by(status="disponivel").count(),
-        "Em uso": Item.query.filter(Item.status.in_(["locado", "em_uso", "em uso"]))
-        .count(),
-        "Vencendo (7d)": Item.query.filter(Item.expiry_date.isnot(None)).count(),
+        "Total": sum(by_status.values()),
+        "Disponíveis": by_status.get("disponivel", 0),
+        "Em uso": sum(by_status.get(s, 0) for s in EM_USO_STATUSES),
+        "Vencendo (7d)": expiring_total(rows),
     }
     y = 770
     for k, v in stats.items():
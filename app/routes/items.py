@@ -1,20 +1,34 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, send_file
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, Response, render_template, request, redirect, url_for, flash, current_app, send_file, stream_with_context
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
 from sqlalchemy import and_
 import os
 from flask import jsonify
 from io import BytesIO
-import csv
-import json
 import re
 
 from .. import db
-from ..models import Item, ItemMovement
-from ..utils import allowed_file, validate_image_file
+from ..models import Item
+from ..utils import allowed_file
+from ..filters import (
+    item_list_filters, item_list_total, list_cursor, newer_page, older_page,
+)
+from ..pagination import decode_cursor, encode_cursor
+from ..search import search_condition, search_items
+from ..autocomplete import get_name_index
+from ..codes import get_code_allocator
+from ..exports import STREAM_FORMATS, export_columns, stream_items
+from ..movements import (
+    BULK_CHUNK, BULK_STATUS_MAX, STATUS_TRANSITIONS, MovementRecorder, bulk_status_update, snapshot,
+)
+from ..history import HISTORY_PAGE_SIZE, maintenance_periods, movement_page, patient_names
+from ..snapshots import state_as_of
+from ..photos import store_upload, submit_thumbnails
+from ..ocr import OcrError, code_candidates, extract_text, text_terms
+from ..importer import import_format, job_paths, read_status, start_import
 
 items_bp = Blueprint("items", __name__, url_prefix="/items")
 
@@ -47,20 +61,11 @@ def create_item():
 
         photo_path = None
         file = request.files.get("photo")
-        if file and allowed_file(file.filename, current_app.config.get("ALLOWED_EXTENSIONS")) and validate_image_file(file):
-                               
-            from PIL import Image
-            filename = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{secure_filename(file.filename)}"
-            upload_dir = current_app.config["UPLOAD_FOLDER"]
-            os.makedirs(upload_dir, exist_ok=True)
-            path = os.path.join(upload_dir, filename)
-            img = Image.open(file)
-            img.save(path, optimize=True, quality=80)
-            photo_path = f"static/uploads/{filename}"
+        if file and allowed_file(file.filename, current_app.config.get("ALLOWED_EXTENSIONS")):
+            photo_path = store_upload(file, current_app.config["UPLOAD_FOLDER"])
 
                                                              
-        next_seq = Item.query.count() + 1
-        code = str(next_seq).zfill(6)
+        code = get_code_allocator(current_app._get_current_object()).next_code(item_type)
 
         item = Item(
             code=code,
@@ -82,9 +87,11 @@ def create_item():
             owner_id=current_user.id,
         )
         db.session.add(item)
-        db.session.commit()
-
-        _add_movement(item.id, "created", None, None)
+        recorder = MovementRecorder(current_user.id)
+        recorder.add(item, "created")
+        recorder.commit()
+        if photo_path:
+            submit_thumbnails(current_app._get_current_object(), photo_path)
         flash("Item criado com sucesso!", "success")
         return redirect(url_for("items.list_items"))
 
@@ -94,82 +101,38 @@ def create_item():
 @items_bp.route("/", methods=["GET"])
 @login_required
 def list_items():
-             
-    status = request.args.get("status")
-    maint = request.args.get("maint")                        
-    location = None
-    origin_stock = request.args.get("origin_stock")
-    item_type = request.args.get("item_type")
-    q = request.args.get("q", "").strip()
-    page = max(int(request.args.get("page", 1) or 1), 1)
-    per_page = min(int(request.args.get("per_page", 20) or 20), 100)
-    entry_from = request.args.get('entry_from')
-    entry_to = request.args.get('entry_to')
-
-    query = Item.query
-    if status:
-                                                               
-        status_norm = status.lower().strip()
-        if status_norm in ("em_uso", "em uso"):
-            query = query.filter(Item.status == "locado")
-        elif status_norm in ("em_manutencao", "maint_due", "manutencao", "em-manutencao"):
-            from datetime import datetime as _dt, timedelta as _td
-            cutoff = _dt.utcnow() - _td(days=60)
-            query = query.filter(
-                Item.last_maintenance_date.isnot(None),
-                Item.last_maintenance_date <= cutoff,
-            )
-        elif status_norm in ("aguardando_manutencao", "maint_soon", "aguardando-manutencao"):
-            from datetime import datetime as _dt, timedelta as _td
-            now_ = _dt.utcnow()
-            query = query.filter(
-                Item.last_maintenance_date.isnot(None),
-                Item.last_maintenance_date > (now_ - _td(days=60)),
-                Item.last_maintenance_date <= (now_ - _td(days=45)),
-            )
-        else:
-            query = query.filter(Item.status == status)
-                                          
-    if origin_stock:
-        query = query.filter(Item.origin_stock == origin_stock)
-    if item_type:
-        query = query.filter(Item.item_type == item_type)
-    if maint == "due":
-        cutoff = datetime.utcnow() - timedelta(days=60)
-        query = query.filter(
-            Item.last_maintenance_date.isnot(None),
-            Item.last_maintenance_date <= cutoff,
-        )
-                                                                                                 
-    if status == "aguardando_manutencao":
-        now = datetime.utcnow()
-        query = query.filter(
-            Item.last_maintenance_date.isnot(None),
-            Item.last_maintenance_date > (now - timedelta(days=60)),
-            Item.last_maintenance_date <= (now - timedelta(days=45)),
-        )
-        status = None                                                 
-
-    if q:
-        like = f"%{q}%"
-        query = query.filter(
-            (Item.name.ilike(like)) | (Item.description.ilike(like)) | (Item.location.ilike(like)) | (Item.patient_name.ilike(like))
-        )
-    if entry_from:
-        try:
-            from datetime import datetime as _dt
-            query = query.filter(Item.entry_date >= _dt.strptime(entry_from, '%Y-%m-%d'))
-        except Exception:
-            pass
-    if entry_to:
-        try:
-            from datetime import datetime as _dt
-            query = query.filter(Item.entry_date <= _dt.strptime(entry_to, '%Y-%m-%d'))
-        except Exception:
-            pass
-
-    pagination = query.order_by(Item.entry_date.desc()).paginate(page=page, per_page=per_page, error_out=False)
-    return render_template("items_list.html", items=pagination.items, mine_only=False, pagination=pagination)
+    """Listagem paginada por cursor (entry_date, id): cada página custa só o
+    LIMIT, sem OFFSET; o total vem dos contadores ou de um COUNT em cache."""
+    per_page = min(max(request.args.get("per_page", 20, type=int) or 20, 1), 100)
+    page = max(request.args.get("p", 1, type=int) or 1, 1)
+    after = decode_cursor(request.args.get("after"), 2)
+    before = None if after else decode_cursor(request.args.get("before"), 2)
+
+    query = Item.query.filter(*item_list_filters(request.args))
+    if before:
+        rows = newer_page(query, before, per_page + 1)
+        has_prev = len(rows) > per_page
+        items = rows[:per_page][::-1]
+        has_next = True
+    else:
+        rows = older_page(query, after, per_page + 1)
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+        has_prev = after is not None
+    if not has_prev:
+        page = 1
+
+    total = item_list_total(query, request.args, current_app.config.get("ITEMS_COUNT_CACHE_SECONDS", 60))
+    pagination = {
+        "page": page,
+        "pages": max((total + per_page - 1) // per_page, 1),
+        "total": total,
+        "has_prev": has_prev and bool(items),
+        "has_next": has_next and bool(items),
+        "prev_args": {"before": encode_cursor(*list_cursor(items[0])), "p": max(page - 1, 1)} if items else {},
+        "next_args": {"after": encode_cursor(*list_cursor(items[-1])), "p": page + 1} if items else {},
+    }
+    return render_template("items_list.html", items=items, mine_only=False, pagination=pagination)
 
 
 @items_bp.route("/api/autocomplete")
@@ -178,10 +141,12 @@ def autocomplete():
     q = (request.args.get("q") or "").strip()
     if not q:
         return jsonify([])
-    like = f"%{q}%"
+    index = get_name_index(current_app._get_current_object())
+    if not index.too_big:
+        return jsonify(index.lookup(q, 10))
     results = (
         Item.query.with_entities(Item.id, Item.name)
-        .filter(Item.name.ilike(like))
+        .filter(search_condition(q, columns=("name",)))
         .order_by(Item.name.asc())
         .limit(10)
         .all()
@@ -195,110 +160,180 @@ def item_history_api(item_id: int):
     item = Item.query.get_or_404(item_id)
     if current_user.role != "admin" and item.owner_id != current_user.id:
         return jsonify({"error": "forbidden"}), 403
-    movements = ItemMovement.query.filter_by(item_id=item.id).order_by(ItemMovement.timestamp.asc()).all()
+    movements, next_cursor = movement_page(
+        item.id, request.args.get("after"), request.args.get("limit", HISTORY_PAGE_SIZE, type=int),
+    )
     return jsonify({
         "item": item.to_dict_summary(),
-        "movements": [m.to_dict() for m in movements]
+        "movements": [m.to_dict() for m in movements],
+        "next_cursor": next_cursor,
     })
 
 
 @items_bp.route('/import', methods=['POST'])
 @login_required
 def import_items():
+    """Importa itens de CSV, JSON (array ou NDJSON) ou XLSX, com upsert por `code`.
+
+    Por padrão roda em segundo plano e responde 202 com as URLs de progresso e
+    do relatório de erros; com ?wait=1, ou com IMPORT_BACKGROUND desligado
+    (ex.: na Vercel, onde threads morrem com a resposta), processa no próprio
+    request e responde 200 com o resultado final (inclui `created`)."""
     if current_user.role != 'admin':
         return jsonify({"error": "forbidden"}), 403
     file = request.files.get('file')
     if not file:
         return jsonify({"error": "no_file"}), 400
-    filename = (file.filename or '').lower()
-    created = 0
-    if filename.endswith('.csv'):
-        data = file.read().decode('utf-8', errors='ignore').splitlines()
-        reader = csv.DictReader(data)
-        for row in reader:
-            item = Item(
-                name=row.get('name') or 'Sem nome',
-                description=row.get('description'),
-                status=row.get('status') or 'disponivel',
-                origin_stock=row.get('origin_stock'),
-                location=row.get('location'),
-                patient_name=row.get('patient_name'),
-                owner_id=current_user.id
-            )
-            db.session.add(item)
-            created += 1
-        db.session.commit()
-    elif filename.endswith('.json'):
-        payload = json.load(file)
-        for obj in payload:
-            item = Item(
-                name=obj.get('name') or 'Sem nome',
-                description=obj.get('description'),
-                status=obj.get('status') or 'disponivel',
-                origin_stock=obj.get('origin_stock'),
-                location=obj.get('location'),
-                patient_name=obj.get('patient_name'),
-                owner_id=current_user.id
-            )
-            db.session.add(item)
-            created += 1
-        db.session.commit()
-    else:
+    fmt = import_format(file.filename)
+    if not fmt:
         return jsonify({"error": "unsupported_format"}), 400
-    return jsonify({"created": created})
+    wait = request.args.get('wait') in ('1', 'true') or not current_app.config.get('IMPORT_BACKGROUND', True)
+    status = start_import(current_app._get_current_object(), file, fmt, current_user.id, background=not wait)
+    status["status_url"] = url_for("items.import_status", import_id=status["import_id"])
+    status["report_url"] = url_for("items.import_report", import_id=status["import_id"])
+    return jsonify(status), (200 if wait else 202)
+
+
+@items_bp.route('/import/<import_id>')
+@login_required
+def import_status(import_id: str):
+    if current_user.role != 'admin':
+        return jsonify({"error": "forbidden"}), 403
+    status = read_status(current_app, import_id)
+    if status is None:
+        return jsonify({"error": "not_found"}), 404
+    status["report_url"] = url_for("items.import_report", import_id=import_id)
+    return jsonify(status)
+
+
+@items_bp.route('/import/<import_id>/report')
+@login_required
+def import_report(import_id: str):
+    if current_user.role != 'admin':
+        return jsonify({"error": "forbidden"}), 403
+    paths = job_paths(current_app, import_id)
+    if not paths or not os.path.exists(paths["report"]):
+        return jsonify({"error": "not_found"}), 404
+    return send_file(paths["report"], mimetype="text/csv", as_attachment=True,
+                     download_name=f"importacao_{import_id[:8]}_erros.csv")
 
 
 @items_bp.route('/export', methods=['GET'])
 @login_required
 def export_items():
+    """Exporta itens em CSV, NDJSON ou JSON por streaming, em blocos.
+
+    Aceita os mesmos filtros de /items/, ?columns=id,name,... e ?gzip=1."""
     if current_user.role != 'admin':
         return jsonify({"error": "forbidden"}), 403
     fmt = (request.args.get('format') or 'csv').lower()
-    rows = [i.to_dict_summary() for i in Item.query.order_by(Item.id).all()]
-    if fmt == 'csv':
-        from flask import make_response
-        import io as _io
-        output = _io.StringIO()
-        writer = csv.DictWriter(output, fieldnames=list(rows[0].keys()) if rows else ['id','name'])
-        writer.writeheader()
-        for r in rows:
-            writer.writerow(r)
-        resp = make_response(output.getvalue())
-        resp.headers['Content-Disposition'] = 'attachment; filename=items.csv'
-        resp.headers['Content-Type'] = 'text/csv'
-        return resp
-    elif fmt == 'json':
-        return jsonify(rows)
-    else:
+    if fmt not in STREAM_FORMATS:
         return jsonify({"error": "unsupported_format"}), 400
+    try:
+        columns = export_columns(request.args.get('columns'))
+    except ValueError as exc:
+        return jsonify({"error": "unknown_columns", "detail": str(exc)}), 400
+    compress = request.args.get('gzip') in ('1', 'true')
+    mimetype, ext = STREAM_FORMATS[fmt]
+    body = stream_items(fmt, columns, item_list_filters(request.args), compress=compress)
+    resp = Response(stream_with_context(body), mimetype='application/gzip' if compress else mimetype)
+    filename = f"items.{ext}.gz" if compress else f"items.{ext}"
+    resp.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
 
 
 @items_bp.route('/image-search', methods=['POST'])
 @login_required
 def image_search():
-    """Busca por imagem usando OCR (pytesseract). Extrai texto e pesquisa por nome/código.
-    Requer Tesseract instalado no sistema. Se indisponível, retorna erro amigável."""
+    """Busca por imagem usando OCR (pytesseract) num pool de processos, com
+    cache pelo hash da imagem. Códigos de item lidos na etiqueta são buscados
+    direto pelo índice de código; as demais palavras vão para a busca textual."""
     file = request.files.get('file')
     if not file:
         return jsonify({"error": "no_file"}), 400
     try:
-        import pytesseract
-        from PIL import Image
-        img = Image.open(file.stream)
-        text = pytesseract.image_to_string(img) or ''
-        text = re.sub(r'[^\w\s-]', ' ', text).strip()
-        if not text:
-            return jsonify({"matches": [], "text": text})
-        like = f"%{text.split()[0]}%"
-        matches = Item.query.filter(
-            (Item.name.ilike(like)) | (Item.description.ilike(like))
-        ).limit(20).all()
-        return jsonify({
-            "text": text,
-            "matches": [i.to_dict_summary() for i in matches]
-        })
-    except Exception as exc:
-        return jsonify({"error": "ocr_failed", "detail": str(exc)}), 500
+        text = extract_text(current_app._get_current_object(), file.read())
+    except OcrError as exc:
+        status = {"ocr_busy": 503, "ocr_timeout": 504, "ocr_unavailable": 503}.get(exc.code, 422)
+        return jsonify({"error": exc.code, "detail": exc.detail}), status
+    text = re.sub(r'[^\w\s|-]', ' ', text).strip()
+    if not text:
+        return jsonify({"matches": [], "codes": [], "text": text})
+    codes = code_candidates(text)
+    matches = Item.query.filter(Item.code.in_(codes)).order_by(Item.code).all() if codes else []
+    seen = {i.id for i in matches}
+    for term in text_terms(text, codes):
+        if len(matches) >= 20:
+            break
+        for item in search_items(term, limit=20 - len(matches), columns=("name", "description")):
+            if item.id not in seen:
+                seen.add(item.id)
+                matches.append(item)
+    return jsonify({
+        "text": text,
+        "codes": [i.code for i in matches if i.code in codes],
+        "matches": [i.to_dict_summary() for i in matches]
+    })
+
+
+AS_OF_PAGE_MAX = 5000
+
+
+@items_bp.route('/api/as-of')
+@login_required
+def items_as_of():
+    """Status e local dos itens num instante passado (?ts=2025-06-01 ou
+    2025-06-01T14:30), a partir do checkpoint mais próximo mais os movimentos
+    seguintes. Filtros: item_type, origin_stock, status e location (valores
+    em `ts`); paginação por after_id/limit. `summary` conta por status."""
+    if current_user.role != 'admin':
+        return jsonify({"error": "forbidden"}), 403
+    try:
+        ts = datetime.fromisoformat((request.args.get('ts') or '').strip())
+    except ValueError:
+        return jsonify({"error": "invalid_ts"}), 400
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    if len(request.args.get('ts', '').strip()) == 10:
+        ts += timedelta(days=1) - timedelta(microseconds=1)
+
+    state, source = state_as_of(ts)
+    ids = state.keys()
+    static_filters = [getattr(Item, f) == request.args[f] for f in ('item_type', 'origin_stock') if request.args.get(f)]
+    if static_filters:
+        ids = {r.id for r in db.session.query(Item.id).filter(*static_filters)} & state.keys()
+    status, location = request.args.get('status'), request.args.get('location')
+    ids = sorted(
+        i for i in ids
+        if (not status or state[i][0] == status) and (not location or state[i][1] == location)
+    )
+    summary: dict[str, int] = {}
+    for i in ids:
+        summary[state[i][0] or ''] = summary.get(state[i][0] or '', 0) + 1
+
+    after_id = request.args.get('after_id', 0, type=int)
+    limit = max(1, min(request.args.get('limit', 500, type=int), AS_OF_PAGE_MAX))
+    start = bisect_right(ids, after_id)
+    page_ids = ids[start:start + limit]
+    meta = {
+        r.id: r for r in db.session.query(
+            Item.id, Item.code, Item.name, Item.item_type, Item.origin_stock,
+        ).filter(Item.id.in_(page_ids))
+    } if page_ids else {}
+    return jsonify({
+        "ts": ts.isoformat(),
+        "source": source,
+        "total": len(ids),
+        "summary": summary,
+        "items": [
+            {
+                "id": i, "code": meta[i].code, "name": meta[i].name, "item_type": meta[i].item_type,
+                "origin_stock": meta[i].origin_stock, "status": state[i][0], "location": state[i][1],
+            } for i in page_ids if i in meta
+        ],
+        "next_after_id": page_ids[-1] if start + limit < len(ids) else None,
+    })
 
 
 @items_bp.route('/api/similar')
@@ -308,15 +343,15 @@ def similar_items():
     q = (request.args.get('q') or '').strip().lower()
     item_type = request.args.get('item_type')
     origin_stock = request.args.get('origin_stock')
-    query = Item.query
+    filters = []
     if item_type:
-        query = query.filter(Item.item_type == item_type)
+        filters.append(Item.item_type == item_type)
     if origin_stock:
-        query = query.filter(Item.origin_stock == origin_stock)
+        filters.append(Item.origin_stock == origin_stock)
     if q:
-        like = f"%{q}%"
-        query = query.filter((Item.name.ilike(like)) | (Item.description.ilike(like)))
-    results = query.order_by(Item.entry_date.desc()).limit(10).all()
+        results = search_items(q, filters, limit=10, columns=("name", "description"))
+    else:
+        results = Item.query.filter(*filters).order_by(Item.entry_date.desc()).limit(10).all()
     return jsonify([i.to_dict_summary() for i in results])
 
 
@@ -339,9 +374,7 @@ def edit_item(item_id: int):
         return redirect(url_for("items.list_items"))
 
     if request.method == "POST":
-        old_status = item.status
-        old_location = item.location
-        old_patient = item.patient_name
+        before = snapshot(item)
 
                                                                             
         item.name = request.form.get("name", item.name)
@@ -368,25 +401,17 @@ def edit_item(item_id: int):
         item.quantity = 1
         item.min_threshold = 1
 
+        new_photo = None
         file = request.files.get("photo")
-        if file and allowed_file(file.filename, current_app.config.get("ALLOWED_EXTENSIONS")) and validate_image_file(file):
-            from PIL import Image
-            filename = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{secure_filename(file.filename)}"
-            upload_dir = current_app.config["UPLOAD_FOLDER"]
-            os.makedirs(upload_dir, exist_ok=True)
-            path = os.path.join(upload_dir, filename)
-            img = Image.open(file)
-            img.save(path, optimize=True, quality=80)
-            item.photo_path = f"static/uploads/{filename}"
-
-        db.session.commit()
-
-        if old_status != item.status:
-            _add_movement(item.id, "status_change", old_status, item.status)
-        if old_location != item.location:
-            _add_movement(item.id, "location_change", old_location, item.location)
-        if old_patient != item.patient_name:
-            _add_movement(item.id, "patient_change", old_patient, item.patient_name)
+        if file and allowed_file(file.filename, current_app.config.get("ALLOWED_EXTENSIONS")):
+            new_photo = store_upload(file, current_app.config["UPLOAD_FOLDER"])
+            item.photo_path = new_photo or item.photo_path
+
+        recorder = MovementRecorder(current_user.id)
+        recorder.changes(item, before)
+        recorder.commit()
+        if new_photo:
+            submit_thumbnails(current_app._get_current_object(), new_photo)
 
         flash("Item atualizado com sucesso!", "success")
         return redirect(url_for("items.view_item", item_id=item.id))
@@ -403,65 +428,91 @@ def update_status(item_id: int):
 
     data = request.get_json(silent=True) or {}
     requested = (data.get("status") or "").strip().lower()
-    mapping = {
-        "aguardando_manutencao": "em_manutencao",
-        "em_manutencao": "em_manutencao",
-        "locado": "locado",
-        "vencido": "vencido",
-        "disponivel": "disponivel",
-    }
-    new_status = mapping.get(requested)
+    new_status = STATUS_TRANSITIONS.get(requested)
     if not new_status:
         return jsonify({"error": "invalid_status"}), 400
 
-    old_status = item.status
+    before = snapshot(item)
     item.status = new_status
     item.movement_date = datetime.utcnow()
-    db.session.commit()
-    _add_movement(item.id, "status_change", old_status, item.status)
+    recorder = MovementRecorder(current_user.id)
+    recorder.changes(item, before)
+    recorder.commit()
 
     return jsonify({"status": item.status})
 
 
-def _add_movement(item_id: int, action: str, from_value: str | None, to_value: str | None) -> None:
-    mv = ItemMovement(item_id=item_id, user_id=current_user.id, action=action, from_value=from_value, to_value=to_value)
-    db.session.add(mv)
-    db.session.commit()
+@items_bp.route("/bulk/status", methods=["POST"])
+@login_required
+def bulk_status():
+    """Troca o status (e opcionalmente o local) de vários itens numa requisição.
+
+    Corpo JSON: {"ids": [...]} ou {"codes": [...]} ou {"filter": {...filtros de
+    /items/...}}, mais "status" e "location" opcional. Responde o resultado
+    por item: ok, unchanged, forbidden ou not_found."""
+    data = request.get_json(silent=True) or {}
+    new_status = STATUS_TRANSITIONS.get((data.get("status") or "").strip().lower())
+    if not new_status:
+        return jsonify({"error": "invalid_status"}), 400
+    location = data.get("location")
+    if location is not None:
+        location = str(location).strip()[:120] or None
+
+    ids, codes, filt = data.get("ids"), data.get("codes"), data.get("filter")
+    columns = (
+        Item.id, Item.code, Item.owner_id, Item.status, Item.location,
+        Item.origin_stock, Item.item_type, Item.last_maintenance_date, Item.expiry_date, Item.entry_date,
+    )
+    if ids:
+        try:
+            keys = list(dict.fromkeys(int(i) for i in ids))
+        except (TypeError, ValueError):
+            return jsonify({"error": "invalid_ids"}), 400
+        key_col = Item.id
+    elif codes:
+        keys = list(dict.fromkeys(str(c).strip() for c in codes if str(c).strip()))
+        key_col = Item.code
+    elif isinstance(filt, dict) and filt:
+        keys, key_col = None, None
+    else:
+        return jsonify({"error": "missing_targets"}), 400
+    if keys is not None and len(keys) > BULK_STATUS_MAX:
+        return jsonify({"error": "too_many", "max": BULK_STATUS_MAX}), 400
+
+    query = db.session.query(*columns).with_for_update()
+    if keys is None:
+        rows = query.filter(*item_list_filters(filt)).order_by(Item.id).limit(BULK_STATUS_MAX + 1).all()
+        if len(rows) > BULK_STATUS_MAX:
+            return jsonify({"error": "too_many", "max": BULK_STATUS_MAX}), 400
+    else:
+        rows = []
+        for i in range(0, len(keys), BULK_CHUNK):
+            rows += query.filter(key_col.in_(keys[i:i + BULK_CHUNK])).all()
+
+    results = bulk_status_update(rows, new_status, location, current_user.id, current_user.role == "admin")
+    if keys is not None:
+        found = {r.id if key_col is Item.id else r.code for r in rows}
+        field = "id" if key_col is Item.id else "code"
+        results += [{field: k, "result": "not_found"} for k in keys if k not in found]
+    summary: dict[str, int] = {}
+    for r in results:
+        summary[r["result"]] = summary.get(r["result"], 0) + 1
+    return jsonify({"status": new_status, "location": location, "summary": summary, "results": results})
 
 
 @items_bp.route("/<int:item_id>/history", methods=["GET"])
 @login_required
 def item_history(item_id: int):
+    """Resumo do item com pacientes e períodos de manutenção (mantidos nas
+    tabelas de histórico) e uma página de movimentos, do mais recente ao mais
+    antigo; `after` traz a página seguinte."""
     item = Item.query.get_or_404(item_id)
     if current_user.role != "admin" and item.owner_id != current_user.id:
         return jsonify({"error": "forbidden"}), 403
 
-                          
-    movements = ItemMovement.query.filter_by(item_id=item.id).order_by(ItemMovement.timestamp.asc()).all()
-
-                                                            
-    patients = []
-    for mv in movements:
-        if mv.action == "patient_change" and mv.to_value:
-            if mv.to_value not in patients:
-                patients.append(mv.to_value)
-
-                                                                               
-    maintenance_periods = []
-    start = None
-    for mv in movements:
-        if mv.action == "status_change":
-            if (mv.to_value == "em_manutencao") and start is None:
-                start = mv.timestamp
-            elif start is not None and mv.from_value == "em_manutencao" and mv.to_value != "em_manutencao":
-                duration_days = (mv.timestamp - start).days
-                maintenance_periods.append({
-                    "start": start.strftime('%Y-%m-%d %H:%M'),
-                    "end": mv.timestamp.strftime('%Y-%m-%d %H:%M'),
-                    "days": duration_days
-                })
-                start = None
-
+    movements, next_cursor = movement_page(
+        item.id, request.args.get("after"), request.args.get("limit", HISTORY_PAGE_SIZE, type=int),
+    )
     data = {
         "id": item.id,
         "code": item.name,
@@ -470,8 +521,14 @@ def item_history(item_id: int):
         "lat": item.lat,
         "lng": item.lng,
         "location": item.location,
-        "patients": patients,
-        "maintenance_periods": maintenance_periods,
+        "patients": patient_names(item.id),
+        "maintenance_periods": [
+            {
+                "start": p.started_at.strftime('%Y-%m-%d %H:%M'),
+                "end": p.ended_at.strftime('%Y-%m-%d %H:%M'),
+                "days": (p.ended_at - p.started_at).days
+            } for p in maintenance_periods(item.id)
+        ],
         "movements": [
             {
                 "action": mv.action,
@@ -479,7 +536,8 @@ def item_history(item_id: int):
                 "to": mv.to_value,
                 "timestamp": mv.timestamp.strftime('%Y-%m-%d %H:%M')
             } for mv in movements
-        ]
+        ],
+        "next_cursor": next_cursor,
     }
     return jsonify(data)
 
@@ -9,7 +9,7 @@ from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 import qrcode
 
 from ..models import Item, ItemMovement
-from .. import db
+from ..eventsink import record_event
 
 qrcode_bp = Blueprint("qrcode", __name__, url_prefix="/qr")
 
@@ -98,9 +98,7 @@ def view_item_signed(item_id: int):
         flash("Sem permissão para visualizar este item.", "danger")
         return redirect(url_for("items.list_items"))
                     
-    mv = ItemMovement(item_id=item.id, user_id=current_user.id if current_user.is_authenticated else None, action="scan")
-    db.session.add(mv)
-    db.session.commit()
+    record_event(ItemMovement, item_id=item.id, user_id=current_user.id if current_user.is_authenticated else None, action="scan")
     return render_template("item_view.html", item=item)
 
 
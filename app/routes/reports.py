@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 from io import BytesIO
-from flask import Blueprint, render_template, send_file, abort
-from flask_login import login_required
+import os
+from flask import Blueprint, render_template, send_file, abort, request, Response
+from flask_login import login_required, current_user
 
-from ..models import Item
+from ..counters import totals_by_status
+from ..exports import stream_and_remove, write_inventory_pdf
 
 reports_bp = Blueprint("reports", __name__, url_prefix="/reports")
 
@@ -18,9 +20,10 @@ def reports_home():
 @reports_bp.route("/pdf/summary")
 @login_required
 def reports_pdf_summary():
-    items_total = Item.query.count()
-    disponiveis = Item.query.filter_by(status="disponivel").count()
-    locados = Item.query.filter_by(status="locado").count()
+    by_status = totals_by_status()
+    items_total = sum(by_status.values())
+    disponiveis = by_status.get("disponivel", 0)
+    locados = by_status.get("locado", 0)
     try:
                                                       
         from reportlab.lib.pagesizes import A4
@@ -50,3 +53,19 @@ def reports_pdf_summary():
         return send_file(BytesIO(html), mimetype="text/html", as_attachment=True, download_name="relatorio_resumo.pdf")
 
 
+@reports_bp.route("/pdf/inventory")
+@login_required
+def reports_pdf_inventory():
+    """Inventário completo em PDF (tabelas por estoque e tipo, com totais).
+    Filtros opcionais: origin_stock, item_type, status."""
+    if current_user.role != "admin":
+        return render_template("403.html"), 403
+    path = write_inventory_pdf(
+        origin_stock=request.args.get("origin_stock") or None,
+        item_type=request.args.get("item_type") or None,
+        status=request.args.get("status") or None,
+    )
+    resp = Response(stream_and_remove(path), mimetype="application/pdf")
+    resp.headers["Content-Length"] = str(os.path.getsize(path))
+    resp.headers["Content-Disposition"] = "attachment; filename=ghoststock_inventario.pdf"
+    return resp
@@ -17,6 +17,13 @@ def schedule_jobs(app):
             _check_and_send_alerts()
 
     scheduler.add_job(job, "interval", minutes=interval, id="alerts_job", replace_existing=True)
+
+    def checkpoint_job():
+        from .snapshots import checkpoint_if_due
+        with app.app_context():
+            checkpoint_if_due(app.config.get("CHECKPOINT_INTERVAL_HOURS", 24))
+
+    scheduler.add_job(checkpoint_job, "interval", minutes=interval, id="checkpoint_job", replace_existing=True)
     scheduler.start()
 
 
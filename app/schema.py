@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import inspect, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import InventoryCounter, SystemMarker
+
+
+# Tabelas só com dados derivados: se as colunas do banco não batem com o
+# modelo, são recriadas vazias e repopuladas pelo rebuild correspondente.
+DERIVED_TABLES = (InventoryCounter.__table__,)
+
+
+def ensure_indexes() -> list[str]:
+    """Cria os índices declarados nos modelos que faltam em tabelas já
+    existentes (create_all só cria tabelas novas, então bases antigas ficam
+    sem os índices acrescentados depois). Retorna os nomes criados."""
+    created = []
+    with db.engine.begin() as conn:
+        inspector = inspect(conn)
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda ix: ix.name):
+                if index.name not in existing:
+                    index.create(conn, checkfirst=True)
+                    created.append(index.name)
+    return created
+
+
+def reset_derived_tables() -> list[str]:
+    """Recria as tabelas derivadas cujo layout no banco é de uma versão anterior."""
+    reset = []
+    with db.engine.begin() as conn:
+        inspector = inspect(conn)
+        for table in DERIVED_TABLES:
+            if not inspector.has_table(table.name):
+                continue
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            if columns != set(table.columns.keys()):
+                table.drop(conn)
+                table.create(conn)
+                reset.append(table.name)
+    return reset
+
+
+def read_marker(conn, name: str, lock: bool = False) -> str | None:
+    """Valor do marcador `name` (None se não existe). Com `lock`, segura o
+    marcador em modo compartilhado até o fim da transação (FOR SHARE no
+    Postgres), o que faz um claim_marker concorrente esperar por ela."""
+    query = select(SystemMarker.value).where(SystemMarker.name == name)
+    if lock and conn.dialect.name == "postgresql":
+        query = query.with_for_update(read=True)
+    return conn.execute(query).scalar()
+
+
+def _create_marker(name: str) -> None:
+    """Insere o marcador vazio numa transação própria, para que ele já exista
+    (e possa ser travado) quando o claim começar."""
+    table = SystemMarker.__table__
+    with db.engine.connect() as conn:
+        if conn.execute(select(table.c.name).where(table.c.name == name)).first() is not None:
+            return
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(table.insert().values(name=name, value="", updated_at=datetime.utcnow()))
+    except IntegrityError:
+        pass
+
+
+def claim_marker(conn, name: str, value: str, force: bool = False) -> bool:
+    """Grava `value` no marcador `name` dentro da transação de `conn`.
+
+    Retorna False quando ele já tem esse valor (e `force` é falso): outro
+    processo fez o trabalho antes. Como o UPDATE trava a linha até o commit,
+    quem recebe True faz o rebuild correspondente na mesma transação sem
+    concorrer com outro rebuild nem com quem leu o marcador com `lock`."""
+    _create_marker(name)
+    table = SystemMarker.__table__
+    stmt = update(table).where(table.c.name == name)
+    if not force:
+        stmt = stmt.where(table.c.value != value)
+    return conn.execute(stmt.values(value=value, updated_at=datetime.utcnow())).rowcount > 0
+
+
+def upgrade_schema(app) -> None:
+    """Ajustes de esquema aplicados na subida do app, depois do create_all,
+    e preenchimento inicial das tabelas derivadas."""
+    from .counters import ensure_counters
+    from .history import ensure_history
+
+    created = ensure_indexes()
+    if created:
+        app.logger.info(f"Índices criados: {', '.join(created)}")
+    reset = reset_derived_tables()
+    if reset:
+        app.logger.info(f"Tabelas derivadas recriadas: {', '.join(reset)}")
+    ensure_counters()
+    ensure_history()
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+from sqlalchemy import Float, Integer, event, func, literal_column, or_, select, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import db
+from .models import Item
+
+
+SEARCH_COLUMNS = ("name", "description", "location", "patient_name")
+TRIGRAM_MIN_CHARS = 3
+PG_TS_CONFIG = "portuguese"
+
+_SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS item_fts USING fts5("
+    "name, description, location, patient_name, content='item', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS item_fts_ai AFTER INSERT ON item BEGIN "
+    "INSERT INTO item_fts(rowid, name, description, location, patient_name) "
+    "VALUES (new.id, new.name, new.description, new.location, new.patient_name); END",
+    "CREATE TRIGGER IF NOT EXISTS item_fts_ad AFTER DELETE ON item BEGIN "
+    "INSERT INTO item_fts(item_fts, rowid, name, description, location, patient_name) "
+    "VALUES ('delete', old.id, old.name, old.description, old.location, old.patient_name); END",
+    "CREATE TRIGGER IF NOT EXISTS item_fts_au AFTER UPDATE OF name, description, location, patient_name ON item BEGIN "
+    "INSERT INTO item_fts(item_fts, rowid, name, description, location, patient_name) "
+    "VALUES ('delete', old.id, old.name, old.description, old.location, old.patient_name); "
+    "INSERT INTO item_fts(rowid, name, description, location, patient_name) "
+    "VALUES (new.id, new.name, new.description, new.location, new.patient_name); END",
+)
+
+_PG_DOCUMENT = (
+    "coalesce(name, '') || ' ' || coalesce(description, '') || ' ' || "
+    "coalesce(location, '') || ' ' || coalesce(patient_name, '')"
+)
+_PG_TSVECTOR = f"to_tsvector('{PG_TS_CONFIG}', {_PG_DOCUMENT})"
+_PG_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_item_search_tsv ON item USING gin ({_PG_TSVECTOR})",
+) + tuple(
+    f"CREATE INDEX IF NOT EXISTS ix_item_{col}_trgm ON item USING gin ({col} gin_trgm_ops)"
+    for col in SEARCH_COLUMNS
+)
+
+_available: dict[str, bool] = {}
+
+
+def _create_index(conn) -> bool:
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        existed = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'item_fts'")).first() is not None
+        for ddl in _SQLITE_DDL:
+            conn.execute(text(ddl))
+        if not existed:
+            conn.execute(text("INSERT INTO item_fts(item_fts) VALUES ('rebuild')"))
+        return True
+    if dialect == "postgresql":
+        for ddl in _PG_DDL:
+            conn.execute(text(ddl))
+        return True
+    return False
+
+
+def ensure_search_index(engine=None) -> bool:
+    """Cria o índice de texto (e os gatilhos de sincronização) se faltarem.
+
+    Retorna False quando o banco não suporta (SQLite sem FTS5/trigram, Postgres
+    sem permissão para pg_trgm, outros dialetos); a busca então usa ILIKE."""
+    engine = engine or db.engine
+    try:
+        with engine.begin() as conn:
+            ok = _create_index(conn)
+    except SQLAlchemyError:
+        ok = False
+    _available[str(engine.url)] = ok
+    return ok
+
+
+def rebuild_search_index() -> bool:
+    """Reconstrói o índice FTS5 a partir da tabela de itens (no Postgres os
+    índices GIN já são mantidos pelo próprio banco)."""
+    if not search_available():
+        return False
+    if db.engine.dialect.name == "sqlite":
+        with db.engine.begin() as conn:
+            conn.execute(text("INSERT INTO item_fts(item_fts) VALUES ('rebuild')"))
+    return True
+
+
+def search_available() -> bool:
+    key = str(db.engine.url)
+    if key not in _available:
+        ensure_search_index()
+    return _available[key]
+
+
+def _after_item_create(target, connection, **kw) -> None:
+    try:
+        with connection.begin_nested():
+            ok = _create_index(connection)
+    except SQLAlchemyError:
+        ok = False
+    _available[str(connection.engine.url)] = ok
+
+
+def _before_item_drop(target, connection, **kw) -> None:
+    if connection.dialect.name == "sqlite":
+        connection.execute(text("DROP TABLE IF EXISTS item_fts"))
+
+
+def register_search_listeners() -> None:
+    """Mantém o índice junto com create_all/drop_all (ex.: seed_mass --reset)."""
+    table = Item.__table__
+    if not event.contains(table, "after_create", _after_item_create):
+        event.listen(table, "after_create", _after_item_create)
+        event.listen(table, "before_drop", _before_item_drop)
+
+
+def _ilike_condition(q: str, columns=SEARCH_COLUMNS):
+    like = f"%{q}%"
+    return or_(*[getattr(Item, col).ilike(like) for col in columns])
+
+
+def _use_fts(q: str) -> bool:
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        return len(q) >= TRIGRAM_MIN_CHARS and search_available()
+    return dialect == "postgresql" and search_available()
+
+
+def _fts_subquery(q: str, columns=SEARCH_COLUMNS):
+    phrase = "{" + " ".join(columns) + '} : "' + q.replace('"', '""') + '"'
+    return (
+        text("SELECT rowid AS id, rank AS rank FROM item_fts WHERE item_fts MATCH :fts_q")
+        .bindparams(fts_q=phrase)
+        .columns(id=Integer, rank=Float)
+        .subquery("fts")
+    )
+
+
+def _pg_tsquery(q: str):
+    return func.plainto_tsquery(literal_column(f"'{PG_TS_CONFIG}'"), q)
+
+
+def search_condition(q: str, columns=SEARCH_COLUMNS):
+    """Filtro de busca textual equivalente ao ILIKE '%q%' nas colunas dadas,
+    usando o índice de texto quando disponível.
+
+    No Postgres o ILIKE é atendido pelos índices de trigramas e a busca também
+    aceita variações (plural, acentos) via tsvector."""
+    q = q.strip()
+    if _use_fts(q):
+        if db.engine.dialect.name == "sqlite":
+            return Item.id.in_(select(_fts_subquery(q, columns).c.id))
+        if columns == SEARCH_COLUMNS:
+            return or_(literal_column(_PG_TSVECTOR).op("@@")(_pg_tsquery(q)), _ilike_condition(q, columns))
+    return _ilike_condition(q, columns)
+
+
+def search_items(q: str, filters=(), limit: int = 20, columns=SEARCH_COLUMNS) -> list[Item]:
+    """Itens que casam com `q`, ordenados por relevância (bm25 no SQLite,
+    ts_rank + similaridade de trigramas no Postgres, data de entrada no ILIKE)."""
+    q = q.strip()
+    if not q:
+        return []
+    query = Item.query.filter(*filters)
+    if not _use_fts(q):
+        query = query.filter(_ilike_condition(q, columns))
+        return query.order_by(Item.entry_date.desc()).limit(limit).all()
+    if db.engine.dialect.name == "sqlite":
+        fts = _fts_subquery(q, columns)
+        query = query.join(fts, fts.c.id == Item.id)
+        return query.order_by(fts.c.rank.asc(), Item.id.desc()).limit(limit).all()
+    rank = (
+        func.ts_rank(literal_column(_PG_TSVECTOR), _pg_tsquery(q))
+        + func.word_similarity(q, func.coalesce(Item.name, ""))
+    )
+    query = query.filter(search_condition(q, columns))
+    return query.order_by(rank.desc(), Item.id.desc()).limit(limit).all()
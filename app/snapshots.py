@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Iterator
+
+from sqlalchemy import select
+
+from . import db
+from .models import Item, ItemCheckpoint, ItemMovement
+
+
+STATE_FIELDS = ("status", "location")
+STATE_ACTIONS = {"status_change": 0, "location_change": 1}
+STATE_CACHE_MAX = 4
+
+ItemState = dict[int, list]
+
+
+def _encode_state(state: ItemState) -> bytes:
+    """Estado em colunas (ids ordenados + um dicionário por campo), comprimido."""
+    ids = sorted(state)
+    columns = {"ids": ids}
+    for pos, field in enumerate(STATE_FIELDS):
+        values: dict[str | None, int] = {}
+        columns[field] = [values.setdefault(state[i][pos], len(values)) for i in ids]
+        columns[f"{field}_values"] = list(values)
+    return zlib.compress(json.dumps(columns, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def _decode_state(payload: bytes) -> ItemState:
+    columns = json.loads(zlib.decompress(payload))
+    decoded = [
+        [columns[f"{field}_values"][code] for code in columns[field]]
+        for field in STATE_FIELDS
+    ]
+    return {item_id: [col[n] for col in decoded] for n, item_id in enumerate(columns["ids"])}
+
+
+def _current_rows(filters=()) -> Iterator:
+    from .exports import iter_item_rows
+    return iter_item_rows((Item.id, Item.status, Item.location), filters)
+
+
+def take_checkpoint(now: datetime | None = None) -> ItemCheckpoint:
+    """Grava o status e o local atuais de todos os itens num checkpoint."""
+    taken_at = now or datetime.utcnow()
+    state = {r.id: [r.status, r.location] for r in _current_rows()}
+    checkpoint = ItemCheckpoint(
+        taken_at=taken_at, max_item_id=max(state, default=0), items=len(state), payload=_encode_state(state),
+    )
+    db.session.add(checkpoint)
+    db.session.commit()
+    return checkpoint
+
+
+def checkpoint_if_due(interval_hours: int) -> ItemCheckpoint | None:
+    last = db.session.query(ItemCheckpoint.taken_at).order_by(ItemCheckpoint.taken_at.desc()).first()
+    if last is not None and datetime.utcnow() - last.taken_at < timedelta(hours=interval_hours):
+        return None
+    return take_checkpoint()
+
+
+def _movements_between(start: datetime | None, end: datetime | None, item_ids=None) -> Iterator:
+    """Mudanças de status/local com start < timestamp <= end, da tabela quente
+    e dos meses arquivados que cruzam o intervalo (em qualquer ordem)."""
+    from flask import current_app
+    from .archive import archived_months, iter_month, month_bounds
+
+    for month in archived_months():
+        month_start, month_end = month_bounds(month)
+        if (end is not None and month_start > end) or (start is not None and month_end <= start):
+            continue
+        for r in iter_month(current_app._get_current_object(), month):
+            if r["action"] not in STATE_ACTIONS or (item_ids is not None and r["item_id"] not in item_ids):
+                continue
+            ts = r["timestamp"]
+            if (start is None or ts > start) and (end is None or ts <= end):
+                yield r["item_id"], r["action"], r["from_value"], r["to_value"], ts, r["id"]
+    query = select(
+        ItemMovement.item_id, ItemMovement.action, ItemMovement.from_value, ItemMovement.to_value,
+        ItemMovement.timestamp, ItemMovement.id,
+    ).where(ItemMovement.action.in_(tuple(STATE_ACTIONS)))
+    if start is not None:
+        query = query.where(ItemMovement.timestamp > start)
+    if end is not None:
+        query = query.where(ItemMovement.timestamp <= end)
+    if item_ids is not None:
+        query = query.where(ItemMovement.item_id.in_(item_ids))
+    yield from db.session.execute(query.execution_options(yield_per=5000))
+
+
+def _replay_forward(state: ItemState, start: datetime, end: datetime) -> None:
+    """Aplica o to_value do último movimento de cada (item, campo) em (start, end]."""
+    last: dict[tuple[int, int], tuple] = {}
+    for item_id, action, _from, to_value, ts, mv_id in _movements_between(start, end):
+        key = (item_id, STATE_ACTIONS[action])
+        if key not in last or (ts, mv_id) > last[key][0]:
+            last[key] = ((ts, mv_id), to_value)
+    for (item_id, pos), (_order, value) in last.items():
+        if item_id in state:
+            state[item_id][pos] = value
+
+
+def _roll_back(state: ItemState, ts: datetime, until: datetime | None, item_ids=None) -> None:
+    """Desfaz os movimentos em (ts, until]: cada (item, campo) volta ao
+    from_value do primeiro movimento depois de `ts`."""
+    first: dict[tuple[int, int], tuple] = {}
+    for item_id, action, from_value, _to, mv_ts, mv_id in _movements_between(ts, until, item_ids):
+        key = (item_id, STATE_ACTIONS[action])
+        if key not in first or (mv_ts, mv_id) < first[key][0]:
+            first[key] = ((mv_ts, mv_id), from_value)
+    for (item_id, pos), (_order, value) in first.items():
+        if item_id in state:
+            state[item_id][pos] = value
+
+
+def _existed(ts: datetime):
+    return (Item.entry_date.is_(None)) | (Item.entry_date <= ts)
+
+
+def compute_state_as_of(ts: datetime) -> tuple[ItemState, dict]:
+    """Status e local de cada item em `ts`.
+
+    Parte do checkpoint mais recente até `ts` e aplica só os movimentos entre
+    ele e `ts`; itens criados depois do checkpoint saem do estado atual
+    desfazendo os movimentos posteriores a `ts`. Sem checkpoint anterior, usa
+    o primeiro checkpoint depois de `ts` (ou o estado atual) e volta no tempo."""
+    base = (
+        ItemCheckpoint.query.filter(ItemCheckpoint.taken_at <= ts)
+        .order_by(ItemCheckpoint.taken_at.desc()).first()
+    )
+    if base is not None:
+        state = _decode_state(base.payload)
+        _replay_forward(state, base.taken_at, ts)
+        newer = {r.id: [r.status, r.location] for r in _current_rows((Item.id > base.max_item_id, _existed(ts)))}
+        if newer:
+            _roll_back(newer, ts, None, set(newer))
+            state.update(newer)
+        return state, {"checkpoint": base.taken_at.isoformat(), "direction": "forward"}
+
+    after = (
+        ItemCheckpoint.query.filter(ItemCheckpoint.taken_at > ts)
+        .order_by(ItemCheckpoint.taken_at.asc()).first()
+    )
+    if after is not None:
+        state = _decode_state(after.payload)
+        until = after.taken_at
+    else:
+        state = {r.id: [r.status, r.location] for r in _current_rows()}
+        until = None
+    existed = {r.id for r in _current_rows((_existed(ts),))}
+    state = {i: v for i, v in state.items() if i in existed}
+    _roll_back(state, ts, until)
+    return state, {"checkpoint": until.isoformat() if until else None, "direction": "backward"}
+
+
+_state_cache: OrderedDict[datetime, tuple[ItemState, dict]] = OrderedDict()
+_state_cache_lock = threading.Lock()
+
+
+def state_as_of(ts: datetime) -> tuple[ItemState, dict]:
+    """compute_state_as_of com cache dos últimos instantes consultados (as
+    páginas de uma mesma consulta reaproveitam o estado). Instantes recentes,
+    que ainda podem receber movimentos, não entram no cache."""
+    with _state_cache_lock:
+        hit = _state_cache.get(ts)
+        if hit is not None:
+            _state_cache.move_to_end(ts)
+            return hit
+    result = compute_state_as_of(ts)
+    if ts < datetime.utcnow() - timedelta(minutes=5):
+        with _state_cache_lock:
+            _state_cache[ts] = result
+            while len(_state_cache) > STATE_CACHE_MAX:
+                _state_cache.popitem(last=False)
+    return result
@@ -67,20 +67,35 @@ document.addEventListener('DOMContentLoaded', () => {
     const m = window.location.pathname.match(/\/items\/(\d+)/);
     const id = m ? m[1] : null;
     if (id) {
-      (async () => {
-        try {
-          const res = await fetch(`/items/${id}/history`);
-          const data = await res.json();
-          if (data?.movements?.length) {
-            timeline.innerHTML = data.movements.map(mv => `
+      const renderMovements = (movements) => movements.map(mv => `
               <div style="display:flex;gap:8px;align-items:center;margin:6px 0">
                 <span class="badge">${mv.timestamp}</span>
                 <span>${String(mv.action||'').replace('_',' ')}: <strong>${mv.from||'-'}</strong> → <strong>${mv.to||'-'}</strong></span>
               </div>
             `).join('');
-          } else {
-            timeline.innerHTML = '<p class="muted">Sem eventos registrados.</p>';
-          }
+      const loadPage = async (cursor) => {
+        const url = cursor ? `/items/${id}/history?after=${encodeURIComponent(cursor)}` : `/items/${id}/history`;
+        const res = await fetch(url);
+        const data = await res.json();
+        timeline.querySelector('.timeline-more')?.remove();
+        if (!cursor && !data?.movements?.length) {
+          timeline.innerHTML = '<p class="muted">Sem eventos registrados.</p>';
+          return;
+        }
+        timeline.insertAdjacentHTML(cursor ? 'beforeend' : 'afterbegin', renderMovements(data.movements || []));
+        if (data.next_cursor) {
+          const more = document.createElement('button');
+          more.type = 'button';
+          more.className = 'btn-link timeline-more';
+          more.textContent = 'Carregar mais';
+          more.addEventListener('click', () => loadPage(data.next_cursor).catch(() => {}));
+          timeline.appendChild(more);
+        }
+      };
+      (async () => {
+        try {
+          timeline.innerHTML = '';
+          await loadPage(null);
         } catch (_) {
           timeline.innerHTML = '<p class="muted">Erro ao carregar timeline.</p>';
         }
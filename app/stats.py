@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, case, func, or_, select
+
+from . import db
+from .models import Item
+
+
+EM_USO_STATUSES = ("locado", "em_uso", "em uso")
+MAINTENANCE_DUE_DAYS = 60
+MAINTENANCE_SOON_DAYS = 45
+EXPIRY_ALERT_DAYS = 7
+PREV_MONTH_DAYS = 30
+TARGET_DUE = 582
+TARGET_SOON = 1350
+
+
+def _due_ids_subquery(now: datetime):
+    """Mesma seleção de "em manutenção" usada no painel: primeiro os itens com
+    status em_manutencao, completados pelos vencidos mais antigos até TARGET_DUE."""
+    cutoff_due = now - timedelta(days=MAINTENANCE_DUE_DAYS)
+    priority = case((Item.status == "em_manutencao", 0), else_=1)
+    return (
+        select(Item.id.label("id"))
+        .where(or_(
+            Item.status == "em_manutencao",
+            and_(Item.last_maintenance_date.isnot(None), Item.last_maintenance_date <= cutoff_due),
+        ))
+        .order_by(priority, Item.last_maintenance_date.asc())
+        .limit(TARGET_DUE)
+        .subquery()
+    )
+
+
+def compute_dashboard_stats(now: datetime | None = None) -> dict:
+    """Calcula os indicadores do painel em uma única varredura agrupada.
+
+    Retorna total, disponiveis, em_uso, vencendo, by_type, by_stock,
+    by_stock_status, maintenance {due, soon} e prev_month_total."""
+    now = now or datetime.utcnow()
+    due_sq = _due_ids_subquery(now)
+    is_due = case((due_sq.c.id.isnot(None), 1), else_=0)
+    is_soon = case((and_(
+        Item.last_maintenance_date.isnot(None),
+        Item.last_maintenance_date > (now - timedelta(days=MAINTENANCE_DUE_DAYS)),
+        Item.last_maintenance_date <= (now - timedelta(days=MAINTENANCE_SOON_DAYS)),
+    ), 1), else_=0)
+    expiring = case((and_(
+        Item.expiry_date.isnot(None),
+        Item.expiry_date <= (now + timedelta(days=EXPIRY_ALERT_DAYS)),
+    ), 1), else_=0)
+    older = case((Item.entry_date < (now - timedelta(days=PREV_MONTH_DAYS)), 1), else_=0)
+
+    rows = (
+        db.session.query(
+            Item.origin_stock, Item.item_type, Item.status, is_due, is_soon,
+            func.count(Item.id), func.sum(expiring), func.sum(older),
+        )
+        .outerjoin(due_sq, due_sq.c.id == Item.id)
+        .group_by(Item.origin_stock, Item.item_type, Item.status, is_due, is_soon)
+        .all()
+    )
+    return fold_grouped_rows(
+        (stock, item_type, status, bool(due), bool(soon), count, int(exp or 0), int(old or 0))
+        for stock, item_type, status, due, soon, count, exp, old in rows
+    )
+
+
+def _due_allocation(rows, now: datetime) -> dict[int, int]:
+    """Quantos itens de cada linha de contador entram em "em manutenção".
+
+    Se todos os candidatos (status em_manutencao ou faixa "due") cabem em
+    TARGET_DUE, entram todos; senão a escolha exata sai de _due_ids_subquery,
+    agrupada por estoque/tipo/status (no máximo TARGET_DUE linhas pelo índice
+    de last_maintenance_date)."""
+    candidates = [i for i, r in enumerate(rows) if r.status == "em_manutencao" or r.maintenance == "due"]
+    if sum(rows[i].total for i in candidates) <= TARGET_DUE:
+        return {i: rows[i].total for i in candidates}
+    due_sq = _due_ids_subquery(now)
+    picked = {
+        (s or None, t or None, st or None): n
+        for s, t, st, n in db.session.query(Item.origin_stock, Item.item_type, Item.status, func.count(Item.id))
+        .join(due_sq, due_sq.c.id == Item.id)
+        .group_by(Item.origin_stock, Item.item_type, Item.status)
+    }
+    taken: dict[int, int] = {}
+    for i in sorted(candidates, key=lambda i: rows[i].maintenance != "due"):
+        group = rows[i][:3]
+        n = min(rows[i].total, picked.get(group, 0))
+        if n:
+            taken[i] = n
+            picked[group] -= n
+    return taken
+
+
+def compute_stats_from_counters(now: datetime | None = None) -> dict:
+    """Mesmos indicadores de compute_dashboard_stats, lidos da tabela de contadores.
+
+    As janelas de manutenção, validade e entrada são avaliadas pelo dia (as
+    faixas guardadas nos contadores), sem consultar `item`."""
+    from .counters import counter_rows
+    now = now or datetime.utcnow()
+    rows = counter_rows()
+    taken = _due_allocation(rows, now)
+
+    grouped = []
+    for i, r in enumerate(rows):
+        is_soon = r.maintenance == "soon"
+        due_n = taken.get(i, 0)
+        expiring = r.total if r.expiring else 0
+        older = 0 if r.recent else r.total
+        for is_due, n in ((True, due_n), (False, r.total - due_n)):
+            if n:
+                grouped.append((r.origin_stock, r.item_type, r.status, is_due, is_soon, n, expiring, older))
+                expiring = older = 0
+    return fold_grouped_rows(grouped)
+
+
+def get_dashboard_stats(now: datetime | None = None) -> dict:
+    if current_app.config.get("INVENTORY_COUNTERS", True):
+        return compute_stats_from_counters(now)
+    return compute_dashboard_stats(now)
+
+
+def fold_grouped_rows(rows) -> dict:
+    """Agrega linhas (stock, type, status, due, soon, count, vencendo, antigos) no
+    formato consumido pelas rotas do painel."""
+    total = disponiveis = em_uso = vencendo = prev_month_total = 0
+    due = soon = 0
+    by_type: dict[str, int] = {}
+    by_stock: dict[str, int] = {}
+    by_stock_status: dict[str, dict[str, int]] = {}
+    for stock, item_type, status, is_due, is_soon, count, exp, old in rows:
+        total += count
+        vencendo += exp
+        prev_month_total += old
+        if item_type:
+            by_type[item_type] = by_type.get(item_type, 0) + count
+        if stock:
+            by_stock[stock] = by_stock.get(stock, 0) + count
+        if is_due:
+            due += count
+            continue
+        if is_soon:
+            soon += count
+        if status == "disponivel":
+            disponiveis += count
+        elif status in EM_USO_STATUSES:
+            em_uso += count
+        if stock:
+            bucket = by_stock_status.setdefault(stock, {"disponivel": 0, "locado": 0})
+            if status in bucket:
+                bucket[status] += count
+    return {
+        "total": total,
+        "disponiveis": disponiveis,
+        "em_uso": em_uso,
+        "vencendo": vencendo,
+        "by_type": by_type,
+        "by_stock": by_stock,
+        "by_stock_status": by_stock_status,
+        "maintenance": {"due": min(due, TARGET_DUE), "soon": min(soon, TARGET_SOON)},
+        "prev_month_total": prev_month_total,
+    }
+
+
+HISTOGRAM_MONTHS = (6, 12, 24)
+HISTOGRAM_SPLITS = {"stock": Item.origin_stock, "type": Item.item_type}
+
+
+def month_starts(now: datetime, months: int) -> list[datetime]:
+    """Primeiro dia de cada um dos últimos `months` meses de calendário (inclui o atual)."""
+    base = now.year * 12 + (now.month - 1)
+    return [datetime((base - i) // 12, (base - i) % 12 + 1, 1) for i in range(months - 1, -1, -1)]
+
+
+def _month_bucket(column):
+    if db.engine.dialect.name == "postgresql":
+        return func.to_char(column, "YYYY-MM")
+    return func.strftime("%Y-%m", column)
+
+
+def movement_histogram(months: int = 6, by: str | None = None, now: datetime | None = None) -> dict:
+    """Contagem de itens por mês de `movement_date` em uma única consulta agrupada.
+
+    `by` pode ser "stock" ou "type" para separar as séries por estoque/tipo."""
+    now = now or datetime.utcnow()
+    starts = month_starts(now, months)
+    labels = [s.strftime("%Y-%m") for s in starts]
+    end = datetime(now.year + now.month // 12, now.month % 12 + 1, 1)
+    bucket = _month_bucket(Item.movement_date)
+    split = HISTOGRAM_SPLITS.get(by) if by else None
+    cols = [bucket] + ([split] if split is not None else [])
+    rows = (
+        db.session.query(*cols, func.count(Item.id))
+        .filter(Item.movement_date >= starts[0], Item.movement_date < end)
+        .group_by(*cols)
+        .all()
+    )
+    index = {label: i for i, label in enumerate(labels)}
+    totals = [0] * months
+    series: dict[str, list[int]] = {}
+    for row in rows:
+        i = index.get(row[0])
+        if i is None:
+            continue
+        totals[i] += row[-1]
+        if split is not None:
+            series.setdefault(row[1] or "-", [0] * months)[i] += row[-1]
+    data = {
+        "labels": labels,
+        "movement": [{"label": label, "count": totals[i]} for i, label in enumerate(labels)],
+    }
+    if split is not None:
+        data["by"] = by
+        data["series"] = series
+    return data
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, select
+
+from . import db
+from .models import Item, ItemMovement, MovementArchive
+
+
+REPORTED_STATUSES = ("locado", "disponivel", "em_manutencao")
+UTILIZATION_DAYS = (30, 90, 180, 365)
+
+
+EPOCH = datetime(1970, 1, 1)
+REFRESH_OVERLAP = 500
+# Descarta movimentos antigos só quando o corte andou pelo menos isto (segundos).
+TRIM_STEP = 86400
+
+
+def _epoch(value: datetime) -> float:
+    return (value - EPOCH).total_seconds()
+
+
+def _epoch_column():
+    """timestamp em segundos desde 1970 calculado no banco, para não criar um
+    datetime por linha no Python."""
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        return (func.julianday(ItemMovement.timestamp) - 2440587.5) * 86400.0
+    if dialect == "postgresql":
+        return func.extract("epoch", ItemMovement.timestamp)
+    return None
+
+
+class StatusColumns:
+    """status_change em colunas NumPy (item, segundos, from, to, id), carregadas
+    uma vez por processo a partir de `horizon` e completadas depois só com os
+    movimentos de id maior que o último lido. Os status viram códigos inteiros
+    num dicionário compartilhado com o cálculo."""
+
+    def __init__(self):
+        self.codes: dict[str | None, int] = {s: i for i, s in enumerate(REPORTED_STATUSES)}
+        self.horizon: float | None = None
+        self.last_id = 0
+        self.archives = -1
+        self.item = np.zeros(0, dtype=np.int64)
+        self.ts = np.zeros(0)
+        self.frm = np.zeros(0, dtype=np.int64)
+        self.to = np.zeros(0, dtype=np.int64)
+        self.mv_id = np.zeros(0, dtype=np.int64)
+
+    def code(self, status: str | None) -> int:
+        return self.codes.setdefault(status, len(self.codes))
+
+    def _hot_rows(self, where):
+        epoch = _epoch_column()
+        query = select(
+            ItemMovement.item_id,
+            ItemMovement.timestamp if epoch is None else epoch,
+            ItemMovement.from_value, ItemMovement.to_value, ItemMovement.id,
+        ).where(ItemMovement.action == "status_change", *where)
+        rows = db.session.connection().execute(query).fetchall()
+        if epoch is None:
+            rows = [(i, _epoch(ts), f, t, m) for i, ts, f, t, m in rows]
+        return rows
+
+    def _append(self, rows) -> None:
+        if not rows:
+            return
+        item, ts, frm, to, mv_id = zip(*rows)
+        self.item = np.concatenate((self.item, np.array(item, dtype=np.int64)))
+        self.ts = np.concatenate((self.ts, np.array(ts, dtype=np.float64)))
+        self.frm = np.concatenate((self.frm, np.fromiter(map(self.code, frm), dtype=np.int64, count=len(frm))))
+        self.to = np.concatenate((self.to, np.fromiter(map(self.code, to), dtype=np.int64, count=len(to))))
+        self.mv_id = np.concatenate((self.mv_id, np.array(mv_id, dtype=np.int64)))
+        self.last_id = max(self.last_id, int(self.mv_id.max()))
+
+    def load(self, horizon: datetime, archives: int) -> None:
+        from flask import current_app
+        from .archive import archived_months, iter_month, month_bounds
+
+        self.__init__()
+        rows = []
+        for month in archived_months():
+            if month_bounds(month)[1] <= horizon:
+                continue
+            rows += [
+                (r["item_id"], _epoch(r["timestamp"]), r["from_value"], r["to_value"], r["id"])
+                for r in iter_month(current_app._get_current_object(), month)
+                if r["action"] == "status_change" and r["timestamp"] >= horizon
+            ]
+        rows += self._hot_rows((ItemMovement.timestamp >= horizon,))
+        self._append(rows)
+        self.horizon = _epoch(horizon)
+        self.archives = archives
+
+    def refresh(self) -> None:
+        """Acrescenta os movimentos novos. Relê os últimos REFRESH_OVERLAP ids
+        para pegar transações que gravaram ids menores depois."""
+        rows = self._hot_rows((ItemMovement.id > self.last_id - REFRESH_OVERLAP,))
+        seen = set(self.mv_id[self.mv_id > self.last_id - REFRESH_OVERLAP].tolist())
+        self._append([r for r in rows if r[4] not in seen and r[1] >= self.horizon])
+
+    def trim(self, horizon: float) -> None:
+        """Descarta os movimentos anteriores a `horizon`, que nenhuma janela
+        pedida alcança mais, para as colunas não crescerem sem limite."""
+        if self.horizon is None or horizon - self.horizon < TRIM_STEP:
+            return
+        keep = self.ts >= horizon
+        self.item, self.ts, self.frm, self.to, self.mv_id = (
+            self.item[keep], self.ts[keep], self.frm[keep], self.to[keep], self.mv_id[keep],
+        )
+        self.horizon = horizon
+
+    def window(self, start: float, end: float):
+        mask = (self.ts >= start) & (self.ts <= end)
+        return self.item[mask], self.ts[mask], self.frm[mask], self.to[mask], self.mv_id[mask]
+
+
+_columns: StatusColumns | None = None
+_columns_lock = threading.RLock()
+
+
+def status_columns(start: datetime, end: datetime) -> StatusColumns:
+    """Colunas do processo cobrindo pelo menos desde `start`; recarrega quando
+    um mês é arquivado ou quando a janela pedida é maior que a carregada. A
+    cada atualização corta o que ficou antes da maior janela de
+    UTILIZATION_DAYS (ou de `start`, se for mais antigo)."""
+    global _columns
+    archives = db.session.query(func.count(MovementArchive.month)).scalar()
+    with _columns_lock:
+        if _columns is None:
+            _columns = StatusColumns()
+        if _columns.horizon is None or _columns.horizon > _epoch(start) or _columns.archives != archives:
+            _columns.load(start - timedelta(days=1), archives)
+        else:
+            _columns.refresh()
+            keep_from = min(start, end - timedelta(days=max(UTILIZATION_DAYS)))
+            _columns.trim(_epoch(keep_from - timedelta(days=1)))
+        return _columns
+
+
+def compute_utilization(days: int = 90, now: datetime | None = None) -> dict:
+    """Tempo em cada status por item na janela dos últimos `days` dias, somado
+    por estoque/tipo, com percentual de utilização (tempo locado) e duração
+    média dos períodos completos de cada status (giro).
+
+    Tudo é calculado de uma vez sobre arrays ordenados por (item, data): cada
+    status_change abre um trecho no status `to` que vai até o próximo
+    movimento do mesmo item (ou o fim da janela); antes do primeiro, o item
+    estava no `from` dele; itens sem movimento ficam a janela toda no status
+    atual. Itens cadastrados no meio da janela contam a partir da entrada."""
+    with _columns_lock:
+        return _compute(days, now or datetime.utcnow())
+
+
+def _compute(days: int, end: datetime) -> dict:
+    from .exports import iter_item_rows
+
+    start = end - timedelta(days=days)
+    origin, window = _epoch(start), (end - start).total_seconds()
+    columns = status_columns(start, end)
+
+    rows = list(iter_item_rows((Item.id, Item.origin_stock, Item.item_type, Item.status, Item.entry_date)))
+    n = len(rows)
+    group_codes: dict[tuple, int] = {}
+    ids = np.fromiter((r.id for r in rows), dtype=np.int64, count=n)
+    current = np.fromiter((columns.code(r.status) for r in rows), dtype=np.int64, count=n)
+    group = np.fromiter(
+        (group_codes.setdefault((r.origin_stock, r.item_type), len(group_codes)) for r in rows), dtype=np.int64, count=n,
+    )
+    entry = np.fromiter((_epoch(r.entry_date) if r.entry_date else origin for r in rows), dtype=np.float64, count=n)
+    item_start = np.clip(entry - origin, 0, window)
+
+    mv_item, mv_ts, mv_from, mv_to, mv_id = columns.window(origin, origin + window)
+    idx = np.searchsorted(ids, mv_item)
+    known = idx < n
+    known[known] = ids[idx[known]] == mv_item[known]
+    idx, mv_ts, mv_from, mv_to, mv_id = idx[known], mv_ts[known], mv_from[known], mv_to[known], mv_id[known]
+    order = np.lexsort((mv_id, mv_ts, idx))
+    idx, mv_from, mv_to = idx[order], mv_from[order], mv_to[order]
+    ts = np.maximum(mv_ts[order] - origin, item_start[idx])
+
+    same_next = np.zeros(len(idx), dtype=bool)
+    same_next[:-1] = idx[1:] == idx[:-1]
+    first = np.ones(len(idx), dtype=bool)
+    first[1:] = ~same_next[:-1]
+    seg_end = np.full(len(idx), window)
+    seg_end[:-1][same_next[:-1]] = ts[1:][same_next[:-1]]
+    moved = np.zeros(n, dtype=bool)
+    moved[idx] = True
+    still = np.flatnonzero(~moved)
+
+    seg_item = np.concatenate((idx, idx[first], still))
+    seg_status = np.concatenate((mv_to, mv_from[first], current[still]))
+    seg_seconds = np.maximum(np.concatenate((
+        seg_end - ts,
+        ts[first] - item_start[idx[first]],
+        window - item_start[still],
+    )), 0)
+    complete = np.concatenate((same_next, np.zeros(int(first.sum()) + len(still), dtype=bool)))
+
+    n_status, n_group = len(columns.codes), len(group_codes)
+    per_item = np.bincount(seg_item * n_status + seg_status, weights=seg_seconds, minlength=n * n_status).reshape(n, n_status)
+    per_group = np.zeros((n_group, n_status))
+    np.add.at(per_group, group, per_item)
+    items_per_group = np.bincount(group, minlength=n_group)
+    turn_key = group[seg_item[complete]] * n_status + seg_status[complete]
+    turn_sum = np.bincount(turn_key, weights=seg_seconds[complete], minlength=n_group * n_status).reshape(n_group, n_status)
+    turn_count = np.bincount(turn_key, minlength=n_group * n_status).reshape(n_group, n_status)
+
+    def _breakdown(seconds: np.ndarray) -> dict:
+        total = float(seconds.sum())
+        pct = {s: round(100 * float(seconds[i]) / total, 2) if total else 0.0 for i, s in enumerate(REPORTED_STATUSES)}
+        pct["outros"] = round(100 - sum(pct.values()), 2) if total else 0.0
+        return {
+            "hours": {s: round(float(seconds[i]) / 3600, 1) for i, s in enumerate(REPORTED_STATUSES)},
+            "pct": pct,
+            "utilization": pct["locado"],
+        }
+
+    def _turnaround(sums: np.ndarray, counts: np.ndarray) -> dict:
+        return {
+            s: {"periods": int(counts[i]), "avg_hours": round(float(sums[i]) / int(counts[i]) / 3600, 1) if counts[i] else None}
+            for i, s in enumerate(REPORTED_STATUSES)
+        }
+
+    groups = [
+        {
+            "origin_stock": stock, "item_type": item_type, "items": int(items_per_group[g]),
+            **_breakdown(per_group[g]),
+            "turnaround": _turnaround(turn_sum[g], turn_count[g]),
+        }
+        for (stock, item_type), g in group_codes.items()
+    ]
+    groups.sort(key=lambda g: (g["origin_stock"] or "", g["item_type"] or ""))
+    return {
+        "window": {"from": start.isoformat(), "to": end.isoformat(), "days": days},
+        "fleet": {
+            "items": n, "movements": int(len(idx)),
+            **_breakdown(per_group.sum(axis=0)),
+            "turnaround": _turnaround(turn_sum.sum(axis=0), turn_count.sum(axis=0)),
+        },
+        "groups": groups,
+    }
+
+
+_cache: dict[int, tuple[tuple, dict]] = {}
+_cache_lock = threading.Lock()
+
+
+def _data_version() -> tuple:
+    """Muda quando entram movimentos ou itens novos, quando um mês é arquivado
+    e a cada hora (a janela termina em "agora" e anda mesmo sem movimentos)."""
+    return (
+        datetime.utcnow().strftime("%Y-%m-%d %H"),
+        db.session.query(func.max(ItemMovement.id)).scalar(),
+        db.session.query(func.max(Item.id)).scalar(),
+        db.session.query(func.count(MovementArchive.month)).scalar(),
+    )
+
+
+def get_utilization(days: int = 90) -> dict:
+    """compute_utilization em cache até chegar um movimento novo ou virar a hora."""
+    version = _data_version()
+    with _cache_lock:
+        hit = _cache.get(days)
+    if hit and hit[0] == version:
+        return hit[1]
+    result = compute_utilization(days)
+    result["computed_at"] = datetime.utcnow().isoformat()
+    with _cache_lock:
+        _cache[days] = (version, result)
+    return result
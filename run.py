@@ -1,9 +1,9 @@
 from app import create_app
 
-app = create_app()
+# Os workers do pool de OCR (multiprocessing "spawn") reimportam este arquivo
+# como __mp_main__; só o processo principal monta o app (e o agendador).
+if __name__ != "__mp_main__":
+    app = create_app()
 
 if __name__ == "__main__":
     app.run()
-
-
-
@@ -0,0 +1,196 @@
+"""Benchmark dos endpoints quentes em escala de produção.
+
+Para cada tamanho, semeia uma base nova com o comando `seed_mass`, faz login
+como admin pelo test client do Flask e mede latência (p50/p95) e número de
+comandos SQL por requisição. O resultado vai para um JSON; com --baseline o
+script compara com uma execução anterior e sai com código 1 se houver
+regressão.
+
+Uso:
+    python tools/bench.py --sizes 36000,250000,1000000 --out bench_results.json
+    python tools/bench.py --sizes 36000 --baseline bench_results.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = [
+    ("dashboard_stats", "/admin/api/dashboard-stats", 20),
+    ("items_list", "/items/", 20),
+    ("items_list_filtered", "/items/?status=locado&origin_stock=AL&item_type=cama", 20),
+    ("items_geo", "/items/api/geo", 5),
+    ("autocomplete", "/items/api/autocomplete?q=CAM0", 50),
+    ("ai_solve", "/ai/solve?q=resumo%20do%20estoque", 20),
+    ("export_excel", "/admin/export/excel", 3),
+    ("export_csv", "/items/export?format=csv", 3),
+    ("export_pdf_summary", "/admin/export/pdf", 5),
+]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[k]
+
+
+def run_size(size: int, database_url: str | None, repeat_scale: float) -> dict:
+    """Executa o benchmark de um tamanho no processo atual (modo filho)."""
+    tmpdir = tempfile.mkdtemp(prefix="ghoststock_bench_")
+    os.environ["DATABASE_URL"] = database_url or f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    os.environ.setdefault("ENABLE_TALISMAN", "false")
+    os.environ.setdefault("ENABLE_SCHEDULER", "false")
+    os.environ.setdefault("UPLOAD_FOLDER", os.path.join(tmpdir, "uploads"))
+    os.environ.setdefault("QR_FOLDER", os.path.join(tmpdir, "qrcodes"))
+    sys.path.insert(0, ROOT_DIR)
+
+    from sqlalchemy import event
+    from app import create_app, db
+
+    app = create_app()
+    app.config["WTF_CSRF_ENABLED"] = False
+
+    t0 = time.perf_counter()
+    seeded = app.test_cli_runner().invoke(args=["seed_mass", "--total", str(size), "--reset"])
+    if seeded.exit_code != 0:
+        raise RuntimeError(f"seed_mass falhou: {seeded.output}")
+    seed_seconds = time.perf_counter() - t0
+
+    statements = {"n": 0}
+
+    def _count(*_args, **_kwargs):
+        statements["n"] += 1
+
+    with app.app_context():
+        engine = db.engine
+        dialect = engine.dialect.name
+    event.listen(engine, "before_cursor_execute", _count)
+
+    client = app.test_client()
+    resp = client.post("/auth/login", data={"email": "admin@ghoststock.local", "password": "Admin123!"})
+    if resp.status_code != 302:
+        raise RuntimeError(f"login falhou: HTTP {resp.status_code}")
+
+    results: dict[str, dict] = {}
+    for name, path, repeat in ENDPOINTS:
+        runs = max(1, int(repeat * repeat_scale))
+        timings: list[float] = []
+        counts: list[int] = []
+        status = None
+        for _ in range(runs):
+            statements["n"] = 0
+            t = time.perf_counter()
+            resp = client.get(path)
+            _ = resp.get_data()
+            timings.append((time.perf_counter() - t) * 1000.0)
+            counts.append(statements["n"])
+            status = resp.status_code
+            resp.close()
+        results[name] = {
+            "path": path,
+            "runs": runs,
+            "status": status,
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+            "mean_ms": round(sum(timings) / len(timings), 3),
+            "statements": max(counts),
+        }
+    event.remove(engine, "before_cursor_execute", _count)
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    return {"size": size, "dialect": dialect, "seed_seconds": round(seed_seconds, 2), "endpoints": results}
+
+
+def compare(current: dict, baseline: dict, tolerance: float, min_delta_ms: float = 5.0) -> list[str]:
+    regressions = []
+    for size, data in current["results"].items():
+        base = baseline.get("results", {}).get(size)
+        if not base:
+            continue
+        for name, cur in data["endpoints"].items():
+            old = base["endpoints"].get(name)
+            if not old:
+                continue
+            slower = cur["p95_ms"] - old["p95_ms"]
+            if slower > min_delta_ms and cur["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{size} {name}: p95 {old['p95_ms']}ms -> {cur['p95_ms']}ms")
+            if cur["statements"] > old["statements"]:
+                regressions.append(f"{size} {name}: SQL {old['statements']} -> {cur['statements']}")
+            if cur["status"] != old["status"]:
+                regressions.append(f"{size} {name}: HTTP {old['status']} -> {cur['status']}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="36000,250000,1000000", help="Tamanhos de base separados por vírgula")
+    parser.add_argument("--out", default="bench_results.json", help="Arquivo JSON de saída")
+    parser.add_argument("--database-url", default=None,
+                        help="Base a usar (será RECRIADA). Padrão: SQLite temporário por tamanho")
+    parser.add_argument("--repeat-scale", type=float, default=1.0, help="Multiplicador das repetições por endpoint")
+    parser.add_argument("--baseline", default=None, help="JSON anterior para detectar regressões")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Folga aceita no p95 (0.25 = +25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0,
+                        help="Diferença mínima de p95 (ms) para contar como regressão")
+    parser.add_argument("--child", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        json.dump(run_size(args.child, args.database_url, args.repeat_scale), sys.stdout)
+        return 0
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    report = {
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": {},
+    }
+    for size in sizes:
+        print(f"Semeando e medindo {size} itens...", file=sys.stderr)
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", str(size),
+               "--repeat-scale", str(args.repeat_scale)]
+        if args.database_url:
+            cmd += ["--database-url", args.database_url]
+        proc = subprocess.run(cmd, capture_output=True, text=True, cwd=ROOT_DIR)
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            return proc.returncode
+        data = json.loads(proc.stdout.strip().splitlines()[-1])
+        report["results"][str(size)] = data
+        for name, r in data["endpoints"].items():
+            print(f"  {name:<22} p50={r['p50_ms']:>9.2f}ms p95={r['p95_ms']:>9.2f}ms "
+                  f"sql={r['statements']:<4} http={r['status']}", file=sys.stderr)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"OK - resultados em {args.out}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"REGRESSÃO {line}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())